@@ -2,8 +2,8 @@ import os
 import shutil
 import argparse
 import zipfile
-import urllib.request
 from biometric_vqa.utils.preprocess_utils import process_dataset, move_folder
+from biometric_vqa.utils.download_utils import download_file
 
 
 # ====================================
@@ -29,7 +29,7 @@ def download_and_extract(dataset_dir, dataset_name):
     # ====================================
     # Download dataset using pure Python
     print("Downloading ACDC.zip...")
-    urllib.request.urlretrieve(
+    download_file(
         "https://humanheart-project.creatis.insa-lyon.fr/database/api/v1/collection/637218c173e9f0047faa00fb/download",
         "ACDC.zip",
     )
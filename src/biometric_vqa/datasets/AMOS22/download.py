@@ -1,10 +1,10 @@
 import os
 import shutil
 import argparse
-import glob
-import zipfile
-import urllib.request
+import fnmatch
 from biometric_vqa.utils.preprocess_utils import move_folder
+from biometric_vqa.utils.download_utils import download_file
+from biometric_vqa.utils.archive_utils import extract_selected
 
 # ====================================
 # Dataset Info [!]
@@ -30,45 +30,34 @@ def download_and_extract(dataset_dir, dataset_name):
     # ====================================
     # Download dataset
     print("Downloading amos22.zip...")
-    urllib.request.urlretrieve(
+    download_file(
         "https://zenodo.org/records/7155725/files/amos22.zip?download=1", "amos22.zip"
     )
 
-    # Extract zip
-    print("Extracting amos22.zip...")
-    with zipfile.ZipFile("amos22.zip", "r") as zip_ref:
-        zip_ref.extractall()
-
-    # Move contents
-    for item in os.listdir("amos22"):
-        shutil.move(os.path.join("amos22", item), ".")
-
     # Create directories
     for modality in ["CT", "MRI"]:
         for subdir in ["Images", "Masks"]:
             os.makedirs(os.path.join(f"AMOS22-{modality}", subdir), exist_ok=True)
 
-    # Move image files
-    for folder in ["imagesTr", "imagesVa"]:
-        if os.path.exists(folder):
-            for f in glob.glob(os.path.join(folder, "amos_????.nii.gz")):
-                # Extract the number from filename
-                num = int(os.path.basename(f)[5:9])
-                if num < 507:
-                    shutil.move(f, os.path.join("AMOS22-CT", "Images"))
-                else:
-                    shutil.move(f, os.path.join("AMOS22-MRI", "Images"))
-
-    # Move mask files
-    for folder in ["labelsTr", "labelsVa"]:
-        if os.path.exists(folder):
-            for f in glob.glob(os.path.join(folder, "amos_????.nii.gz")):
-                # Extract the number from filename
-                num = int(os.path.basename(f)[5:9])
-                if num < 507:
-                    shutil.move(f, os.path.join("AMOS22-CT", "Masks"))
-                else:
-                    shutil.move(f, os.path.join("AMOS22-MRI", "Masks"))
+    # Select train/validation images and masks, split by modality
+    def select(name):
+        parts = name.split("/")
+        if len(parts) != 3 or not fnmatch.fnmatch(parts[2], "amos_????.nii.gz"):
+            return None
+        if parts[1] in ["imagesTr", "imagesVa"]:
+            subdir = "Images"
+        elif parts[1] in ["labelsTr", "labelsVa"]:
+            subdir = "Masks"
+        else:
+            return None
+        # Extract the number from filename
+        num = int(parts[2][5:9])
+        modality = "CT" if num < 507 else "MRI"
+        return os.path.join(f"AMOS22-{modality}", subdir, parts[2])
+
+    # Extract zip straight into AMOS22-CT / AMOS22-MRI
+    print("Extracting amos22.zip...")
+    extract_selected("amos22.zip", select)
 
     # Move folder to dataset_dir
     folders_to_move = [
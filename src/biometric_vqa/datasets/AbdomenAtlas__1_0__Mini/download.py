@@ -3,10 +3,8 @@ import shutil
 import argparse
 import glob
 from huggingface_hub import snapshot_download
-import nibabel as nib
 from biometric_vqa.utils.preprocess_utils import move_folder
-from biometric_vqa.utils.data_conversion import convert_mask_to_uint16_per_dir
-from biometric_vqa.datasets.AbdomenAtlas__1_0__Mini.preprocess_segmentation import benchmark_plan as AbdomenAtlas1_0_Mini_benchmark_plan
+from biometric_vqa.utils.data_conversion import transplant_image_headers_to_masks
 
 
 # ====================================
@@ -19,21 +17,6 @@ from biometric_vqa.datasets.AbdomenAtlas__1_0__Mini.preprocess_segmentation impo
 # ====================================
 
 
-def convert_masks_to_uint16(dataset_dir):
-    mask_folders = _get_mask_folders(AbdomenAtlas1_0_Mini_benchmark_plan)
-    for folder in mask_folders:
-        mask_folder = os.path.join(dataset_dir, folder)
-        convert_mask_to_uint16_per_dir(mask_folder)
-    
-
-def _get_mask_folders(bm_plan):
-    """Get unique mask folders from tasks"""
-    mask_folders = []
-    for task in bm_plan["tasks"]:
-        mask_folders.append(task["mask_folder"])
-    return list(set(mask_folders))
-
-
 def download_and_extract(dataset_dir, dataset_name):
     # Download files
     current_dir = os.getcwd()
@@ -74,25 +57,11 @@ def download_and_extract(dataset_dir, dataset_name):
             if os.path.exists(mask_src):
                 shutil.move(mask_src, os.path.join("Masks", f"{case_name}.nii.gz"))
 
-    # Copy Nifit header of images to masks
+    # Copy Nifti header of images to masks and convert masks to uint16 (one parallel pass)
     print("Copying Nifti headers from images to masks...")
-    nifti_files = list(glob.glob(os.path.join("Images", "*.nii.gz")))
-    total_files = len(nifti_files)
-    for idx, img_file in enumerate(nifti_files, 1):
-        base_name = os.path.basename(img_file)
-        mask_file = os.path.join("Masks", base_name)
-        if os.path.exists(mask_file):
-            print(f"[{idx}/{total_files}] Processing file: {base_name}")
-            img = nib.load(img_file)
-            mask = nib.load(mask_file)
-            new_mask = nib.Nifti1Image(mask.get_fdata(), img.affine, img.header)
-            nib.save(new_mask, mask_file)
+    transplant_image_headers_to_masks("Images", "Masks")
     print("Finished updating Nifti headers for mask files")
 
-    # NOTE: 
-    # Convert masks to uint16
-    convert_masks_to_uint16(tmp_dir)
-
     # Move folder to dataset_dir
     folders_to_move = [
         "Images",
@@ -2,9 +2,9 @@ import os
 import shutil
 import argparse
 import zipfile
-import urllib.request
 import py7zr
 from biometric_vqa.utils.preprocess_utils import match_and_clean_files, move_folder
+from biometric_vqa.utils.download_utils import download_files
 
 
 # ====================================
@@ -42,10 +42,9 @@ def download_and_extract(dataset_dir, dataset_name):
         "AbdomenCT-1K-ImagePart3.zip",
         "Mask.7z",
     ]
-    # Download files using urllib
-    for url, filename in zip(urls, filenames):
-        print(f"Downloading {filename}...")
-        urllib.request.urlretrieve(url, filename)
+    # Download files concurrently
+    print(f"Downloading {', '.join(filenames)}...")
+    download_files(list(zip(urls, filenames)))
     # Extract zip archives
     for filename in filenames[:3]:
         print(f"Extracting {filename}...")
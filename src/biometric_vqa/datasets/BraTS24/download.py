@@ -2,10 +2,9 @@ import os
 import shutil
 import argparse
 import glob
-import zipfile
-import rarfile
 import synapseclient
-from biometric_vqa.utils.preprocess_utils import process_dataset_mm, move_folder
+from biometric_vqa.utils.preprocess_utils import move_folder
+from biometric_vqa.utils.archive_utils import extract_archives, extract_selected, list_members
 
 
 # ====================================
@@ -27,6 +26,39 @@ from biometric_vqa.utils.preprocess_utils import process_dataset_mm, move_folder
 # ====================================
 
 
+def _select_brats_members(archive_path, seg_suffix, modalities, data_dirs=None, exclude_dirs=()):
+    """
+    Member selector following process_dataset_mm: segmentations go to Masks/ and the modality images of
+    the same case go to Images-<modality>/, only for cases that have a segmentation.
+    data_dirs / exclude_dirs restrict the folders inside the archive that are used.
+    """
+    sep = "_" if "_" in seg_suffix else "-"
+
+    def in_data_dirs(name):
+        if any(name.startswith(f"{d}/") for d in exclude_dirs):
+            return False
+        return data_dirs is None or any(name.startswith(f"{d}/") for d in data_dirs)
+
+    seg_cases = {
+        name[: -len(seg_suffix)]
+        for name in list_members(archive_path)
+        if name.endswith(seg_suffix) and in_data_dirs(name)
+    }
+
+    def select(name):
+        if not in_data_dirs(name):
+            return None
+        if name.endswith(seg_suffix):
+            return os.path.join("Masks", os.path.basename(name))
+        for modality in modalities:
+            suffix = f"{sep}{modality}.nii.gz"
+            if name.endswith(suffix) and name[: -len(suffix)] in seg_cases:
+                return os.path.join(f"Images-{modality}", os.path.basename(name))
+        return None
+
+    return select
+
+
 def download_and_extract(dataset_dir, dataset_name):
     # Download files
     current_dir = os.getcwd()
@@ -49,26 +81,31 @@ def download_and_extract(dataset_dir, dataset_name):
     # Process GLI dataset
     print("Downloading BraTS24-GLI dataset...")
     os.makedirs("BraTS24-GLI", exist_ok=True)
+    archives = []
     for id in ["syn64314352", "syn60086071"]:
         file = syn.get(id, downloadLocation="BraTS24-GLI")
         print(f" - Downloaded: {file.path}")
-        with zipfile.ZipFile(file.path, "r") as zip_ref:
-            zip_ref.extractall("BraTS24-GLI")
+        archives.append(os.path.abspath(file.path))
     os.chdir("BraTS24-GLI")
     os.makedirs("Masks", exist_ok=True)
     for mod in ["t1c", "t1n", "t2f", "t2w"]:
         os.makedirs(f"Images-{mod}", exist_ok=True)
-    # Process GLI files
-    process_dataset_mm(
-        ["training_data1_v2", "training_data_additional"],
-        "*-seg.nii.gz",
-        ["t1c", "t1n", "t2f", "t2w"],
-        "-seg.nii.gz",
+    # Extract GLI files straight into Masks / Images-*
+    extract_archives(
+        [
+            (
+                archive,
+                _select_brats_members(
+                    archive,
+                    "-seg.nii.gz",
+                    ["t1c", "t1n", "t2f", "t2w"],
+                    data_dirs=["training_data1_v2", "training_data_additional"],
+                ),
+            )
+            for archive in archives
+        ]
     )
     # Cleanup GLI
-    for folder in ["training_data1_v2", "training_data_additional"]:
-        if os.path.exists(folder):
-            shutil.rmtree(folder)
     for ext in ["tsv", "bib", "xlsx", "zip"]:
         for f in glob.glob(f"*.{ext}"):
             os.remove(f)
@@ -77,24 +114,27 @@ def download_and_extract(dataset_dir, dataset_name):
     # Process MEN-RT dataset
     print("Downloading BraTS24-MEN-RT dataset...")
     os.makedirs("BraTS24-MEN-RT", exist_ok=True)
+    archives = []
     for id in ["syn60085033"]:
         file = syn.get(id, downloadLocation="BraTS24-MEN-RT")
         print(f" - Downloaded: {file.path}")
-        with zipfile.ZipFile(file.path, "r") as zip_ref:
-            zip_ref.extractall("BraTS24-MEN-RT")
+        archives.append(os.path.abspath(file.path))
     os.chdir("BraTS24-MEN-RT")
     os.makedirs("Masks", exist_ok=True)
     os.makedirs("Images-t1c", exist_ok=True)
-    # Process MEN-RT files
-    process_dataset_mm(
-        ["BraTS-MEN-RT-Train-v2"],
-        "*_gtv.nii.gz",
-        ["t1c"],
-        "_gtv.nii.gz",
+    # Extract MEN-RT files straight into Masks / Images-t1c
+    extract_archives(
+        [
+            (
+                archive,
+                _select_brats_members(
+                    archive, "_gtv.nii.gz", ["t1c"], data_dirs=["BraTS-MEN-RT-Train-v2"]
+                ),
+            )
+            for archive in archives
+        ]
     )
     # Cleanup MEN-RT
-    if os.path.exists("BraTS-MEN-RT-Train-v2"):
-        shutil.rmtree("BraTS-MEN-RT-Train-v2")
     for ext in ["tsv", "bib", "zip"]:
         for f in glob.glob(f"*.{ext}"):
             os.remove(f)
@@ -106,61 +146,43 @@ def download_and_extract(dataset_dir, dataset_name):
     for id in ["syn59407686", "syn59860022", "syn61596964"]:
         file = syn.get(id, downloadLocation="BraTS24-MET")
         print(f" - Downloaded: {file.path}")
-    with zipfile.ZipFile(
-        os.path.join(
-            "BraTS24-MET", "MICCAI-BraTS2024-MET-Challenge-TrainingData_1.zip"
-        ),
-        "r",
-    ) as zip_ref:
-        zip_ref.extractall("BraTS24-MET")
-    with zipfile.ZipFile(
-        os.path.join(
-            "BraTS24-MET", "MICCAI-BraTS2024-MET-Challenge-TrainingData_2.zip"
-        ),
-        "r",
-    ) as zip_ref:
-        zip_ref.extractall(
-            os.path.join("BraTS24-MET", "MICCAI-BraTS2024-MET-Challenge-TrainingData_2")
-        )
-    with zipfile.ZipFile(
-        os.path.join(
-            "BraTS24-MET",
-            "MICCAI-BraTS2024-MET-Challenge-TrainingData_2-fixed-cases.zip",
-        ),
-        "r",
-    ) as zip_ref:
-        zip_ref.extractall("BraTS24-MET")
     syn.get("syn61929632", downloadLocation="BraTS24-MET")
-    rar_path = os.path.join("BraTS24-MET", "BraTS-MET-00232-000.rar")
-    extract_dir = os.path.join(
-        "BraTS24-MET", "MICCAI-BraTS2024-MET-Challenge-TrainingData_2-fixed-cases"
-    )
-    os.makedirs(extract_dir, exist_ok=True)
-    with rarfile.RarFile(rar_path) as rf:
-        rf.extractall(path=extract_dir)
     os.chdir("BraTS24-MET")
     # Create directories
     os.makedirs("Masks", exist_ok=True)
     for mod in ["t1c", "t1n", "t2f", "t2w"]:
         os.makedirs(f"Images-{mod}", exist_ok=True)
-    # Process main training datasets
-    process_dataset_mm(
+    modalities = ["t1c", "t1n", "t2f", "t2w"]
+    # Extract main training datasets
+    training_1 = "MICCAI-BraTS2024-MET-Challenge-TrainingData_1.zip"
+    training_2 = "MICCAI-BraTS2024-MET-Challenge-TrainingData_2.zip"
+    extract_archives(
         [
-            "MICCAI-BraTS2024-MET-Challenge-Training_1",
-            "MICCAI-BraTS2024-MET-Challenge-TrainingData_2",
-        ],
-        "*-seg.nii.gz",
-        ["t1c", "t1n", "t2f", "t2w"],
-        "-seg.nii.gz",
+            (
+                training_1,
+                _select_brats_members(
+                    training_1,
+                    "-seg.nii.gz",
+                    modalities,
+                    data_dirs=["MICCAI-BraTS2024-MET-Challenge-Training_1"],
+                ),
+            ),
+            (training_2, _select_brats_members(training_2, "-seg.nii.gz", modalities)),
+        ]
     )
-    # Process fixed cases with force overwrite
-    process_dataset_mm(
-        ["MICCAI-BraTS2024-MET-Challenge-TrainingData_2-fixed-cases"],
-        "*-seg.nii.gz",
-        ["t1c", "t1n", "t2f", "t2w"],
-        "-seg.nii.gz",
-        replace=True,  # Enable force overwrite
+    # Extract fixed cases afterwards so they overwrite the originals (the rar last)
+    fixed_cases = "MICCAI-BraTS2024-MET-Challenge-TrainingData_2-fixed-cases.zip"
+    extract_selected(
+        fixed_cases,
+        _select_brats_members(
+            fixed_cases,
+            "-seg.nii.gz",
+            modalities,
+            data_dirs=["MICCAI-BraTS2024-MET-Challenge-TrainingData_2-fixed-cases"],
+        ),
     )
+    rar_path = "BraTS-MET-00232-000.rar"
+    extract_selected(rar_path, _select_brats_members(rar_path, "-seg.nii.gz", modalities))
     # Delete cases where the NIfTI image and mask headers don't match
     cases_to_remove = ["BraTS-MET-00232-000"]
     for case in cases_to_remove:
@@ -174,13 +196,6 @@ def download_and_extract(dataset_dir, dataset_name):
             if os.path.exists(mask_path):
                 os.remove(mask_path)
     # Cleanup
-    for folder in [
-        "MICCAI-BraTS2024-MET-Challenge-TrainingData_2-fixed-cases",
-        "MICCAI-BraTS2024-MET-Challenge-Training_1",
-        "MICCAI-BraTS2024-MET-Challenge-TrainingData_2",
-    ]:
-        if os.path.exists(folder):
-            shutil.rmtree(folder)
     for ext in ["tsv", "bib", "zip", "rar"]:
         for f in glob.glob(f"*.{ext}"):
             os.remove(f)
@@ -189,36 +204,33 @@ def download_and_extract(dataset_dir, dataset_name):
     # Process PED dataset
     os.makedirs("BraTS24-PED", exist_ok=True)
     # Download training data
+    archives = []
     for id in ["syn58894928", "syn60140557"]:
         file = syn.get(id, downloadLocation="BraTS24-PED")
         print(f" - Downloaded: {file.path}")
-        with zipfile.ZipFile(file.path, "r") as zip_ref:
-            zip_ref.extractall("BraTS24-PED")
+        archives.append(os.path.abspath(file.path))
     os.chdir("BraTS24-PED")
-    # Fix broken case
-    if os.path.exists(os.path.join("BraTS-PEDs2024_Training", "BraTS-PED-00255-000")):
-        shutil.rmtree(os.path.join("BraTS-PEDs2024_Training", "BraTS-PED-00255-000"))
-    shutil.move("BraTS-PED-00255-000", "BraTS-PEDs2024_Training")
     # Create directories
     os.makedirs("Masks", exist_ok=True)
     for mod in ["t1c", "t1n", "t2f", "t2w"]:
         os.makedirs(f"Images-{mod}", exist_ok=True)
-    # Process training data
-    process_dataset_mm(
-        ["BraTS-PEDs2024_Training"],
-        "*-seg.nii.gz",
-        ["t1c", "t1n", "t2f", "t2w"],
-        "-seg.nii.gz",
+    # Extract training data, taking the broken case from its fixed top-level copy
+    extract_archives(
+        [
+            (
+                archive,
+                _select_brats_members(
+                    archive,
+                    "-seg.nii.gz",
+                    ["t1c", "t1n", "t2f", "t2w"],
+                    data_dirs=["BraTS-PEDs2024_Training", "BraTS-PED-00255-000"],
+                    exclude_dirs=["BraTS-PEDs2024_Training/BraTS-PED-00255-000"],
+                ),
+            )
+            for archive in archives
+        ]
     )
-    # Remove any hidden files
-    for hidden_file in glob.glob(
-        os.path.join("BraTS24-PED", "**", "._*.nii.gz"), recursive=True
-    ):
-        os.remove(hidden_file)
     # Cleanup
-    for folder in ["BraTS-PEDs2024_Training", "__MACOSX"]:
-        if os.path.exists(folder):
-            shutil.rmtree(folder)
     for ext in ["tsv", "bib", "zip"]:
         for f in glob.glob(f"*.{ext}"):
             os.remove(f)
@@ -1,9 +1,9 @@
 import os
 import zipfile
-import urllib.request
 import shutil
 import argparse
 from biometric_vqa.utils.preprocess_utils import process_dataset, move_folder
+from biometric_vqa.utils.download_utils import download_file
 
 
 # ====================================
@@ -29,7 +29,7 @@ def download_and_extract(dataset_dir, dataset_name):
     # Add download logic here [!]
     # ====================================
     # Download dataset
-    urllib.request.urlretrieve(
+    download_file(
         "https://humanheart-project.creatis.insa-lyon.fr/database/api/v1/collection/6373703d73e9f0047faa1bc8/download",
         "CAMUS.zip",
     )
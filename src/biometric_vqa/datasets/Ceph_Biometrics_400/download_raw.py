@@ -5,12 +5,12 @@ import json
 import rarfile
 import zipfile
 import gzip
-import urllib.request
 import argparse
 import nibabel as nib
 import matplotlib.pyplot as plt
 from biometric_vqa.utils.data_conversion import convert_bmp_to_niigz
 from biometric_vqa.utils.preprocess_utils import move_folder
+from biometric_vqa.utils.download_utils import download_file
 
 
 # ====================================
@@ -222,11 +222,11 @@ def download_and_extract(dataset_dir, dataset_name):
     # ====================================
     # Add download logic here [!]
     # ====================================
-    # Download the file using urllib
+    # Download the file (resumable)
     url = "https://figshare.com/ndownloader/articles/3471833?private_link=37ec464af8e81ae6ebbf"
     output_file = "Cephalogram400.zip"
     print(f"Downloading file from {url}...")
-    urllib.request.urlretrieve(url, output_file)
+    download_file(url, output_file)
 
     # Extract the ZIP file
     print("Extracting ZIP file...")
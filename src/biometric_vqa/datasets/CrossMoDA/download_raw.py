@@ -1,10 +1,9 @@
 import os
 import shutil
-import glob
 import argparse
-import zipfile
-import urllib.request
-from biometric_vqa.utils.preprocess_utils import process_dataset, move_folder
+from biometric_vqa.utils.preprocess_utils import move_folder
+from biometric_vqa.utils.download_utils import download_file
+from biometric_vqa.utils.archive_utils import extract_selected, match_members
 
 
 # ====================================
@@ -32,26 +31,20 @@ def download_and_extract(dataset_dir, dataset_name):
     # Download dataset from Zenodo
     url = "https://zenodo.org/records/4662239/files/crossmoda_training.zip?download=1"
     print(f"Downloading from {url}...")
-    urllib.request.urlretrieve(url, "crossmoda_training.zip")
-
-    # Extract downloaded zip file
-    print("Extracting zip file...")
-    with zipfile.ZipFile("crossmoda_training.zip", "r") as zip_ref:
-        zip_ref.extractall("crossmoda_training")
+    download_file(url, "crossmoda_training.zip")
 
     os.makedirs("Images", exist_ok=True)
     os.makedirs("Masks", exist_ok=True)
-    # Move ceT1 files to Images folder
-    for file in glob.glob(
-        os.path.join("crossmoda_training", "source_training", "*_ceT1.nii.gz")
-    ):
-        shutil.move(file, os.path.join("Images", os.path.basename(file)))
 
-    # Move Label files to Masks folder
-    for file in glob.glob(
-        os.path.join("crossmoda_training", "source_training", "*_Label.nii.gz")
-    ):
-        shutil.move(file, os.path.join("Masks", os.path.basename(file)))
+    # Extract ceT1 files to Images folder and Label files to Masks folder
+    print("Extracting zip file...")
+    select = match_members(
+        [
+            ("source_training/*_ceT1.nii.gz", "Images"),
+            ("source_training/*_Label.nii.gz", "Masks"),
+        ]
+    )
+    extract_selected("crossmoda_training.zip", select)
 
     # Move folder to dataset_dir
     folders_to_move = [
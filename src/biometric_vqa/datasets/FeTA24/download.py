@@ -8,9 +8,11 @@ import zipfile
 import gzip
 import nibabel as nib
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import SimpleITK as sitk
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from biometric_vqa.utils.preprocess_utils import process_dataset, move_folder
 
 
@@ -49,15 +51,49 @@ LABELS_NAME = {
 }
 
 
-def im_original_to_realigned(feta_dir, biometry_dir, out_dir, seg=False):
+def _set_sitk_threads(num_threads):
+    """Worker initializer: limit SimpleITK's internal multi-threading"""
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(num_threads)
+
+
+def _realign_subject(sub_path_feta, sub_path_bio, out_sub_dir, suffixes):
+    """
+    Resample the images of one subject (T2w and/or segmentation) into the realigned space.
+    The transform is read once and shared by all images of the subject.
+    Returns the number of files saved.
+    """
+    trf = sitk.ReadTransform(get_file(sub_path_bio, suffix=".txt"))
+    os.makedirs(out_sub_dir, exist_ok=True)
+
+    files_saved = 0
+    for suffix in suffixes:
+        imp = get_file(sub_path_feta, suffix=suffix)
+        im = sitk.ReadImage(imp)
+
+        # Choose interpolation method based on image type
+        interMethod = sitk.sitkNearestNeighbor if suffix == "dseg.nii.gz" else sitk.sitkLinear
+
+        # Apply transformation and save
+        im = sitk.Resample(im, im, trf, interMethod)
+        sitk.WriteImage(im, os.path.join(out_sub_dir, os.path.basename(imp)))
+        files_saved += 1
+    return files_saved
+
+
+def im_original_to_realigned(feta_dir, biometry_dir, out_dir, seg=False, image=None, num_workers=None):
     """
     Transform images from original space to realigned space.
+    Subjects are resampled in parallel processes; SimpleITK's own thread count is divided among
+    the workers so that the machine is not oversubscribed.
 
     Args:
         feta_dir (str): Path to the original FeTA images directory
         biometry_dir (str): Path to the biometric measurements directory
         out_dir (str): Path to the output directory
         seg (bool): If True, process segmentations instead of T2w images
+        image (bool): If True, also process T2w images together with the segmentations (one read of
+            each transform); default: T2w images only if seg is False
+        num_workers (int): Number of parallel processes (default: number of CPUs)
     """
     # Convert paths to absolute paths
     feta_dir = os.path.abspath(feta_dir)
@@ -73,41 +109,35 @@ def im_original_to_realigned(feta_dir, biometry_dir, out_dir, seg=False):
     # Create output directory
     os.makedirs(out_dir, exist_ok=True)
 
+    # Determine file suffixes based on processing mode
+    if image is None:
+        image = not seg
+    suffixes = (["T2w.nii.gz"] if image else []) + (["dseg.nii.gz"] if seg else [])
+
     # Get list of subjects (removing 'sub-' prefix)
     sub_list = sorted([f[4:] for f in os.listdir(feta_dir) if "sub" in f])
 
-    # Initialize counter for saved files
-    files_saved = 0
-
-    # Process each subject
+    # Skip subjects without biometry data
+    jobs = []
     for sub in sub_list:
-        # Construct paths for current subject using os.path.join for cross-platform compatibility
         sub_path_feta = os.path.join(feta_dir, f"sub-{sub}", "anat")
         sub_path_bio = os.path.join(biometry_dir, f"sub-{sub}", "anat")
+        if os.path.exists(sub_path_bio):
+            jobs.append((sub_path_feta, sub_path_bio, os.path.join(out_dir, f"sub-{sub}", "anat"), suffixes))
 
-        # Skip if no biometry data exists
-        if not os.path.exists(sub_path_bio):
-            continue
-
-        # Determine file suffix based on processing mode
-        suffix = "dseg.nii.gz" if seg else "T2w.nii.gz"
-
-        # Read input image and transformation
-        imp = get_file(sub_path_feta, suffix=suffix)
-        im = sitk.ReadImage(imp)
-        trf = sitk.ReadTransform(get_file(sub_path_bio, suffix=".txt"))
-
-        # Set up output path
-        out_path = os.path.join(out_dir, f"sub-{sub}", "anat", os.path.basename(imp))
-        os.makedirs(os.path.dirname(out_path), exist_ok=True)
-
-        # Choose interpolation method based on image type
-        interMethod = sitk.sitkNearestNeighbor if seg else sitk.sitkLinear
-
-        # Apply transformation and save
-        im = sitk.Resample(im, im, trf, interMethod)
-        sitk.WriteImage(im, out_path)
-        files_saved += 1
+    # Initialize counter for saved files
+    files_saved = 0
+    if jobs and suffixes:
+        cpu_count = os.cpu_count() or 1
+        num_workers = max(1, min(num_workers or cpu_count, len(jobs)))
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_set_sitk_threads,
+            initargs=(max(1, cpu_count // num_workers),),
+        ) as executor:
+            futures = [executor.submit(_realign_subject, *job) for job in jobs]
+            for future in as_completed(futures):
+                files_saved += future.result()
 
     print(f"-- Total files saved: {files_saved}")
 
@@ -119,6 +149,156 @@ def get_file(folder, suffix):
     return None
 
 
+def _plot_landmarks(img_data, points, point_names, slice_dim, coord, save_path):
+    """Helper function to plot landmarks on image slices."""
+    # Object-oriented API (no pyplot state), so figures can be rendered in worker processes
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    # Handle different slice orientations
+    if slice_dim == 0:  # Sagittal
+        ax.imshow(img_data[coord, :, :].T, cmap="gray", origin="lower")
+        x_coords, y_coords = points[:, 1], points[:, 2]
+        ax.set_xlabel("Anterior →", fontsize=14)
+        ax.set_ylabel("Superior →", fontsize=14)
+    elif slice_dim == 1:  # Coronal
+        ax.imshow(img_data[:, coord, :].T, cmap="gray", origin="lower")
+        x_coords, y_coords = points[:, 0], points[:, 2]
+        ax.set_xlabel("Right →", fontsize=14)
+        ax.set_ylabel("Superior →", fontsize=14)
+    else:  # Axial
+        ax.imshow(img_data[:, :, coord].T, cmap="gray", origin="lower")
+        x_coords, y_coords = points[:, 0], points[:, 1]
+        ax.set_xlabel("Right →", fontsize=14)
+        ax.set_ylabel("Anterior →", fontsize=14)
+
+    # Plot points and labels
+    for i, (x, y) in enumerate(zip(x_coords, y_coords)):
+        ax.scatter(
+            [x],
+            [y],
+            facecolors="#18A727",
+            edgecolors="black",
+            marker="o",
+            s=80,
+            linewidth=1.5,
+            label=point_names[i],
+        )
+        ax.annotate(
+            point_names[i],
+            (x, y),
+            xytext=(2, 2),
+            textcoords="offset points",
+            color="#FE9100",
+            fontsize=14,
+        )
+
+    ax.margins(0)
+    fig.savefig(save_path)
+
+
+def _plot_subject_landmarks(img_file, figure_jobs):
+    """Render all landmark figures of one subject, loading its T2w volume once."""
+    img_data = np.asanyarray(nib.load(img_file).dataobj)
+    for points, point_names, slice_dim, coord, save_path in figure_jobs:
+        _plot_landmarks(img_data, points, point_names, slice_dim, coord, save_path)
+    return img_file
+
+
+def _extract_landmark_points(nii_file, landmark_json_dir, img_dir, fig_dir, slice_dim_map, labels_name):
+    """
+    Extract the landmark coordinates of one subject and save them to JSON.
+    Returns (T2w image file, figure jobs) for _plot_subject_landmarks.
+    """
+    nii_path = Path(nii_file)
+    # Measurement volume in its stored (integer) dtype
+    data = np.asanyarray(nib.load(str(nii_path)).dataobj)
+    img_file = os.path.join(img_dir, nii_path.name.replace("meas.nii.gz", "T2w.nii.gz"))
+
+    # This data structure is designed to be compatible with biometric data constructed from segmentation masks
+    json_dict = {
+        "slice_landmarks_x": [],
+        "slice_landmarks_y": [],
+        "slice_landmarks_z": [],
+    }
+    figure_jobs = []
+
+    # Find all labeled voxels in a single pass, then group them by label
+    coords = np.nonzero(data)
+    all_points = np.stack(coords, axis=1)
+    point_labels = data[coords]
+
+    # Process each label
+    for label in range(1, 6):
+        # Get coordinates
+        points = all_points[point_labels == label]
+
+        if len(points) != 2:
+            raise ValueError(f"Label {label} has {len(points)} points, expected 2")
+
+        # Determine point indices and names based on label
+        subfolder = os.path.join(fig_dir, labels_name[str(label)])
+        os.makedirs(subfolder, exist_ok=True)
+
+        # Determine point order based on anatomical measurement type
+        if label == 1:  # Corpus Callosum Length
+            idx_larger = np.argmax(points[:, 1])  # More anterior point
+            point_names = ["P1", "P2"]
+        elif label == 2:  # Vermis Height
+            idx_larger = np.argmax(points[:, 2])  # Superior point
+            point_names = ["P3", "P4"]
+        elif label == 3:  # Brain Biparietal Diameter
+            idx_larger = np.argmax(points[:, 0])  # Right point
+            point_names = ["P5", "P6"]
+        elif label == 4:  # Skull Biparietal Diameter
+            idx_larger = np.argmax(points[:, 0])  # Right point
+            point_names = ["P7", "P8"]
+        else:  # Transverse Cerebellar Diameter
+            idx_larger = np.argmax(points[:, 0])  # Right point
+            point_names = ["P9", "P10"]
+
+        idx_smaller = 1 - idx_larger
+        sorted_points = points[[idx_larger, idx_smaller]]
+
+        # Save landmark coordinates
+        slice_dim = slice_dim_map[point_names[0]]
+        if slice_dim == 0:
+            json_dict_key = "slice_landmarks_x"
+        elif slice_dim == 1:
+            json_dict_key = "slice_landmarks_y"
+        else:
+            json_dict_key = "slice_landmarks_z"
+        slice_idx = sorted_points[0].tolist()[slice_dim]
+        landmarks_dict = {
+            "slice_idx": slice_idx,
+            "landmarks": {
+                point_names[0]: sorted_points[0].tolist(),
+                point_names[1]: sorted_points[1].tolist(),
+            },
+        }
+        json_dict[json_dict_key].append(landmarks_dict)
+
+        # Queue visualization
+        for coord in sorted_points[:, slice_dim].astype(int):
+            save_path = os.path.join(
+                subfolder,
+                f"{nii_path.name.replace('_meas.nii.gz','')}_slice{coord}.png",
+            )
+            figure_jobs.append((sorted_points, point_names, slice_dim, coord, save_path))
+
+    # Save landmarks to JSON
+    with gzip.open(
+        os.path.join(
+            landmark_json_dir,
+            f"{nii_path.name.replace('_meas.nii.gz','')}.json.gz",
+        ),
+        "wt",
+    ) as f:
+        json.dump(json_dict, f, indent=4)
+    return img_file, figure_jobs
+
+
 def process_landmark_points(
     landmark_mask_dir: str,
     landmark_json_dir: str,
@@ -126,158 +306,50 @@ def process_landmark_points(
     fig_dir: str,
     slice_dim_map: dict = LANDMARKS_SLICE_DIM,
     labels_name: dict = LABELS_NAME,
+    save_figures: bool = True,
+    num_workers: int = None,
 ):
-    """Process landmark points from mask files and save coordinates and visualizations."""
+    """
+    Process landmark points from mask files and save coordinates and visualizations.
+    Subjects are processed in parallel; figures (optional) are rendered as separate tasks
+    while the remaining subjects are still being processed.
+    """
 
     # Create output directories
     for dir_path in [landmark_json_dir, img_dir, fig_dir]:
         os.makedirs(dir_path, exist_ok=True)
 
-    def plot_landmarks(img_data, points, point_names, slice_dim, coord, save_path):
-        """Helper function to plot landmarks on image slices."""
-        plt.figure()
-
-        # Handle different slice orientations
-        if slice_dim == 0:  # Sagittal
-            plt.imshow(img_data[coord, :, :].T, cmap="gray", origin="lower")
-            x_coords, y_coords = points[:, 1], points[:, 2]
-            plt.xlabel("Anterior →", fontsize=14)
-            plt.ylabel("Superior →", fontsize=14)
-        elif slice_dim == 1:  # Coronal
-            plt.imshow(img_data[:, coord, :].T, cmap="gray", origin="lower")
-            x_coords, y_coords = points[:, 0], points[:, 2]
-            plt.xlabel("Right →", fontsize=14)
-            plt.ylabel("Superior →", fontsize=14)
-        else:  # Axial
-            plt.imshow(img_data[:, :, coord].T, cmap="gray", origin="lower")
-            x_coords, y_coords = points[:, 0], points[:, 1]
-            plt.xlabel("Right →", fontsize=14)
-            plt.ylabel("Anterior →", fontsize=14)
-
-        # Plot points and labels
-        for i, (x, y) in enumerate(zip(x_coords, y_coords)):
-            plt.scatter(
-                [x],
-                [y],
-                facecolors="#18A727",
-                edgecolors="black",
-                marker="o",
-                s=80,
-                linewidth=1.5,
-                label=point_names[i],
-            )
-            plt.annotate(
-                point_names[i],
-                (x, y),
-                xytext=(2, 2),
-                textcoords="offset points",
-                color="#FE9100",
-                fontsize=14,
-            )
-
-        plt.margins(0)
-        plt.savefig(save_path)
-        plt.close()
-
-    for nii_file in glob.glob(os.path.join(landmark_mask_dir, "*.nii.gz")):
-        try:
-            nii_path = Path(nii_file)
-            data = nib.load(str(nii_path)).get_fdata()
-            img_data = nib.load(
-                os.path.join(
-                    img_dir, nii_path.name.replace("meas.nii.gz", "T2w.nii.gz")
-                )
-            ).get_fdata()
-
-            # This data structure is designed to be compatible with biometric data constructed from segmentation masks
-            json_dict = {
-                "slice_landmarks_x": [],
-                "slice_landmarks_y": [],
-                "slice_landmarks_z": [],
-            }
-
-            # Process each label
-            for label in range(1, 6):
-                # Get coordinates
-                coords = np.where(data == label)
-                points = np.array(list(zip(coords[0], coords[1], coords[2])))
-
-                if len(points) != 2:
-                    raise ValueError(
-                        f"Label {label} has {len(points)} points, expected 2"
-                    )
-
-                # Determine point indices and names based on label
-                subfolder = os.path.join(fig_dir, labels_name[str(label)])
-                os.makedirs(subfolder, exist_ok=True)
-
-                # Determine point order based on anatomical measurement type
-                if label == 1:  # Corpus Callosum Length
-                    idx_larger = np.argmax(points[:, 1])  # More anterior point
-                    point_names = ["P1", "P2"]
-                elif label == 2:  # Vermis Height
-                    idx_larger = np.argmax(points[:, 2])  # Superior point
-                    point_names = ["P3", "P4"]
-                elif label == 3:  # Brain Biparietal Diameter
-                    idx_larger = np.argmax(points[:, 0])  # Right point
-                    point_names = ["P5", "P6"]
-                elif label == 4:  # Skull Biparietal Diameter
-                    idx_larger = np.argmax(points[:, 0])  # Right point
-                    point_names = ["P7", "P8"]
-                else:  # Transverse Cerebellar Diameter
-                    idx_larger = np.argmax(points[:, 0])  # Right point
-                    point_names = ["P9", "P10"]
-
-                idx_smaller = 1 - idx_larger
-                sorted_points = points[[idx_larger, idx_smaller]]
-
-                # Save landmark coordinates
-                slice_dim = slice_dim_map[point_names[0]]
-                if slice_dim == 0:
-                    json_dict_key = "slice_landmarks_x"
-                elif slice_dim == 1:
-                    json_dict_key = "slice_landmarks_y"
-                else:
-                    json_dict_key = "slice_landmarks_z"
-                slice_idx = sorted_points[0].tolist()[slice_dim]
-                landmarks_dict = {
-                    "slice_idx": slice_idx,
-                    "landmarks": {
-                        point_names[0]: sorted_points[0].tolist(),
-                        point_names[1]: sorted_points[1].tolist(),
-                    },
-                }
-                json_dict[json_dict_key].append(landmarks_dict)
-
-                # Plot visualization
-                slice_dim = slice_dim_map[point_names[0]]
-                for coord in sorted_points[:, slice_dim].astype(int):
-                    save_path = os.path.join(
-                        subfolder,
-                        f"{nii_path.name.replace('_meas.nii.gz','')}_slice{coord}.png",
-                    )
-                    plot_landmarks(
-                        img_data,
-                        sorted_points,
-                        point_names,
-                        slice_dim,
-                        coord,
-                        save_path,
-                    )
-
-            # Save landmarks to JSON
-            with gzip.open(
-                os.path.join(
-                    landmark_json_dir,
-                    f"{nii_path.name.replace('_meas.nii.gz','')}.json.gz",
-                ),
-                "wt",
-            ) as f:
-                json.dump(json_dict, f, indent=4)
-            print(f"Processed {nii_path.name}")
-
-        except Exception as e:
-            print(f"Error processing {nii_path.name}: {str(e)}")
+    nii_files = glob.glob(os.path.join(landmark_mask_dir, "*.nii.gz"))
+    with ProcessPoolExecutor(max_workers=num_workers or os.cpu_count() or 1) as executor:
+        futures = {
+            executor.submit(
+                _extract_landmark_points,
+                nii_file,
+                landmark_json_dir,
+                img_dir,
+                fig_dir,
+                slice_dim_map,
+                labels_name,
+            ): Path(nii_file).name
+            for nii_file in nii_files
+        }
+        figure_futures = {}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                img_file, figure_jobs = future.result()
+            except Exception as e:
+                print(f"Error processing {name}: {str(e)}")
+                continue
+            print(f"Processed {name}")
+            if save_figures:
+                figure_futures[executor.submit(_plot_subject_landmarks, img_file, figure_jobs)] = name
+
+        for future in as_completed(figure_futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error plotting {figure_futures[future]}: {str(e)}")
 
 
 def download_and_extract(dataset_dir, dataset_name):
@@ -322,14 +394,9 @@ def download_and_extract(dataset_dir, dataset_name):
     dir_biometry = os.path.join(tmp_dir, "feta_2.4", "derivatives", "biometry")
     dir_reo = os.path.join(tmp_dir, "feta_2.4", "derivatives", "im_reo")
 
-    print("Reorient images to biometry measurement space...")
-    im_original_to_realigned(
-        feta_dir=dir_feta, biometry_dir=dir_biometry, out_dir=dir_reo, seg=False
-    )
-
-    print("Reorient masks to biometry measurement space...")
+    print("Reorient images and masks to biometry measurement space...")
     im_original_to_realigned(
-        feta_dir=dir_feta, biometry_dir=dir_biometry, out_dir=dir_reo, seg=True
+        feta_dir=dir_feta, biometry_dir=dir_biometry, out_dir=dir_reo, seg=True, image=True
     )
 
     print("Moving reoriented images and masks...")
@@ -1,10 +1,9 @@
 import os
 import shutil
-import glob
 import argparse
 import zipfile
-import urllib.request
 from biometric_vqa.utils.preprocess_utils import process_dataset, move_folder
+from biometric_vqa.utils.download_utils import download_file
 
 
 # ====================================
@@ -33,7 +32,7 @@ def download_and_extract(dataset_dir, dataset_name):
     print("Downloading dataset from Zenodo...")
     url = "https://zenodo.org/records/11199559/files/HNTSMRG24_train.zip?download=1"
     zip_path = "HNTSMRG24_train.zip"
-    urllib.request.urlretrieve(url, zip_path)
+    download_file(url, zip_path)
 
     # Extract downloaded zip file
     print("Extracting zip file...")
@@ -1,10 +1,9 @@
 import os
 import shutil
 import argparse
-import glob
-import urllib.request
-import tarfile
 from biometric_vqa.utils.preprocess_utils import split_4d_nifti, move_folder
+from biometric_vqa.utils.download_utils import download_and_extract_archives
+from biometric_vqa.utils.archive_utils import extract_selected
 
 
 # ====================================
@@ -16,7 +15,24 @@ from biometric_vqa.utils.preprocess_utils import split_4d_nifti, move_folder
 # ====================================
 
 
-def download_and_extract(dataset_dir, dataset_name):
+def _select_msd_member(name):
+    """Map Task??_<Name>/imagesTr|labelsTr/<file>.nii.gz to MSD-<Name>/Images|Masks/<file>.nii.gz"""
+    parts = name.split("/")
+    if len(parts) != 3 or not parts[0].startswith("Task") or not parts[2].endswith(".nii.gz"):
+        return None
+    subdirs = {"imagesTr": "Images", "labelsTr": "Masks"}
+    if parts[1] not in subdirs:
+        return None
+    # Remove "Task??_" prefix
+    return os.path.join(f"MSD-{parts[0][7:]}", subdirs[parts[1]], parts[2])
+
+
+def _extract_msd_task(tar_file):
+    """Extract the training images and labels of one MSD task (test images, dataset.json and macOS files are skipped)"""
+    extract_selected(tar_file, _select_msd_member)
+
+
+def download_and_extract(dataset_dir, dataset_name, disk_budget_gb=None):
     # Download files
     current_dir = os.getcwd()
     os.chdir(dataset_dir)
@@ -44,40 +60,15 @@ def download_and_extract(dataset_dir, dataset_name):
 
     base_url = "https://msd-for-monai.s3-us-west-2.amazonaws.com"
 
-    # Download all tasks
+    # Download and extract one task at a time (each tar is removed once extracted), within the disk budget
     print("Downloading MSD task datasets...")
-    for task_name, filename in tasks.items():
-        url = f"{base_url}/{filename}"
-        print(f"Downloading {filename} from {url}...")
-        urllib.request.urlretrieve(url, filename)
-        print(f"Download complete: {filename}")
-
-    # Extract tar files
-    print("Extracting downloaded files...")
-    for tar_file in glob.glob("*.tar"):
-        print(f"Extracting {tar_file}...")
-        with tarfile.open(tar_file, "r") as tar:
-            tar.extractall()
-        os.remove(tar_file)
-        print(f"{tar_file} extracted")
-
-    # Rename task directories
-    for task_dir in glob.glob("Task*"):
-        new_name = f"MSD-{task_dir[7:]}"  # Remove "Task??_" prefix
-        os.rename(task_dir, new_name)
-
-    # Rename/remove subdirectories in MSD folders
-    for msd_dir in glob.glob("MSD-*"):
-        if not os.path.isdir(msd_dir):
-            continue
-        msd_dir = msd_dir.rstrip("/\\")
-        # Rename images and labels directories
-        os.rename(os.path.join(msd_dir, "imagesTr"), os.path.join(msd_dir, "Images"))
-        os.rename(os.path.join(msd_dir, "labelsTr"), os.path.join(msd_dir, "Masks"))
-        # Remove test images directory if it exists
-        test_dir = os.path.join(msd_dir, "imagesTs")
-        if os.path.exists(test_dir):
-            shutil.rmtree(test_dir)
+    download_and_extract_archives(
+        [
+            (f"{base_url}/{filename}", filename, _extract_msd_task)
+            for filename in tasks.values()
+        ],
+        disk_budget_gb=disk_budget_gb,
+    )
 
     # Split 4D Nifti files in the MSD-BrainTumour dataset
     split_4d_nifti(os.path.join("MSD-BrainTumour", "Images"), "MSD-BrainTumour")
@@ -101,32 +92,6 @@ def download_and_extract(dataset_dir, dataset_name):
             os.path.join("MSD-Prostate", f"Images-{modality}"),
         )
 
-    # Clean up macOS and hidden files
-    for msd_dir in glob.glob("MSD-*"):
-        if not os.path.isdir(msd_dir):
-            continue
-        # Remove macOS metadata files
-        for pattern in ["._*", "._.DS_Store"]:
-            for file_path in glob.glob(
-                os.path.join(msd_dir, "**", pattern), recursive=True
-            ):
-                os.remove(file_path)
-
-        # Remove specific hidden files
-        hidden_files = ["._dataset.json", "._imagesTr", "._imagesTs", "._labelsTr"]
-        for hf in hidden_files:
-            hf_path = os.path.join(msd_dir, hf)
-            if os.path.exists(hf_path):
-                os.remove(hf_path)
-
-    # Clean up root hidden files
-    for msd_dir in glob.glob("MSD-*"):
-        json_file = os.path.join(msd_dir, "dataset.json")
-        if os.path.exists(json_file):
-            os.remove(json_file)
-    for f in glob.glob("._*"):
-        os.remove(f)
-
     # Move folder to dataset_dir
     folders_to_move = [
         "MSD-BrainTumour",
@@ -169,6 +134,12 @@ if __name__ == "__main__":
         help="Name of the dataset",
         required=True,
     )
+    parser.add_argument(
+        "--disk_budget_gb",
+        type=float,
+        default=None,
+        help="Disk space (GB) the download/extract pipeline may use at once (default: free space)",
+    )
     args = parser.parse_args()
 
     # Create dataset directory
@@ -179,4 +150,4 @@ if __name__ == "__main__":
     os.chdir(dataset_dir)
 
     # Download and extract dataset
-    download_and_extract(dataset_dir, args.dataset_name)
+    download_and_extract(dataset_dir, args.dataset_name, args.disk_budget_gb)
@@ -2,10 +2,14 @@ import os
 import shutil
 import argparse
 import zipfile
-import urllib.request
+import multiprocessing
 import nibabel as nib
 import numpy as np
 from pathlib import Path
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from biometric_vqa.utils.download_utils import download_and_extract_archives
+from biometric_vqa.utils.file_placement import place_file
 
 
 # ====================================
@@ -239,21 +243,16 @@ def process_data_totalsegmentator(subject_path: Path, output_dir: Path, modality
         print(f"Invalid modality: {modality}")
         return
 
-    # Process each segmentation
+    # Process each segmentation (first label wins where organs overlap)
     for index, organ in seg_labels.items():
         seg_file = seg_dir / f"{organ}.nii.gz"
         if seg_file.exists():
             print(f"Processing {organ}")
-            # Read binary mask
+            # Read binary mask in its stored dtype (no float64 decode)
             mask = nib.load(str(seg_file))
-            mask_array = mask.get_fdata().astype(np.int16)
-            # Find overlapping regions and set them to 0 in the new mask
-            overlap = (mask_array == 1) & (combined_array > 0)
-            mask_array[overlap] = 0
-            # Replace remaining 1s with index
-            mask_array[mask_array == 1] = index
-            # Add to combined mask
-            combined_array += mask_array
+            mask_array = np.asanyarray(mask.dataobj)
+            # Assign index to foreground voxels not yet taken by another organ
+            combined_array[(mask_array > 0) & (combined_array == 0)] = index
 
     # Save combined mask
     output_file = masks_dir / f"{subject_path.name}.nii.gz"
@@ -262,11 +261,50 @@ def process_data_totalsegmentator(subject_path: Path, output_dir: Path, modality
     print(f"Saved combined mask to {output_file}")
 
     if img_file.exists():
-        shutil.copy2(img_file, images_dir / f"{subject_path.name}.nii.gz")
+        place_file(img_file, images_dir / f"{subject_path.name}.nii.gz", keep_source=True)
         print(f"Copied {modality} image for {subject_path.name}")
 
 
-def download_and_extract(dataset_dir, dataset_name):
+def process_data_totalsegmentator_batch(working_dir: Path, output_dir: Path, modality: str, num_workers=None):
+    """Process all subject folders in working_dir in parallel."""
+    subject_paths = sorted(working_dir.iterdir())
+    num_workers = num_workers or os.cpu_count() or 1
+    # Called from a download thread while the other archive may still be downloading: start the
+    # workers from a fork server instead of forking this multi-threaded process (locks held by
+    # other threads would be copied into the children)
+    with ProcessPoolExecutor(
+        max_workers=num_workers, mp_context=multiprocessing.get_context("forkserver")
+    ) as executor:
+        futures = [
+            executor.submit(process_data_totalsegmentator, item, output_dir, modality)
+            for item in subject_paths
+        ]
+        for future in futures:
+            future.result()
+
+
+def _extract_and_process(zip_path, modality, num_workers=None):
+    """
+    Extract one TotalSegmentator archive, build Images/Masks and remove the raw subject folders.
+    num_workers: processes used for the subjects of this archive (default: number of CPUs)
+    """
+    data_dir = Path.cwd()
+    working_dir = data_dir / f"TotalSegmentator-{modality}-raw"
+    out_dir = data_dir / f"TotalSegmentator-{modality}"
+
+    # Extract dataset
+    print(f"Extracting TotalSegmentator {modality} dataset...")
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        zip_ref.extractall(working_dir)
+
+    # Process data
+    process_data_totalsegmentator_batch(working_dir, out_dir, modality, num_workers)
+
+    # Clean up
+    shutil.rmtree(working_dir)
+
+
+def download_and_extract(dataset_dir, dataset_name, disk_budget_gb=None):
     # Download files
     print(f"Downloading {dataset_name} dataset to {dataset_dir}...")
 
@@ -274,48 +312,27 @@ def download_and_extract(dataset_dir, dataset_name):
     # Add download logic here [!]
     # ====================================
     # Download dataset from Zenodo
-    # Download CT dataset
-    print("Downloading TotalSegmentator CT dataset...")
-    urllib.request.urlretrieve(
-        "https://zenodo.org/records/10047292/files/Totalsegmentator_dataset_v201.zip",
-        "TotalSegmentator-CT.zip"
-    )
-    # Download MR dataset
-    print("Downloading TotalSegmentator MR dataset...")
-    urllib.request.urlretrieve(
-        "https://zenodo.org/records/14710732/files/TotalsegmentatorMRI_dataset_v200.zip",
-        "TotalSegmentator-MR.zip"
+    # Download, extract and process CT and MR datasets one archive at a time, within the disk budget
+    print("Downloading TotalSegmentator CT and MR datasets...")
+    # Both archives may be processed at the same time, so they share the CPUs
+    num_archives = 2
+    workers_per_archive = max(1, (os.cpu_count() or 1) // num_archives)
+    download_and_extract_archives(
+        [
+            (
+                "https://zenodo.org/records/10047292/files/Totalsegmentator_dataset_v201.zip",
+                "TotalSegmentator-CT.zip",
+                partial(_extract_and_process, modality="CT", num_workers=workers_per_archive),
+            ),
+            (
+                "https://zenodo.org/records/14710732/files/TotalsegmentatorMRI_dataset_v200.zip",
+                "TotalSegmentator-MR.zip",
+                partial(_extract_and_process, modality="MR", num_workers=workers_per_archive),
+            ),
+        ],
+        disk_budget_gb=disk_budget_gb,
+        num_workers=num_archives,
     )
-
-    # Extract CT dataset
-    print("Extracting TotalSegmentator CT dataset...")
-    with zipfile.ZipFile("TotalSegmentator-CT.zip", 'r') as zip_ref:
-        zip_ref.extractall("TotalSegmentator-CT-raw")
-    
-    # Extract MR dataset
-    print("Extracting TotalSegmentator MR dataset...")
-    with zipfile.ZipFile("TotalSegmentator-MR.zip", 'r') as zip_ref:
-        zip_ref.extractall("TotalSegmentator-MR-raw")
-
-    data_dir = Path.cwd()
-
-    # Process CT data
-    ct_out_dir = data_dir / "TotalSegmentator-CT"
-    ct_working_dir = data_dir / "TotalSegmentator-CT-raw"
-    for item in ct_working_dir.iterdir():
-        process_data_totalsegmentator(item, ct_out_dir, "CT")
-
-    # Process MR data
-    mr_out_dir = data_dir / "TotalSegmentator-MR"
-    mr_working_dir = data_dir / "TotalSegmentator-MR-raw"
-    for item in mr_working_dir.iterdir():
-        process_data_totalsegmentator(item, mr_out_dir, "MR")
-
-    # Clean up
-    shutil.rmtree("TotalSegmentator-CT-raw")
-    shutil.rmtree("TotalSegmentator-MR-raw")
-    os.remove("TotalSegmentator-CT.zip")
-    os.remove("TotalSegmentator-MR.zip")
     # ====================================
 
     print(f"Download and extraction completed for {dataset_name}")
@@ -336,6 +353,12 @@ if __name__ == "__main__":
         help="Name of the dataset",
         required=True,
     )
+    parser.add_argument(
+        "--disk_budget_gb",
+        type=float,
+        default=None,
+        help="Disk space (GB) the download/extract pipeline may use at once (default: free space)",
+    )
     args = parser.parse_args()
 
     # Create dataset directory
@@ -346,4 +369,4 @@ if __name__ == "__main__":
     os.chdir(dataset_dir)
 
     # Download and extract dataset
-    download_and_extract(dataset_dir, args.dataset_name)
+    download_and_extract(dataset_dir, args.dataset_name, args.disk_budget_gb)
@@ -0,0 +1,204 @@
+import os
+import shutil
+import fnmatch
+import tarfile
+import zipfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# =========================
+# Usage:
+# Extract only the wanted members of an archive straight to their final location:
+#   select = match_members([("*/labelsTr/*.nii.gz", "Masks"), ("*/imagesTr/*_0000.nii.gz", "Images")])
+#   extract_selected("dataset.tgz", select)
+# Extract several archives concurrently:
+#   extract_archives([("part1.zip", select), ("part2.zip", select)])
+# =========================
+
+BUFFER_SIZE = 8 * 1024 * 1024
+
+
+def _is_junk_member(name):
+    """macOS resource forks and metadata folders shipped inside some archives"""
+    parts = name.split("/")
+    return "__MACOSX" in parts or parts[-1].startswith("._")
+
+
+def match_members(rules):
+    """
+    Build a member selector from (pattern, dest_dir) rules.
+    Patterns are fnmatch patterns against the member path inside the archive ("/"-separated).
+    The first matching rule wins; a dest_dir of None skips the member.
+    Selected members are written to <dest_dir>/<basename>.
+    """
+
+    def select(name):
+        for pattern, dest_dir in rules:
+            if fnmatch.fnmatch(name, pattern):
+                if dest_dir is None:
+                    return None
+                return os.path.join(dest_dir, os.path.basename(name))
+        return None
+
+    return select
+
+
+def list_members(archive_path):
+    """List the file members of a zip/tar/rar/7z archive ("/"-separated paths, junk entries skipped)"""
+    archive_path = str(archive_path)
+    lower = archive_path.lower()
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path, "r") as zf:
+            names = [info.filename for info in zf.infolist() if not info.is_dir()]
+    elif lower.endswith(".rar"):
+        import rarfile
+
+        with rarfile.RarFile(archive_path) as rf:
+            names = [info.filename.replace("\\", "/") for info in rf.infolist() if not info.is_dir()]
+    elif lower.endswith(".7z"):
+        import py7zr
+
+        with py7zr.SevenZipFile(archive_path, "r") as archive:
+            names = [info.filename for info in archive.list() if not info.is_directory]
+    elif tarfile.is_tarfile(archive_path):
+        with tarfile.open(archive_path, "r:*") as tf:
+            names = [m.name[2:] if m.name.startswith("./") else m.name for m in tf.getmembers() if m.isfile()]
+    else:
+        raise ValueError(f"Unsupported archive format: {archive_path}")
+    return [name for name in names if not _is_junk_member(name)]
+
+
+def _write_member(src, dest_path, buffer_size=BUFFER_SIZE):
+    """Stream an open archive member to dest_path via a temporary file in the same folder"""
+    dest_dir = os.path.dirname(dest_path)
+    if dest_dir:
+        os.makedirs(dest_dir, exist_ok=True)
+    tmp_path = f"{dest_path}.tmp{os.getpid()}_{threading.get_ident()}"
+    with open(tmp_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, buffer_size)
+    os.replace(tmp_path, dest_path)
+
+
+def _extract_zip(archive_path, select, output_root, buffer_size):
+    written = []
+    with zipfile.ZipFile(archive_path, "r") as zf:
+        for info in zf.infolist():
+            if info.is_dir() or _is_junk_member(info.filename):
+                continue
+            dest = select(info.filename)
+            if dest is None:
+                continue
+            dest_path = os.path.join(output_root, dest)
+            with zf.open(info) as src:
+                _write_member(src, dest_path, buffer_size)
+            written.append(dest_path)
+    return written
+
+
+def _extract_tar(archive_path, select, output_root, buffer_size):
+    written = []
+    # Stream mode: a single sequential pass over the (possibly compressed) tar
+    with tarfile.open(archive_path, "r|*") as tf:
+        for member in tf:
+            name = member.name[2:] if member.name.startswith("./") else member.name
+            if not member.isfile() or _is_junk_member(name):
+                continue
+            dest = select(name)
+            if dest is None:
+                continue
+            dest_path = os.path.join(output_root, dest)
+            _write_member(tf.extractfile(member), dest_path, buffer_size)
+            written.append(dest_path)
+    return written
+
+
+def _extract_rar(archive_path, select, output_root, buffer_size):
+    import rarfile
+
+    written = []
+    with rarfile.RarFile(archive_path) as rf:
+        for info in rf.infolist():
+            name = info.filename.replace("\\", "/")
+            if info.is_dir() or _is_junk_member(name):
+                continue
+            dest = select(name)
+            if dest is None:
+                continue
+            dest_path = os.path.join(output_root, dest)
+            with rf.open(info) as src:
+                _write_member(src, dest_path, buffer_size)
+            written.append(dest_path)
+    return written
+
+
+def _extract_7z(archive_path, select, output_root, buffer_size):
+    import py7zr
+
+    written = []
+    with py7zr.SevenZipFile(archive_path, "r") as archive:
+        targets = {}
+        for info in archive.list():
+            if info.is_directory or _is_junk_member(info.filename):
+                continue
+            dest = select(info.filename)
+            if dest is not None:
+                targets[info.filename] = os.path.join(output_root, dest)
+        if not targets:
+            return written
+        # py7zr has no per-member stream; extract the selected members next to the output and rename them
+        os.makedirs(output_root or ".", exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=output_root or ".") as tmp_dir:
+            archive.extract(path=tmp_dir, targets=list(targets))
+            for name, dest_path in targets.items():
+                dest_dir = os.path.dirname(dest_path)
+                if dest_dir:
+                    os.makedirs(dest_dir, exist_ok=True)
+                os.replace(os.path.join(tmp_dir, name), dest_path)
+                written.append(dest_path)
+    return written
+
+
+def extract_selected(archive_path, select, output_root="", buffer_size=BUFFER_SIZE):
+    """
+    Extract the members of a zip/tar(.gz/.bz2/.xz)/rar/7z archive chosen by select directly to their final paths.
+    select(member_name) returns the destination path (relative to output_root) or None to skip the member.
+    Returns the list of written files.
+    """
+    archive_path = str(archive_path)
+    lower = archive_path.lower()
+    print(f"Extracting {archive_path}...")
+    if zipfile.is_zipfile(archive_path):
+        written = _extract_zip(archive_path, select, output_root, buffer_size)
+    elif lower.endswith(".rar"):
+        written = _extract_rar(archive_path, select, output_root, buffer_size)
+    elif lower.endswith(".7z"):
+        written = _extract_7z(archive_path, select, output_root, buffer_size)
+    elif tarfile.is_tarfile(archive_path):
+        written = _extract_tar(archive_path, select, output_root, buffer_size)
+    else:
+        raise ValueError(f"Unsupported archive format: {archive_path}")
+    print(f"Extracted {len(written)} files from {archive_path}")
+    return written
+
+
+def extract_archives(jobs, num_workers=None, buffer_size=BUFFER_SIZE):
+    """
+    Extract several archives concurrently.
+    jobs: list of (archive_path, select) or (archive_path, select, output_root) tuples.
+    Archives whose selections write the same destination paths should not be extracted in the same call.
+    Returns {archive_path: [written files]}.
+    """
+    jobs = [tuple(job) + ("",) * (3 - len(job)) for job in jobs]
+    if not jobs:
+        return {}
+    num_workers = num_workers or min(len(jobs), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {
+            str(archive_path): executor.submit(
+                extract_selected, archive_path, select, output_root, buffer_size
+            )
+            for archive_path, select, output_root in jobs
+        }
+        return {archive_path: future.result() for archive_path, future in futures.items()}
@@ -4,7 +4,6 @@ import nibabel as nib
 import numpy as np
 import random
 import glob
-import sys
 import cv2
 import gzip
 import matplotlib.pyplot as plt
@@ -12,8 +11,17 @@ from tqdm import tqdm
 from scipy.ndimage import label, find_objects
 from abc import ABC, abstractmethod
 from biometric_vqa import __version__
-from biometric_vqa.utils.preprocess_utils import convert_to_serializable
-from biometric_vqa.utils.data_conversion import convert_mask_to_uint16_per_dir
+from biometric_vqa.utils.preprocess_utils import (
+    convert_to_serializable,
+    validate_segmentation_labels_batch,
+)
+from biometric_vqa.utils.data_conversion import (
+    convert_mask_to_uint16_per_dir,
+    normalize_mask_per_dir,
+)
+from biometric_vqa.utils.volume_cache import load_volume
+from biometric_vqa.utils.intensity_utils import compute_intensity_stats
+from biometric_vqa.utils.mask_store import MASK_STORE_DIR, encode_slice_mask, save_case_masks
 
 
 class BiometricVQA_BenchmarkPlannerBase(ABC):
@@ -24,6 +32,9 @@ class BiometricVQA_BenchmarkPlannerBase(ABC):
         dataset_name,
         seed=1024,
         split_ratio=0.7,
+        volume_cache_dir=None,
+        record_intensity_stats=False,
+        volume_loader=None,
     ):
         self.version = __version__
         self.dataset_dir = dataset_dir
@@ -31,6 +42,14 @@ class BiometricVQA_BenchmarkPlannerBase(ABC):
         self.dataset_name = dataset_name
         self.seed = seed
         self.split_ratio = split_ratio
+        # Record the intensity statistics of every image in its case (decodes each image)
+        self.record_intensity_stats = record_intensity_stats
+        self._intensity_stats = {}
+        # Folder of the decoded volume cache (see volume_cache), None: decode the NIfTI files directly
+        self.volume_cache_dir = volume_cache_dir
+        # Optional loader(file_path) of the volume data instead of load_volume
+        # (e.g. chunked_store.chunked_loader(store_root, dataset_dir))
+        self.volume_loader = volume_loader
 
     @property
     @abstractmethod
@@ -89,13 +108,24 @@ class BiometricVQA_BenchmarkPlannerBase(ABC):
             f"Converted {nifti_path} to RAS+ orientation and saved as {output_path}.\n"
         )
 
-    def _reorient_niigz_RASplus_batch_inplace(self):
+    def _reorient_niigz_RASplus_batch_inplace(self, exclude_folders=None):
         """
         Reorient all NIfTI files in a directory and its subdirectories to RAS+ orientation in place.
         This function modifies the original files rather than creating new ones.
+        Files under any of the exclude_folders (relative to dataset_dir) are skipped.
         """
         # Find all .nii.gz files recursively in directory
         nii_files = list(glob.glob(f"{self.dataset_dir}/**/*.nii.gz", recursive=True))
+        if exclude_folders:
+            exclude_dirs = [
+                os.path.abspath(os.path.join(self.dataset_dir, folder))
+                for folder in exclude_folders
+            ]
+            nii_files = [
+                f
+                for f in nii_files
+                if os.path.dirname(os.path.abspath(f)) not in exclude_dirs
+            ]
         print(f"Reorienting {len(nii_files)} files to RAS+ orientation...\n")
         # Process each file
         for i, nii_file in enumerate(nii_files, 1):
@@ -107,11 +137,11 @@ class BiometricVQA_BenchmarkPlannerBase(ABC):
         self.bm_plan["tasks_number"] = len(self.bm_plan["tasks"])
         print(f"Updated tasks_number to {self.bm_plan['tasks_number']}")
 
-    def reorient_niigz_RASPlus(self):
+    def reorient_niigz_RASPlus(self, exclude_folders=None):
         print(
             f"Reorienting images and masks to RAS+ orientation for {self.dataset_name}...\n"
         )
-        self._reorient_niigz_RASplus_batch_inplace()
+        self._reorient_niigz_RASplus_batch_inplace(exclude_folders)
 
     def save_benchmark_plan(self):
         print("Saving benchmark plan...\n")
@@ -178,6 +208,27 @@ class BiometricVQA_BenchmarkPlannerBase(ABC):
         """Placeholder method to be implemented by child classes"""
         pass
 
+    def _load_volume(self, file_path):
+        """Data of a volume, from volume_loader if set, else through the volume cache"""
+        if self.volume_loader is not None:
+            return self.volume_loader(file_path)
+        return load_volume(file_path, self.volume_cache_dir)
+
+    def _get_intensity_stats(self, image_path, task_info):
+        """
+        Per-volume intensity statistics and windows for rendering (see intensity_utils), or None unless
+        record_intensity_stats is set. Statistics already computed from a decoded image are reused.
+        """
+        if not self.record_intensity_stats:
+            return None
+        key = os.path.normpath(image_path)
+        if key not in self._intensity_stats:
+            self._intensity_stats[key] = compute_intensity_stats(
+                self._load_volume(image_path),
+                task_info.get("image_modality", ""),
+            )
+        return self._intensity_stats[key]
+
 
 class BiometricVQA_BenchmarkPlanner4SegDetect(BiometricVQA_BenchmarkPlannerBase):
     def __init__(
@@ -189,6 +240,9 @@ class BiometricVQA_BenchmarkPlanner4SegDetect(BiometricVQA_BenchmarkPlannerBase)
         split_ratio=0.7,
         force_uint16_mask=True,
         reorient2RAS=True,
+        volume_cache_dir=None,
+        record_intensity_stats=False,
+        volume_loader=None,
     ):
         # Call parent class's __init__
         super().__init__(
@@ -197,12 +251,17 @@ class BiometricVQA_BenchmarkPlanner4SegDetect(BiometricVQA_BenchmarkPlannerBase)
             dataset_name,
             seed,
             split_ratio,
+            volume_cache_dir=volume_cache_dir,
+            record_intensity_stats=record_intensity_stats,
+            volume_loader=volume_loader,
         )
 
         # Add additional attributes specific to this class
         self.force_uint16_mask = force_uint16_mask
         self.reorient2RAS = reorient2RAS
         self.mask_folders = self._get_mask_folders()
+        # Label voxel counts per mask file (absolute path), filled during mask normalization/validation
+        self.label_voxel_counts = {}
 
     def _get_mask_folders(self):
         """Get unique mask folders from tasks"""
@@ -249,21 +308,21 @@ class BiometricVQA_BenchmarkPlanner4SegDetect(BiometricVQA_BenchmarkPlannerBase)
         caseID, image_path, mask_path = self._match_mask_to_image(image_file, task_info)
         # Inspect the mask files
         mask_nii = nib.load(mask_path)
-        mask_data = mask_nii.get_fdata()
+        # Decoded once (memory-mapped from the volume cache by later stages if volume_cache_dir is set)
+        mask_data = self._load_volume(mask_path)
         mask_file_info = {
             "voxel_size": tuple(round(x, 3) for x in mask_nii.header.get_zooms()),
             "affine": np.round(mask_nii.affine, 3),
             "orientation": nib.orientations.aff2axcodes(mask_nii.affine),
             "array_size": mask_data.shape,
         }
-        # Inspect the image files
+        # Inspect the image files (header only, the image data is not needed here)
         img_nii = nib.load(image_path)
-        img_data = img_nii.get_fdata()
         image_file_info = {
             "voxel_size": tuple(round(x, 3) for x in img_nii.header.get_zooms()),
             "affine": np.round(img_nii.affine, 3),
             "orientation": nib.orientations.aff2axcodes(img_nii.affine),
-            "array_size": img_data.shape,
+            "array_size": img_nii.shape,
         }
         # Check if mask and image properties match
         print(f"Checking properties for case: {caseID} ...")
@@ -294,49 +353,57 @@ class BiometricVQA_BenchmarkPlanner4SegDetect(BiometricVQA_BenchmarkPlannerBase)
             mask_file_info,
         )
 
-    def _validate_segmentation_labels_per_dir(self, mask_folder):
-        labels_map = self._find_labels_map(self, mask_folder)
+    def _get_valid_labels(self, mask_folder):
+        labels_map = self._find_labels_map(mask_folder)
         if not labels_map:
-            print("\n\nError: labels_map is empty!\n")
-            sys.exit(1)
-        # Get list of keys from labels_map
-        valid_labels = np.array(list(labels_map.keys()))
-        print(f"Valid labels from labels_map: {valid_labels}")
-        # Check each .nii.gz file
-        total_files = sum(
-            1 for _ in glob.glob(f"{mask_folder}/**/*.nii.gz", recursive=True)
-        )
-        processed = 0
-        for file_path in glob.glob(f"{mask_folder}/**/*.nii.gz", recursive=True):
-            processed += 1
-            print(
-                f" - [{processed}/{total_files}] Checking: {os.path.basename(file_path)}"
+            raise ValueError(
+                f"\n\nError: labels_map is empty for the mask folder {mask_folder}!\n\n"
             )
-            try:
-                img = nib.load(file_path)
-                data = img.get_fdata()
-                unique_vals = np.unique(
-                    data[data != 0]
-                )  # Get non-zero values directly as numbers
-                invalid_mask = ~np.isin(
-                    unique_vals, valid_labels.astype(unique_vals.dtype)
-                )
-                invalid_labels = unique_vals[invalid_mask]
-                if len(invalid_labels) > 0:
-                    print(f"\nError in file: {file_path}")
-                    print(f"Found invalid labels: {invalid_labels}")
-                    print(f"Valid labels are: {valid_labels}")
-                    sys.exit(1)
-            except Exception as e:
-                print(f"\nError processing {file_path}: {str(e)}")
-                sys.exit(1)
+        return [int(k) for k in labels_map.keys()]
+
+    def _get_mask_labels(self, mask_path, mask_data):
+        """Get the non-zero labels of a mask, reusing label voxel counts when available"""
+        label_counts = self.label_voxel_counts.get(os.path.abspath(mask_path))
+        if label_counts is not None:
+            return np.array(
+                sorted(int(k) for k in label_counts if int(k) != 0),
+                dtype=mask_data.dtype,
+            )
+        labels = np.unique(mask_data)
+        return labels[labels != 0]
 
-        print("\nAll files contain valid labels!")
+    def _validate_segmentation_labels_per_dir(self, mask_folder):
+        valid_labels = self._get_valid_labels(mask_folder)
+        print(f"Valid labels from labels_map: {valid_labels}")
+        mask_files = sorted(
+            os.path.abspath(f)
+            for f in glob.glob(
+                f"{os.path.join(self.dataset_dir, mask_folder)}/**/*.nii.gz",
+                recursive=True,
+            )
+        )
+        print(f"Checking labels in {len(mask_files)} files...")
+        return validate_segmentation_labels_batch(mask_files, valid_labels)
 
     def validate_segmentation_labels(self):
         print(f"Validating segmentation mask labels for {self.dataset_name}...\n")
+        report = {"dataset": self.dataset_name, "mask_folders": {}}
+        invalid_files_num = 0
         for folder in self.mask_folders:
-            self._validate_segmentation_labels_per_dir(self, folder)
+            folder_report = self._validate_segmentation_labels_per_dir(folder)
+            self.label_voxel_counts.update(folder_report["label_voxel_counts"])
+            invalid_files_num += len(folder_report["invalid_files"])
+            report["mask_folders"][folder] = folder_report
+        report_path = os.path.join(self.dataset_dir, "label_validation_report.json")
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Label validation report saved to {report_path}")
+        if invalid_files_num > 0:
+            raise ValueError(
+                f"\n\nError: Found {invalid_files_num} mask files with invalid labels.\n"
+                f"See the report: {report_path}\n\n"
+            )
+        print("\nAll files contain valid labels!")
 
     def convert_masks_to_uint16(self):
         print(f"Enforcing integers in masks for {self.dataset_name}...\n")
@@ -344,6 +411,33 @@ class BiometricVQA_BenchmarkPlanner4SegDetect(BiometricVQA_BenchmarkPlannerBase)
             mask_folder = os.path.join(self.dataset_dir, folder)
             convert_mask_to_uint16_per_dir(mask_folder)
 
+    def normalize_masks(self):
+        """
+        Fused mask normalization: cast to uint16, reorient to RAS+ (if reorient2RAS) and
+        validate labels against labels_map, reading and writing each mask only once.
+        """
+        print(f"Normalizing masks for {self.dataset_name}...\n")
+        invalid_files = {}
+        for folder in self.mask_folders:
+            valid_labels = self._get_valid_labels(folder)
+            mask_folder = os.path.join(self.dataset_dir, folder)
+            invalid_files_per_dir, label_voxel_counts = normalize_mask_per_dir(
+                mask_folder, valid_labels, self.reorient2RAS
+            )
+            invalid_files.update(invalid_files_per_dir)
+            self.label_voxel_counts.update(
+                {os.path.abspath(k): v for k, v in label_voxel_counts.items()}
+            )
+        if invalid_files:
+            error_msg = "\n".join(
+                f" - {path}: {labels}" for path, labels in invalid_files.items()
+            )
+            raise ValueError(
+                f"\n\nError: Found invalid labels in {len(invalid_files)} mask files:\n"
+                f"{error_msg}\n"
+                "Check the 'labels_map' in the 'benchmark_plan' dictionary.\n\n"
+            )
+
     def process_each_task(self):
         # Process each task in the benchmark plan
         for task_idx, task in enumerate(self.bm_plan["tasks"], 1):
@@ -369,8 +463,11 @@ class BiometricVQA_BenchmarkPlanner4SegDetect(BiometricVQA_BenchmarkPlannerBase)
         print(f"Preprocessing {self.dataset_name} dataset in {self.dataset_dir}...\n")
         self.update_tasks_number()
         if self.force_uint16_mask:
-            self.convert_masks_to_uint16()
-        if self.reorient2RAS:
+            # Masks are cast, reoriented and validated in one pass
+            self.normalize_masks()
+            if self.reorient2RAS:
+                self.reorient_niigz_RASPlus(exclude_folders=self.mask_folders)
+        elif self.reorient2RAS:
             self.reorient_niigz_RASPlus()
         self.process_each_task()
         self.save_benchmark_plan()
@@ -392,6 +489,10 @@ class BiometricVQA_BenchmarkPlannerSegmentation(
         split_ratio=0.7,
         force_uint16_mask=True,
         reorient2RAS=True,
+        mask_store=False,
+        volume_cache_dir=None,
+        record_intensity_stats=False,
+        volume_loader=None,
     ):
         # Call parent class's __init__
         super().__init__(
@@ -402,7 +503,12 @@ class BiometricVQA_BenchmarkPlannerSegmentation(
             split_ratio,
             force_uint16_mask,
             reorient2RAS,
+            volume_cache_dir=volume_cache_dir,
+            record_intensity_stats=record_intensity_stats,
+            volume_loader=volume_loader,
         )
+        # Also save RLE + polygon masks of every (slice, label) for overlay rendering
+        self.mask_store = mask_store
 
     @property
     def task_type(self):
@@ -426,9 +532,10 @@ class BiometricVQA_BenchmarkPlannerSegmentation(
         labels = slice_vals[0][mask]
         counts = slice_vals[1][mask]
         if len(labels) > 0:
+            # Plan files store labels as floats, whatever the mask dtype
             slice_profile = [
                 {
-                    "label": label,
+                    "label": float(label),
                     "pixel_count": int(count),
                     "ROI_area": count * unit_area,
                 }
@@ -437,6 +544,27 @@ class BiometricVQA_BenchmarkPlannerSegmentation(
             profile.append({"slice_idx": idx, "slice_profile": slice_profile})
         return profile
 
+    def _save_mask_store(self, caseID, mask_data, task_info, slice_profiles):
+        """
+        Save the RLE + polygon masks of every (slice_dim, slice_idx, label) found by the slice profiles.
+        Returns the store file (relative to the dataset folder, like the mask file).
+        """
+        masks = {}
+        for slice_dim, profiles in enumerate(slice_profiles):
+            for profile in profiles:
+                index = [slice(None)] * 3
+                index[slice_dim] = profile["slice_idx"]
+                slice_data = np.asarray(mask_data[tuple(index)])
+                masks.setdefault(slice_dim, {})[profile["slice_idx"]] = {
+                    label_profile["label"]: encode_slice_mask(
+                        slice_data == label_profile["label"]
+                    )
+                    for label_profile in profile["slice_profile"]
+                }
+        store_file = f"{MASK_STORE_DIR}/{task_info['mask_folder']}/{caseID}.json.gz"
+        save_case_masks(store_file, masks)
+        return store_file
+
     def _update_cases_profile(self, images_list, task_info, split):
         if split not in ["train", "test"]:
             raise ValueError('\n\nError: split should be one of "train" or "test"\n\n')
@@ -504,21 +632,32 @@ class BiometricVQA_BenchmarkPlannerSegmentation(
                     profile_per_slice_z = self.__inspect_slices(
                         profile_per_slice_z, i, slice_vals, unit_area_z
                     )
+            # Intensity statistics for rendering (None unless record_intensity_stats is set)
+            intensity_stats = self._get_intensity_stats(image_path, task_info)
             # Update the cases profile
             if f"{split}_cases" not in task_info:
                 task_info[f"{split}_cases"] = []
-            task_info[f"{split}_cases"].append(
-                {
-                    "case_ID": caseID,
-                    "image_file": image_path,
-                    "mask_file": mask_path,
-                    "image_file_info": image_file_info,
-                    "mask_file_info": mask_file_info,
-                    "slice_profiles_x": profile_per_slice_x,
-                    "slice_profiles_y": profile_per_slice_y,
-                    "slice_profiles_z": profile_per_slice_z,
-                }
-            )
+            case_profile = {
+                "case_ID": caseID,
+                "image_file": image_path,
+                "mask_file": mask_path,
+                "image_file_info": image_file_info,
+                "mask_file_info": mask_file_info,
+                "slice_profiles_x": profile_per_slice_x,
+                "slice_profiles_y": profile_per_slice_y,
+                "slice_profiles_z": profile_per_slice_z,
+            }
+            if self.mask_store:
+                print(" - Saving RLE and polygon masks ...")
+                case_profile["mask_store_file"] = self._save_mask_store(
+                    caseID,
+                    mask_data,
+                    task_info,
+                    [profile_per_slice_x, profile_per_slice_y, profile_per_slice_z],
+                )
+            task_info[f"{split}_cases"].append(case_profile)
+            if intensity_stats is not None:
+                task_info[f"{split}_cases"][-1]["intensity_stats"] = intensity_stats
             print(f"\nProfile updated for case {caseID}!\n{'-'*50}\n")
 
     @staticmethod
@@ -567,6 +706,9 @@ class BiometricVQA_BenchmarkPlannerDetection(BiometricVQA_BenchmarkPlanner4SegDe
         split_ratio=0.7,
         force_uint16_mask=True,
         reorient2RAS=True,
+        volume_cache_dir=None,
+        record_intensity_stats=False,
+        volume_loader=None,
     ):
         # Call parent class's __init__
         super().__init__(
@@ -577,6 +719,9 @@ class BiometricVQA_BenchmarkPlannerDetection(BiometricVQA_BenchmarkPlanner4SegDe
             split_ratio,
             force_uint16_mask,
             reorient2RAS,
+            volume_cache_dir=volume_cache_dir,
+            record_intensity_stats=record_intensity_stats,
+            volume_loader=volume_loader,
         )
 
     @property
@@ -707,9 +852,10 @@ class BiometricVQA_BenchmarkPlannerDetection(BiometricVQA_BenchmarkPlanner4SegDe
         mask = slice_vals[0] > 0
         labels = slice_vals[0][mask]
         if len(labels) > 0:
+            # Plan files store labels as floats, whatever the mask dtype
             slice_profile = [
                 {
-                    "label": label,
+                    "label": float(label),
                     "bboxes": self._find_bounding_boxes_2D(
                         mask_2d == label, pixel_spacing
                     ),
@@ -719,15 +865,16 @@ class BiometricVQA_BenchmarkPlannerDetection(BiometricVQA_BenchmarkPlanner4SegDe
             profile.append({"slice_idx": idx, "slice_profile": slice_profile})
         return profile
 
-    def _inspect_3D_image(self, mask_3d, voxel_spacing):
+    def _inspect_3D_image(self, mask_3d, voxel_spacing, labels=None):
         profile_3D = []
-        labels = np.unique(mask_3d)
-        labels = labels[labels != 0]
+        if labels is None:
+            labels = np.unique(mask_3d)
+            labels = labels[labels != 0]
         if len(labels) > 0:
             for label in labels:
                 binary_mask_3d = mask_3d == label
                 bboxes = self._find_bounding_boxes_3D(binary_mask_3d, voxel_spacing)
-                profile_3D.append({"label": label, "bboxes": bboxes})
+                profile_3D.append({"label": float(label), "bboxes": bboxes})
         return profile_3D
 
     def _update_cases_profile(self, images_list, task_info, split):
@@ -803,7 +950,11 @@ class BiometricVQA_BenchmarkPlannerDetection(BiometricVQA_BenchmarkPlanner4SegDe
                     )
             # Find bounding boxes for 3D objects
             print(" - Bounding box inspection for 3D images")
-            profile_3D = self._inspect_3D_image(mask_3d, voxel_sizes)
+            profile_3D = self._inspect_3D_image(
+                mask_3d, voxel_sizes, self._get_mask_labels(mask_path, mask_3d)
+            )
+            # Intensity statistics for rendering (None unless record_intensity_stats is set)
+            intensity_stats = self._get_intensity_stats(image_path, task_info)
             # Update the cases profile
             if f"{split}_cases" not in task_info:
                 task_info[f"{split}_cases"] = []
@@ -820,6 +971,8 @@ class BiometricVQA_BenchmarkPlannerDetection(BiometricVQA_BenchmarkPlanner4SegDe
                     "profile_3D": profile_3D,
                 }
             )
+            if intensity_stats is not None:
+                task_info[f"{split}_cases"][-1]["intensity_stats"] = intensity_stats
             print(f"\nProfile updated for case {caseID}!\n{'-'*50}\n")
 
     @staticmethod
@@ -864,6 +1017,9 @@ class BiometricVQA_BenchmarkPlannerBiometry(BiometricVQA_BenchmarkPlannerBase):
         dataset_name,
         seed=1024,
         split_ratio=0.7,
+        volume_cache_dir=None,
+        record_intensity_stats=False,
+        volume_loader=None,
     ):
         # Call parent class's __init__
         super().__init__(
@@ -872,6 +1028,9 @@ class BiometricVQA_BenchmarkPlannerBiometry(BiometricVQA_BenchmarkPlannerBase):
             dataset_name,
             seed,
             split_ratio,
+            volume_cache_dir=volume_cache_dir,
+            record_intensity_stats=record_intensity_stats,
+            volume_loader=volume_loader,
         )
 
     @property
@@ -1124,6 +1283,8 @@ class BiometricVQA_BenchmarkPlannerBiometry(BiometricVQA_BenchmarkPlannerBase):
                     )
                 else:
                     raise ValueError("Invalid slice dimension")
+            # Intensity statistics for rendering (None unless record_intensity_stats is set)
+            intensity_stats = self._get_intensity_stats(image_path, task_info)
             # Update the cases profile
             if f"{split}_cases" not in task_info:
                 task_info[f"{split}_cases"] = []
@@ -1137,6 +1298,8 @@ class BiometricVQA_BenchmarkPlannerBiometry(BiometricVQA_BenchmarkPlannerBase):
                     "slice_profiles_z": slice_profiles_z,
                 }
             )
+            if intensity_stats is not None:
+                task_info[f"{split}_cases"][-1]["intensity_stats"] = intensity_stats
             print(f"\nProfile updated for case {caseID}!\n{'-'*50}\n")
 
     @staticmethod
@@ -1212,6 +1375,9 @@ class BiometricVQA_BenchmarkPlannerBiometry_fromSeg(
         force_uint16_mask=True,
         reorient2RAS=True,
         visualization=False,
+        volume_cache_dir=None,
+        record_intensity_stats=False,
+        volume_loader=None,
     ):
         # Call parent class's __init__
         super().__init__(
@@ -1222,6 +1388,9 @@ class BiometricVQA_BenchmarkPlannerBiometry_fromSeg(
             split_ratio,
             force_uint16_mask,
             reorient2RAS,
+            volume_cache_dir=volume_cache_dir,
+            record_intensity_stats=record_intensity_stats,
+            volume_loader=volume_loader,
         )
         self.visualization = visualization
         self.shrunk_bbox_scale = shrunk_bbox_scale
@@ -1774,15 +1943,19 @@ class BiometricVQA_BenchmarkPlannerBiometry_fromSeg(
                 f"\n[{i}/{len(mask_files)}] Processing: {case_id}...\nMask file: {mask_file}"
             )
             # Load mask and image data
-            mask_nii = nib.load(mask_file)
-            mask_data = mask_nii.get_fdata()
+            mask_data = self._load_volume(mask_file)
             mask_binary = (mask_data == target_label).astype(np.uint8)
             image_file = os.path.join(
                 img_dir,
                 f"{image_prefix}{case_id}{image_suffix}",
             )
             image_nii = nib.load(image_file)
-            image_data = image_nii.get_fdata()
+            image_data = self._load_volume(image_file)
+            if self.record_intensity_stats:
+                # The image is decoded here anyway, the case profile reuses these statistics
+                self._intensity_stats[os.path.normpath(image_file)] = compute_intensity_stats(
+                    image_data, task_info.get("image_modality", "")
+                )
             voxel_sizes = image_nii.header.get_zooms()
             # Initialize landmark storage
             slice_landmarks_x, slice_landmarks_y, slice_landmarks_z = [], [], []
@@ -1997,6 +2170,8 @@ class BiometricVQA_BenchmarkPlannerBiometry_fromSeg(
                 )
             else:
                 slice_profiles_z = []
+            # Intensity statistics for rendering (None unless record_intensity_stats is set)
+            intensity_stats = self._get_intensity_stats(image_path, task_info)
             # Update the cases profile
             if f"{split}_cases" not in task_info:
                 task_info[f"{split}_cases"] = []
@@ -2013,6 +2188,8 @@ class BiometricVQA_BenchmarkPlannerBiometry_fromSeg(
                     "slice_profiles_z": slice_profiles_z,
                 }
             )
+            if intensity_stats is not None:
+                task_info[f"{split}_cases"][-1]["intensity_stats"] = intensity_stats
             print(f"\nProfile updated for case {caseID}!\n{'-'*50}\n")
 
     @staticmethod
@@ -2118,8 +2295,11 @@ class BiometricVQA_BenchmarkPlannerBiometry_fromSeg(
         print(f"Preprocessing {self.dataset_name} dataset in {self.dataset_dir}...\n")
         self.update_tasks_number()
         if self.force_uint16_mask:
-            self.convert_masks_to_uint16()
-        if self.reorient2RAS:
+            # Masks are cast, reoriented and validated in one pass
+            self.normalize_masks()
+            if self.reorient2RAS:
+                self.reorient_niigz_RASPlus(exclude_folders=self.mask_folders)
+        elif self.reorient2RAS:
             self.reorient_niigz_RASPlus()
         self.process_each_task()
         self.save_benchmark_plan()
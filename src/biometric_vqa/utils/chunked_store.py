@@ -0,0 +1,372 @@
+import os
+import glob
+import json
+import zlib
+import shutil
+import argparse
+import itertools
+import threading
+import numpy as np
+import nibabel as nib
+from collections import OrderedDict
+from numpy.lib.mixins import NDArrayOperatorsMixin
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from biometric_vqa.utils.volume_cache import _decode_volume
+
+
+# =========================
+# Usage:
+# Export the Images*/Masks* folders of a dataset to a chunked store (<dataset_dir>/Volumes.zarr):
+#   python chunked_store.py export /path/to/dataset --chunk 64 --workers 8
+# Open a volume from the store and use it like the decoded NIfTI array:
+#   volume = open_volume("/path/to/dataset/Volumes.zarr", "Images/case_001.nii.gz")
+#   volume.shape, volume.affine, volume.zooms
+#   slice_2d = volume[:, :, 42]   # only the chunks holding slice 42 are decompressed
+# Decompressed chunks are kept in a per-volume LRU (chunk_cache_mb), so reading the neighbouring
+# slices of a chunk layer does not decompress it again.
+# Render from the store instead of the .nii.gz files (same file paths as in the benchmark plan):
+#   renderer = SliceRenderer(loader=chunked_loader("/path/to/dataset/Volumes.zarr", "/path/to/dataset"))
+#   python shard_export.py export /path/to/dataset/benchmark_plan_segmentation_v1.0.json.gz --store /path/to/dataset/Volumes.zarr
+# Plan from the store (the planners take the same loader):
+#   BiometricVQA_BenchmarkPlannerSegmentation(..., volume_loader=chunked_loader(store_root, dataset_dir))
+# The store follows the Zarr v2 layout (one array per volume, zlib-compressed chunks, affine and
+# zooms in .zattrs), so it can also be opened with zarr.open(...) where zarr is installed.
+# =========================
+
+STORE_NAME = "Volumes.zarr"
+CHUNK_SIZE = 64
+COMPRESSION_LEVEL = 5
+# Memory budget of the decompressed chunks kept by each open volume
+CHUNK_CACHE_MB = 256
+
+
+def _array_name(rel_path):
+    """Name of a volume in the store: its path relative to the dataset folder, without extension"""
+    rel_path = rel_path.replace(os.sep, "/")
+    for ext in (".nii.gz", ".nii"):
+        if rel_path.endswith(ext):
+            return rel_path[: -len(ext)]
+    return rel_path
+
+
+def _write_json(path, obj):
+    with open(path, "w") as f:
+        json.dump(obj, f, indent=4)
+
+
+def _ensure_groups(store_root, array_name):
+    """Create the .zgroup files of the store and of every folder above the array"""
+    group_dir = store_root
+    for part in [""] + array_name.split("/")[:-1]:
+        group_dir = os.path.join(group_dir, part)
+        os.makedirs(group_dir, exist_ok=True)
+        zgroup = os.path.join(group_dir, ".zgroup")
+        if not os.path.exists(zgroup):
+            _write_json(zgroup, {"zarr_format": 2})
+
+
+def export_volume(file_path, store_root, rel_path, chunk_size=CHUNK_SIZE, level=COMPRESSION_LEVEL, overwrite=False):
+    """
+    Write one NIfTI volume to the store as a chunked array.
+    Chunks are cubes (chunk_size voxels along every axis), so a slice along any axis only touches one
+    layer of chunks. Chunks that are entirely zero are not written (read back as the fill value 0).
+    Returns the array folder.
+    """
+    array_name = _array_name(rel_path)
+    array_dir = os.path.join(store_root, *array_name.split("/"))
+    if os.path.exists(os.path.join(array_dir, ".zarray")) and not overwrite:
+        return array_dir
+
+    img = nib.load(str(file_path))
+    data = np.asanyarray(img.dataobj)
+    chunks = tuple(min(chunk_size, n) for n in data.shape)
+
+    _ensure_groups(store_root, array_name)
+    tmp_dir = f"{array_dir}.tmp{os.getpid()}_{threading.get_ident()}"
+    os.makedirs(tmp_dir)
+    _write_json(
+        os.path.join(tmp_dir, ".zarray"),
+        {
+            "zarr_format": 2,
+            "shape": list(data.shape),
+            "chunks": list(chunks),
+            "dtype": data.dtype.str,
+            "compressor": {"id": "zlib", "level": level},
+            "fill_value": 0,
+            "order": "C",
+            "filters": None,
+            "dimension_separator": ".",
+        },
+    )
+    _write_json(
+        os.path.join(tmp_dir, ".zattrs"),
+        {
+            "affine": img.affine.tolist(),
+            "zooms": [float(z) for z in img.header.get_zooms()],
+            "source": rel_path.replace(os.sep, "/"),
+        },
+    )
+
+    grid = [range(0, n, c) for n, c in zip(data.shape, chunks)]
+    for starts in itertools.product(*grid):
+        block = data[tuple(slice(s, s + c) for s, c in zip(starts, chunks))]
+        if not block.any():
+            continue
+        # Edge chunks are padded to the full chunk shape, as in Zarr
+        if block.shape != chunks:
+            block = np.pad(block, [(0, c - n) for n, c in zip(block.shape, chunks)])
+        key = ".".join(str(s // c) for s, c in zip(starts, chunks))
+        with open(os.path.join(tmp_dir, key), "wb") as f:
+            f.write(zlib.compress(np.ascontiguousarray(block).tobytes(), level))
+
+    if os.path.exists(array_dir):
+        shutil.rmtree(array_dir)
+    os.replace(tmp_dir, array_dir)
+    return array_dir
+
+
+def export_dataset(dataset_dir, store_root=None, chunk_size=CHUNK_SIZE, level=COMPRESSION_LEVEL, overwrite=False, num_workers=None):
+    """
+    Export the Images*/Masks* folders of a planned dataset to a chunked store, in parallel.
+    Volumes already in the store are skipped unless overwrite=True.
+    Returns the store root.
+    """
+    store_root = store_root or os.path.join(dataset_dir, STORE_NAME)
+    file_paths = []
+    for folder in sorted(glob.glob(os.path.join(dataset_dir, "Images*")) + glob.glob(os.path.join(dataset_dir, "Masks*"))):
+        if os.path.isdir(folder):
+            file_paths.extend(sorted(glob.glob(os.path.join(folder, "**", "*.nii*"), recursive=True)))
+    print(f"Exporting {len(file_paths)} volumes to {store_root}...")
+
+    os.makedirs(store_root, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=num_workers or os.cpu_count() or 1) as executor:
+        futures = {
+            executor.submit(
+                export_volume,
+                file_path,
+                store_root,
+                os.path.relpath(file_path, dataset_dir),
+                chunk_size,
+                level,
+                overwrite,
+            ): file_path
+            for file_path in file_paths
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+                print(f"Exported {futures[future]}")
+            except Exception as e:
+                print(f"Error exporting {futures[future]}: {str(e)}")
+    return store_root
+
+
+class ChunkedVolume(NDArrayOperatorsMixin):
+    """
+    Read-only volume of a chunked store that can be used in place of the decoded NIfTI array:
+    indexing with integers and slices only decompresses the chunks it touches (kept in an LRU of
+    chunk_cache_mb), other indexing (boolean masks, index arrays), numpy functions and operators
+    (np.unique, ==, ...) and astype work on the whole volume.
+    """
+
+    def __init__(self, array_dir, chunk_cache_mb=CHUNK_CACHE_MB):
+        self.array_dir = str(array_dir)
+        with open(os.path.join(self.array_dir, ".zarray")) as f:
+            meta = json.load(f)
+        attrs_path = os.path.join(self.array_dir, ".zattrs")
+        attrs = {}
+        if os.path.exists(attrs_path):
+            with open(attrs_path) as f:
+                attrs = json.load(f)
+        if meta["compressor"] is not None and meta["compressor"]["id"] != "zlib":
+            raise ValueError(f"Unsupported compressor {meta['compressor']['id']} in {self.array_dir}")
+        self.shape = tuple(meta["shape"])
+        self.chunks = tuple(meta["chunks"])
+        self.dtype = np.dtype(meta["dtype"])
+        self.fill_value = meta["fill_value"] or 0
+        self.compressed = meta["compressor"] is not None
+        self.separator = meta.get("dimension_separator", ".")
+        self.affine = np.array(attrs["affine"]) if "affine" in attrs else None
+        self.zooms = tuple(attrs["zooms"]) if "zooms" in attrs else None
+        chunk_bytes = int(np.prod(self.chunks)) * self.dtype.itemsize
+        self._max_chunks = max(1, int(chunk_cache_mb * 1024**2) // max(chunk_bytes, 1))
+        self._chunk_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        """Size of the decoded volume (as for the numpy array it stands for)"""
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _read_chunk(self, chunk_idx):
+        """Decompressed chunk, from the LRU of recently read chunks if possible"""
+        with self._lock:
+            if chunk_idx in self._chunk_cache:
+                self._chunk_cache.move_to_end(chunk_idx)
+                return self._chunk_cache[chunk_idx]
+        path = os.path.join(self.array_dir, self.separator.join(str(i) for i in chunk_idx))
+        if not os.path.exists(path):
+            chunk = np.full(self.chunks, self.fill_value, dtype=self.dtype)
+        else:
+            with open(path, "rb") as f:
+                buffer = f.read()
+            if self.compressed:
+                buffer = zlib.decompress(buffer)
+            chunk = np.frombuffer(buffer, dtype=self.dtype).reshape(self.chunks)
+        with self._lock:
+            self._chunk_cache[chunk_idx] = chunk
+            while len(self._chunk_cache) > self._max_chunks:
+                self._chunk_cache.popitem(last=False)
+        return chunk
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        # Boolean masks, index arrays, np.newaxis...: index the whole decoded volume
+        if not all(
+            k is Ellipsis or (isinstance(k, (slice, int, np.integer)) and not isinstance(k, bool))
+            for k in key
+        ):
+            return np.asarray(self)[key]
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1 :]
+        key = key + (slice(None),) * (self.ndim - len(key))
+        if len(key) != self.ndim:
+            raise IndexError(f"Too many indices for a {self.ndim}D volume")
+
+        # Bounding box of the request in voxels, then the chunks that cover it
+        ranges, squeeze = [], []
+        for axis, (k, n) in enumerate(zip(key, self.shape)):
+            if isinstance(k, slice):
+                ranges.append(range(*k.indices(n)))
+            else:
+                k = int(k) + n if k < 0 else int(k)
+                if not 0 <= k < n:
+                    raise IndexError(f"Index {k} out of range for axis {axis} with size {n}")
+                ranges.append(range(k, k + 1))
+                squeeze.append(axis)
+        if any(len(r) == 0 for r in ranges):
+            return np.empty([len(r) for r in ranges], dtype=self.dtype).squeeze(axis=tuple(squeeze))
+
+        lo = [min(r[0], r[-1]) for r in ranges]
+        hi = [max(r[0], r[-1]) + 1 for r in ranges]
+        box = np.empty([h - l for l, h in zip(lo, hi)], dtype=self.dtype)
+        chunk_grid = [range(l // c, (h - 1) // c + 1) for l, h, c in zip(lo, hi, self.chunks)]
+        for chunk_idx in itertools.product(*chunk_grid):
+            chunk = self._read_chunk(chunk_idx)
+            src, dst = [], []
+            for i, l, h, c in zip(chunk_idx, lo, hi, self.chunks):
+                start, stop = max(l, i * c), min(h, (i + 1) * c)
+                src.append(slice(start - i * c, stop - i * c))
+                dst.append(slice(start - l, stop - l))
+            box[tuple(dst)] = chunk[tuple(src)]
+
+        # Apply steps/direction of the request within the bounding box
+        result = box[tuple(slice(None, None, r.step) for r in ranges)]
+        return result.squeeze(axis=tuple(squeeze)) if squeeze else result
+
+    def astype(self, dtype, copy=True):
+        return np.asarray(self).astype(dtype, copy=copy)
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        return data if dtype is None else data.astype(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = tuple(np.asarray(x) if isinstance(x, ChunkedVolume) else x for x in inputs)
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+
+def open_volume(store_root, rel_path):
+    """Open a volume of the store by its path relative to the dataset folder (e.g. Images/case_001.nii.gz)"""
+    return ChunkedVolume(os.path.join(store_root, *_array_name(rel_path).split("/")))
+
+
+def chunked_loader(store_root, dataset_dir, fallback=_decode_volume):
+    """
+    Loader function for file paths of the dataset (as used by SliceRenderer(loader=...)):
+    loader(file_path) opens the volume from the store, or calls fallback(file_path) for files that are
+    not in the store (e.g. outside dataset_dir or exported later).
+    """
+    dataset_dir = os.path.abspath(dataset_dir)
+
+    def load(file_path):
+        rel_path = os.path.relpath(os.path.abspath(str(file_path)), dataset_dir)
+        array_dir = os.path.join(store_root, *_array_name(rel_path).split("/"))
+        if not rel_path.startswith("..") and os.path.exists(os.path.join(array_dir, ".zarray")):
+            return ChunkedVolume(array_dir)
+        return fallback(file_path)
+
+    return load
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export preprocessed datasets to a chunked volume store"
+    )
+
+    subparsers = parser.add_subparsers(dest="command", help="Command to run")
+
+    # Export command
+    export_parser = subparsers.add_parser(
+        "export", help="Export the Images*/Masks* folders of a dataset"
+    )
+    export_parser.add_argument("dataset_dir", help="Dataset folder")
+    export_parser.add_argument(
+        "--store",
+        default=None,
+        help=f"Store folder (default: <dataset_dir>/{STORE_NAME})",
+    )
+    export_parser.add_argument(
+        "--chunk",
+        type=int,
+        default=CHUNK_SIZE,
+        help=f"Chunk size in voxels along every axis (default: {CHUNK_SIZE})",
+    )
+    export_parser.add_argument(
+        "--level",
+        type=int,
+        default=COMPRESSION_LEVEL,
+        help=f"zlib compression level (default: {COMPRESSION_LEVEL})",
+    )
+    export_parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Export volumes that are already in the store again",
+    )
+    export_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: number of CPUs)",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_dataset(
+            args.dataset_dir,
+            args.store,
+            args.chunk,
+            args.level,
+            args.overwrite,
+            args.workers,
+        )
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
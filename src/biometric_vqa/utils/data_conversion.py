@@ -6,6 +6,9 @@ import nibabel as nib
 import numpy as np
 import cv2
 from pathlib import Path
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from biometric_vqa.utils.preprocess_utils import get_label_voxel_counts
 
 
 def _reorient_niigz_RASplus(nifti_path, output_path):
@@ -51,110 +54,246 @@ def reorient_niigz_RASplus_batch_inplace(dataset_dir):
         _reorient_niigz_RASplus(nii_file, nii_file)
 
 
-def convert_nrrd_to_nifti(input_dir, output_dir, recursive=False):
+# =========================
+# Batch conversion engine
+# =========================
+def _read_nrrd_as_nifti(input_file):
+    """Reader: load a .nrrd file as a NIfTI image"""
+    # Read NRRD file
+    data, header = nrrd.read(str(input_file))
+
+    # Get spacing (voxel size)
+    space_directions = header.get("space directions")
+    if space_directions is None:
+        raise ValueError(
+            "No space directions found in NRRD header. Cannot determine voxel size."
+        )
+    voxel_size = np.array(
+        [np.linalg.norm(dir) for dir in space_directions if dir is not None]
+    )
+
+    # Create affine matrix
+    affine = np.eye(4)
+    affine[:3, :3] = np.array(
+        [dir if dir is not None else [0, 0, 0] for dir in space_directions]
+    )
+    affine[:3, 3] = header.get("space origin", [0.0, 0.0, 0.0])
+
+    # Create NIfTI image and set voxel size
+    nifti_img = nib.Nifti1Image(data, affine)
+    nifti_img.header.set_zooms(voxel_size)
+    return nifti_img
+
+
+def _read_2d_image_as_nifti(
+    input_file,
+    slice_dim_type,
+    pseudo_voxel_size,
+    flip_dim0=False,
+    flip_dim1=False,
+    swap_dim01=False,
+    descrip=None,
+):
     """
-    Convert all .nrrd files in input_dir to .nii.gz files in output_dir
-
-    Args:
-        input_dir (str): Directory containing .nrrd files
-        output_dir (str): Directory to save .nii.gz files
-        recursive (bool): If True, search for .nrrd files in subdirectories
+    Reader: load a 2D image (BMP, JPG, ...) as a single-slice 3D NIfTI image in RAS+ orientation
+    (descrip, if given, is stored in the header description)
     """
-    # Create output directory if it doesn't exist
-    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    # Read 2D image
+    img_2d = cv2.imread(str(input_file), cv2.IMREAD_GRAYSCALE)
+    if img_2d is None:
+        raise ValueError(f"Cannot read image file {input_file}")
+
+    # Note: this is definitely correct, DO NOT SWAP the order of transformations
+    if flip_dim0:
+        img_2d = cv2.flip(img_2d, 0)  # 0 means flip vertically
+    if flip_dim1:
+        img_2d = cv2.flip(img_2d, 1)  # 1 means flip horizontally
+    if swap_dim01:  # this line should be AFTER flip_dim0 and flip_dim1
+        img_2d = np.swapaxes(img_2d, 0, 1)
+
+    # Create 3D array based on slice_dim_type
+    #   0: Sagittal (YZ plane), 1: Coronal (XZ plane), 2: Axial (XY plane)
+    img_3d = np.expand_dims(img_2d, axis=slice_dim_type)
+
+    # Create affine matrix for RAS+ orientation with the pseudo voxel size
+    pseudo_voxel_size = list(pseudo_voxel_size)
+    affine = np.diag(pseudo_voxel_size + [1])
 
-    # Get all .nrrd files in input directory
-    pattern = "**/*.nrrd" if recursive else "*.nrrd"
-    nrrd_files = list(Path(input_dir).glob(pattern))
+    # Create NIfTI image and set voxel size
+    nii_img = nib.Nifti1Image(img_3d, affine)
+    nii_img.header.set_zooms(pseudo_voxel_size)
+    if descrip is not None:
+        nii_img.header["descrip"] = descrip
+    return nii_img
 
-    print(f"Found {len(nrrd_files)} .nrrd files")
 
-    for nrrd_file in nrrd_files:
-        try:
-            print(f"Converting {nrrd_file.name}")
+def _write_nifti(image, output_file):
+    """Writer: save a nibabel image"""
+    nib.save(image, str(output_file))
 
-            # Read NRRD file
-            data, header = nrrd.read(str(nrrd_file))
 
-            # Get spacing (voxel size)
-            space_directions = header.get("space directions")
-            if space_directions is not None:
-                voxel_size = np.array(
-                    [np.linalg.norm(dir) for dir in space_directions if dir is not None]
-                )
-                print("Voxel dimensions calculated from spatial direction matrix")
-            else:
-                raise ValueError(
-                    "No space directions found in NRRD header. Cannot determine voxel size."
-                )
-
-            # Get origin
-            origin = header.get("space origin", [0.0, 0.0, 0.0])
-
-            # Create affine matrix
-            affine = np.eye(4)
-            if space_directions is not None:
-                affine[:3, :3] = np.array(
-                    [dir if dir is not None else [0, 0, 0] for dir in space_directions]
-                )
-            else:
-                affine[:3, :3] = np.diag(voxel_size)
-            affine[:3, 3] = origin
+def _write_sitk(image, output_file):
+    """Writer: save a SimpleITK image"""
+    sitk.WriteImage(image, str(output_file))
+
+
+def _read_sitk(input_file):
+    """Reader: load any format supported by SimpleITK (.mha, .nii, ...)"""
+    return sitk.ReadImage(str(input_file))
+
+
+def _convert_file(input_file, output_file, reader, writer):
+    """Worker: convert one file, returning an error message instead of raising"""
+    try:
+        writer(reader(input_file), output_file)
+        return None
+    except Exception as e:
+        return str(e)
 
-            # Create NIfTI image
-            nifti_img = nib.Nifti1Image(data, affine)
 
-            # Set additional header information
-            nifti_header = nifti_img.header
-            nifti_header.set_zooms(voxel_size)
+def _is_up_to_date(input_file, output_file):
+    """Check if output_file exists and is not older than input_file"""
+    return (
+        os.path.exists(output_file)
+        and os.path.getmtime(output_file) >= os.path.getmtime(input_file)
+    )
 
-            # Create output filename
-            output_file = Path(output_dir) / f"{nrrd_file.stem}.nii.gz"
 
-            # Save NIfTI file
-            nib.save(nifti_img, str(output_file))
-            print(f"Saved to {output_file}")
+def _conversion_options_descrip(slice_dim_type, pseudo_voxel_size, flip_dim0, flip_dim1, swap_dim01):
+    """Header description recording the options of a 2D image conversion"""
+    voxel_size = ",".join(f"{float(v):g}" for v in pseudo_voxel_size)
+    return (
+        f"2d2nii dim={slice_dim_type} vox={voxel_size} "
+        f"flip={int(bool(flip_dim0))}{int(bool(flip_dim1))} swap={int(bool(swap_dim01))}"
+    )
 
-        except Exception as e:
-            print(f"Error converting {nrrd_file.name}: {e}")
 
+def _is_up_to_date_with_options(input_file, output_file, descrip):
+    """Check if output_file is up to date and was written with the options recorded in descrip"""
+    if not _is_up_to_date(input_file, output_file):
+        return False
+    try:
+        header_descrip = nib.load(output_file).header["descrip"].item()
+    except Exception:
+        return False
+    return header_descrip.decode("utf-8", "replace") == descrip
 
-def convert_mha_to_nifti(input_dir, output_dir, recursive=False):
+
+def batch_convert(
+    input_files,
+    output_dir,
+    reader,
+    writer,
+    output_suffix=".nii.gz",
+    num_workers=None,
+    overwrite=False,
+    is_up_to_date=_is_up_to_date,
+):
     """
-    Convert all .mha files in input_dir to .nii.gz files in output_dir
+    Convert files in parallel with a pluggable reader and writer
 
     Args:
-        input_dir (str): Directory containing .mha files
-        output_dir (str): Directory to save .nii.gz files
-        recursive (bool): If True, search for .mha files in subdirectories
+        input_files (list): Paths to the files to convert
+        output_dir (str): Directory to save the converted files as <input stem><output_suffix>
+        reader (callable): Picklable function reading an input file and returning an image object
+        writer (callable): Picklable function writing an image object to an output file
+        output_suffix (str): Suffix of the output files (default: ".nii.gz")
+        num_workers (int, optional): Number of worker processes (default: number of CPUs)
+        overwrite (bool): If False, skip files whose output is up to date
+        is_up_to_date (callable): Check of (input file, output file) used to skip files (default: output newer than input)
+
+    Returns:
+        dict: {"converted": [output files], "skipped": [output files], "errors": {input file: error message}}
     """
     # Create output directory if it doesn't exist
     Path(output_dir).mkdir(parents=True, exist_ok=True)
 
-    # Get all .mha files in input directory
-    pattern = "**/*.mha" if recursive else "*.mha"
-    mha_files = list(Path(input_dir).glob(pattern))
+    results = {"converted": [], "skipped": [], "errors": {}}
+    jobs = []
+    for input_file in input_files:
+        output_file = str(Path(output_dir) / f"{Path(input_file).stem}{output_suffix}")
+        if not overwrite and is_up_to_date(input_file, output_file):
+            results["skipped"].append(output_file)
+        else:
+            jobs.append((str(input_file), output_file))
+    if results["skipped"]:
+        print(f"Skipping {len(results['skipped'])} files that are up to date")
+
+    num_workers = min(num_workers or os.cpu_count() or 1, max(len(jobs), 1))
+    if num_workers == 1:
+        errors = (_convert_file(i, o, reader, writer) for i, o in jobs)
+        outcomes = zip(jobs, errors)
+    else:
+        executor = ProcessPoolExecutor(max_workers=num_workers)
+        futures = {
+            executor.submit(_convert_file, i, o, reader, writer): (i, o)
+            for i, o in jobs
+        }
+        outcomes = ((futures[f], f.result()) for f in as_completed(futures))
+    try:
+        for idx, ((input_file, output_file), error) in enumerate(outcomes, 1):
+            if error is None:
+                print(f" - [{idx}/{len(jobs)}] Converted {Path(input_file).name}")
+                results["converted"].append(output_file)
+            else:
+                print(f" - [{idx}/{len(jobs)}] Failed {Path(input_file).name}")
+                results["errors"][input_file] = error
+    finally:
+        if num_workers > 1:
+            executor.shutdown()
 
-    print(f"Found {len(mha_files)} .mha files")
+    if results["errors"]:
+        print(f"\nFailed to convert {len(results['errors'])} files:")
+        for input_file, error in results["errors"].items():
+            print(f" - {input_file}: {error}")
+    return results
 
-    for mha_file in mha_files:
-        try:
-            # Read .mha file
-            print(f"Converting {mha_file.name}")
-            image = sitk.ReadImage(str(mha_file))
 
-            # Create output filename
-            output_file = Path(output_dir) / f"{mha_file.stem}.nii.gz"
+def convert_nrrd_to_nifti(input_dir, output_dir, recursive=False, num_workers=None):
+    """
+    Convert all .nrrd files in input_dir to .nii.gz files in output_dir
 
-            # Write as .nii.gz
-            sitk.WriteImage(image, str(output_file))
-            print(f"Saved to {output_file}")
+    Args:
+        input_dir (str): Directory containing .nrrd files
+        output_dir (str): Directory to save .nii.gz files
+        recursive (bool): If True, search for .nrrd files in subdirectories
+        num_workers (int, optional): Number of worker processes (default: number of CPUs)
 
-        except Exception as e:
-            print(f"Error converting {mha_file.name}: {e}")
+    Returns:
+        dict: Conversion results, see `batch_convert`
+    """
+    # Get all .nrrd files in input directory
+    pattern = "**/*.nrrd" if recursive else "*.nrrd"
+    nrrd_files = sorted(Path(input_dir).glob(pattern))
+    print(f"Found {len(nrrd_files)} .nrrd files")
+    return batch_convert(
+        nrrd_files, output_dir, _read_nrrd_as_nifti, _write_nifti, num_workers=num_workers
+    )
 
 
-def convert_nii_to_niigz(input_dir, output_dir, recursive=False):
+def convert_mha_to_nifti(input_dir, output_dir, recursive=False, num_workers=None):
+    """
+    Convert all .mha files in input_dir to .nii.gz files in output_dir
+
+    Args:
+        input_dir (str): Directory containing .mha files
+        output_dir (str): Directory to save .nii.gz files
+        recursive (bool): If True, search for .mha files in subdirectories
+        num_workers (int, optional): Number of worker processes (default: number of CPUs)
+
+    Returns:
+        dict: Conversion results, see `batch_convert`
+    """
+    # Get all .mha files in input directory
+    pattern = "**/*.mha" if recursive else "*.mha"
+    mha_files = sorted(Path(input_dir).glob(pattern))
+    print(f"Found {len(mha_files)} .mha files")
+    return batch_convert(
+        mha_files, output_dir, _read_sitk, _write_sitk, num_workers=num_workers
+    )
+
+
+def convert_nii_to_niigz(input_dir, output_dir, recursive=False, num_workers=None):
     """
     Convert all .nii files in input_dir to .nii.gz files in output_dir
 
@@ -162,31 +301,18 @@ def convert_nii_to_niigz(input_dir, output_dir, recursive=False):
         input_dir (str): Directory containing .nii files
         output_dir (str): Directory to save .nii.gz files
         recursive (bool): If True, search for .nii files in subdirectories
-    """
-    # Create output directory if it doesn't exist
-    Path(output_dir).mkdir(parents=True, exist_ok=True)
+        num_workers (int, optional): Number of worker processes (default: number of CPUs)
 
+    Returns:
+        dict: Conversion results, see `batch_convert`
+    """
     # Get all .nii files in input directory
     pattern = "**/*.nii" if recursive else "*.nii"
-    nii_files = list(Path(input_dir).glob(pattern))
-
+    nii_files = sorted(Path(input_dir).glob(pattern))
     print(f"Found {len(nii_files)} .nii files")
-
-    for nii_file in nii_files:
-        try:
-            # Read .nii file
-            print(f"Converting {nii_file.name}")
-            image = sitk.ReadImage(str(nii_file))
-
-            # Create output filename
-            output_file = Path(output_dir) / f"{nii_file.stem}.nii.gz"
-
-            # Write as .nii.gz
-            sitk.WriteImage(image, str(output_file))
-            print(f"Saved to {output_file}")
-
-        except Exception as e:
-            print(f"Error converting {nii_file.name}: {e}")
+    return batch_convert(
+        nii_files, output_dir, _read_sitk, _write_sitk, num_workers=num_workers
+    )
 
 
 def convert_mask_to_uint16_per_dir(mask_folder):
@@ -236,6 +362,209 @@ def convert_mask_to_uint16_per_dir(mask_folder):
         nib.save(new_img, mask_path)
 
 
+def _normalize_mask_niigz(mask_path, valid_labels=None, reorient2RAS=True):
+    """
+    Normalize a single mask file in place with one read and at most one write:
+    cast to uint16 (slope=1, intercept=0), reorient to RAS+ and check labels.
+
+    Args:
+        mask_path (str): Path to the mask file
+        valid_labels (array-like, optional): Allowed non-zero labels. If None, labels are not checked
+        reorient2RAS (bool): If True, reorient the mask to RAS+ orientation
+
+    Returns:
+        tuple: (rewritten, invalid_labels, label_counts)
+            - rewritten (bool): True if the file was rewritten, False if it already complied
+            - invalid_labels (list): Non-zero labels not found in valid_labels
+            - label_counts (dict): {label: voxel count}, empty if labels were not checked
+    """
+    orig_nii = nib.load(mask_path)
+    nii_header = orig_nii.header.copy()
+    # Check whether the file already complies
+    old_slope, old_inter = nii_header.get_slope_inter()
+    is_uint16 = nii_header.get_data_dtype() == np.uint16
+    is_unscaled = old_slope in (None, 1) and old_inter in (None, 0)
+    is_RAS = nib.aff2axcodes(orig_nii.affine) == ("R", "A", "S")
+    complies = is_uint16 and is_unscaled and (is_RAS or not reorient2RAS)
+    # Fast path: nothing to rewrite and nothing to check
+    if complies and valid_labels is None:
+        return False, [], {}
+    # Decode the data block once
+    if complies:
+        mask = np.asanyarray(orig_nii.dataobj)
+    else:
+        mask = np.asarray(orig_nii.dataobj).astype(np.uint16)
+    # Check labels
+    invalid_labels, label_counts = [], {}
+    if valid_labels is not None:
+        label_counts, _ = get_label_voxel_counts(mask)
+        valid_set = {int(label) for label in valid_labels} | {0}
+        invalid_labels = sorted(set(label_counts) - valid_set)
+    if complies:
+        return False, invalid_labels, label_counts
+    # Cast and reorient in memory, then write once
+    nii_header.set_data_dtype(np.uint16)
+    nii_header.set_slope_inter(1, 0)
+    new_img = nib.Nifti1Image(mask, orig_nii.affine, nii_header)
+    if reorient2RAS and not is_RAS:
+        new_img = nib.as_closest_canonical(new_img)
+    nib.save(new_img, mask_path)
+    return True, invalid_labels, label_counts
+
+
+def normalize_mask_per_dir(mask_folder, valid_labels=None, reorient2RAS=True):
+    """
+    Convert all .nii.gz mask files in a folder to uint16, reorient them to RAS+ and check their labels
+    in a single pass. Each mask is decoded once and written at most once; files that already comply are skipped.
+
+    Args:
+        mask_folder (str): Path to folder containing mask files
+        valid_labels (array-like, optional): Allowed non-zero labels. If None, labels are not checked
+        reorient2RAS (bool): If True, reorient masks to RAS+ orientation
+
+    Returns:
+        tuple: (invalid_files, label_voxel_counts)
+            - invalid_files (dict): {mask file path: invalid labels} for files with invalid labels
+            - label_voxel_counts (dict): {mask file path: {label: voxel count}} if labels were checked
+    """
+    # List all .nii.gz files in the mask folder
+    mask_files = sorted(f for f in os.listdir(mask_folder) if f.endswith(".nii.gz"))
+    total_files = len(mask_files)
+    print(f"Found {total_files} .nii.gz mask files to normalize")
+
+    invalid_files, label_voxel_counts = {}, {}
+    for i, mask_file in enumerate(mask_files):
+        mask_path = os.path.join(mask_folder, mask_file)
+        rewritten, invalid_labels, label_counts = _normalize_mask_niigz(
+            mask_path, valid_labels, reorient2RAS
+        )
+        if valid_labels is not None:
+            label_voxel_counts[mask_path] = label_counts
+        status = "normalized" if rewritten else "already compliant"
+        print(f" - [{i+1}/{total_files}] {mask_file}: {status}")
+        if invalid_labels:
+            print(f"   Found invalid labels: {invalid_labels}")
+            invalid_files[mask_path] = invalid_labels
+    return invalid_files, label_voxel_counts
+
+
+def _transplant_header_to_mask(image_path, mask_path):
+    """
+    Give a mask the header of its image (affine, qform/sform, zooms, units) and store it as
+    unscaled uint16, with one read of the mask data and one write. The image data is not read.
+    Masks without an image are only converted to uint16.
+
+    Returns:
+        tuple: (mask_path, message)
+    """
+    if image_path is None:
+        rewritten, _, _ = _normalize_mask_niigz(mask_path, reorient2RAS=False)
+        return mask_path, "no image, converted to uint16" if rewritten else "no image, already uint16"
+
+    img = nib.load(image_path)
+    mask = nib.load(mask_path)
+    message = "header copied"
+    if mask.shape != img.shape[: len(mask.shape)]:
+        message += f" (warning: mask shape {mask.shape} != image shape {img.shape})"
+    # Decode in the stored integer dtype (float only if the mask is scaled), never via get_fdata()
+    mask_data = np.asanyarray(mask.dataobj).astype(np.uint16, copy=False)
+
+    nii_header = img.header.copy()
+    nii_header.set_data_dtype(np.uint16)
+    nii_header.set_slope_inter(1, 0)
+    nib.save(nib.Nifti1Image(mask_data, img.affine, nii_header), mask_path)
+    return mask_path, message
+
+
+def transplant_image_headers_to_masks(image_dir, mask_dir, num_workers=None):
+    """
+    Copy the NIfTI header of each image to the mask with the same file name and convert the mask to uint16
+    (slope=1, intercept=0) in a single parallel pass. Replaces copying the header with
+    nib.Nifti1Image(mask.get_fdata(), img.affine, img.header) followed by convert_mask_to_uint16_per_dir.
+
+    Args:
+        image_dir (str): Folder with the .nii.gz images
+        mask_dir (str): Folder with the .nii.gz masks (modified in place)
+        num_workers (int, optional): Number of worker processes (default: number of CPUs)
+    """
+    mask_files = sorted(f for f in os.listdir(mask_dir) if f.endswith(".nii.gz"))
+    image_paths = [
+        os.path.join(image_dir, f) if os.path.exists(os.path.join(image_dir, f)) else None
+        for f in mask_files
+    ]
+    mask_paths = [os.path.join(mask_dir, f) for f in mask_files]
+    total_files = len(mask_paths)
+    print(f"Found {total_files} .nii.gz mask files to update")
+
+    num_workers = num_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [
+            executor.submit(_transplant_header_to_mask, image_path, mask_path)
+            for image_path, mask_path in zip(image_paths, mask_paths)
+        ]
+        for i, future in enumerate(as_completed(futures), 1):
+            mask_path, message = future.result()
+            print(f" - [{i}/{total_files}] {os.path.basename(mask_path)}: {message}")
+
+
+def _convert_2d_images_to_niigz(
+    image_files,
+    niigz_dir,
+    slice_dim_type,
+    pseudo_voxel_size,
+    flip_dim0,
+    flip_dim1,
+    swap_dim01,
+    num_workers,
+):
+    """Shared implementation of convert_bmp_to_niigz and convert_jpg_to_niigz"""
+    # Validate slice_dim_type
+    if slice_dim_type not in [0, 1, 2]:
+        raise ValueError("slice_dim_type must be 0, 1, or 2")
+    if len(image_files) == 0:
+        raise FileNotFoundError("No image files found to convert")
+
+    # Outputs written with other options are converted again, whatever their timestamps
+    options_descrip = _conversion_options_descrip(
+        slice_dim_type, pseudo_voxel_size, flip_dim0, flip_dim1, swap_dim01
+    )
+    # Reader with the slice orientation and flipping options
+    reader = partial(
+        _read_2d_image_as_nifti,
+        slice_dim_type=slice_dim_type,
+        pseudo_voxel_size=list(pseudo_voxel_size),
+        flip_dim0=flip_dim0,
+        flip_dim1=flip_dim1,
+        swap_dim01=swap_dim01,
+        descrip=options_descrip,
+    )
+    results = batch_convert(
+        image_files,
+        niigz_dir,
+        reader,
+        _write_nifti,
+        num_workers=num_workers,
+        is_up_to_date=partial(_is_up_to_date_with_options, descrip=options_descrip),
+    )
+
+    if results["errors"]:
+        print(
+            f"\nWarning: {len(results['errors'])} of {len(image_files)} image files were not converted\n"
+        )
+
+    # Original image dimensions (height, width), from the header of the first successful output
+    outputs = set(results["converted"]) | set(results["skipped"])
+    for image_file in image_files:
+        output_file = str(Path(niigz_dir) / f"{Path(image_file).stem}.nii.gz")
+        if output_file in outputs:
+            shape_2d = [n for i, n in enumerate(nib.load(output_file).shape) if i != slice_dim_type]
+            img_size_dim0, img_size_dim1 = shape_2d[::-1] if swap_dim01 else shape_2d
+            return img_size_dim0, img_size_dim1
+    raise RuntimeError(
+        f"None of the {len(image_files)} image files could be converted, see the errors above"
+    )
+
+
 def convert_bmp_to_niigz(
     bmp_dir,
     niigz_dir,
@@ -244,6 +573,7 @@ def convert_bmp_to_niigz(
     flip_dim0=False,
     flip_dim1=False,
     swap_dim01=False,
+    num_workers=None,
 ):
     """
     Convert BMP image files to NIfTI (.nii.gz) format.
@@ -260,76 +590,23 @@ def convert_bmp_to_niigz(
         flip_dim0 (bool, optional): If True, flip image along dimension 0. Defaults to False.
         flip_dim1 (bool, optional): If True, flip image along dimension 1. Defaults to False.
         swap_dim01 (bool, optional): If True, swap dimensions 0 and 1. Defaults to False.
+        num_workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
     Returns:
         tuple: Original image dimensions (height, width) of the first converted BMP
     """
-
-    # Validate slice_dim_type
-    if slice_dim_type not in [0, 1, 2]:
-        raise ValueError("slice_dim_type must be 0, 1, or 2")
-
-    # Convert pseudo_voxel_size to list if it's not already
-    pseudo_voxel_size = list(pseudo_voxel_size)
-
-    # Create output directory
-    Path(niigz_dir).mkdir(parents=True, exist_ok=True)
-
     # Get all BMP files
-    bmp_files = list(Path(bmp_dir).glob("*.bmp"))
+    bmp_files = sorted(Path(bmp_dir).glob("*.bmp"))
     print(f"Found {len(bmp_files)} .bmp files")
-
-    for bmp_file in bmp_files:
-        try:
-            print(f"Converting {bmp_file.name}")
-
-            # Read BMP image
-            img_2d = cv2.imread(str(bmp_file), cv2.IMREAD_GRAYSCALE)
-            img_size_dim0, img_size_dim1 = img_2d.shape
-
-            # Note: this is definitely correct, DO NOT SWAP the order of transformations
-            if flip_dim0:
-                img_2d = cv2.flip(img_2d, 0)  # 0 means flip vertically
-            if flip_dim1:
-                img_2d = cv2.flip(img_2d, 1)  # 1 means flip horizontally
-            if swap_dim01:  # this line should be AFTER slip_x and slip_y
-                img_2d = np.swapaxes(img_2d, 0, 1)
-
-            # Create 3D array based on slice_dim_type
-            if slice_dim_type == 0:  # Sagittal (YZ plane)
-                img_3d = np.zeros(
-                    (1, img_2d.shape[0], img_2d.shape[1]), dtype=img_2d.dtype
-                )
-                img_3d[0, :, :] = img_2d
-            elif slice_dim_type == 1:  # Coronal (XZ plane)
-                img_3d = np.zeros(
-                    (img_2d.shape[0], 1, img_2d.shape[1]), dtype=img_2d.dtype
-                )
-                img_3d[:, 0, :] = img_2d
-            else:  # Axial (XY plane)
-                img_3d = np.zeros(
-                    (img_2d.shape[0], img_2d.shape[1], 1), dtype=img_2d.dtype
-                )
-                img_3d[:, :, 0] = img_2d
-
-            # Create affine matrix for RAS+ orientation
-            # Set voxel size to 0.1mm in all dimensions
-            affine = np.diag(pseudo_voxel_size + [1])
-
-            # Create NIfTI image
-            nii_img = nib.Nifti1Image(img_3d, affine)
-
-            # Set header information
-            nii_img.header.set_zooms(pseudo_voxel_size)
-
-            # Save as NIfTI file
-            output_file = Path(niigz_dir) / f"{bmp_file.stem}.nii.gz"
-            nib.save(nii_img, str(output_file))
-            print(f"Saved to {output_file}")
-
-        except Exception as e:
-            print(f"Error converting {bmp_file.name}: {e}")
-
-    return img_size_dim0, img_size_dim1
+    return _convert_2d_images_to_niigz(
+        bmp_files,
+        niigz_dir,
+        slice_dim_type,
+        pseudo_voxel_size,
+        flip_dim0,
+        flip_dim1,
+        swap_dim01,
+        num_workers,
+    )
 
 
 def convert_jpg_to_niigz(
@@ -340,6 +617,7 @@ def convert_jpg_to_niigz(
     flip_dim0=False,
     flip_dim1=False,
     swap_dim01=False,
+    num_workers=None,
 ):
     """
     Convert JPG image files to NIfTI (.nii.gz) format.
@@ -356,73 +634,20 @@ def convert_jpg_to_niigz(
         flip_dim0 (bool, optional): If True, flip image along dimension 0. Defaults to False.
         flip_dim1 (bool, optional): If True, flip image along dimension 1. Defaults to False.
         swap_dim01 (bool, optional): If True, swap dimensions 0 and 1. Defaults to False.
+        num_workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
     Returns:
         tuple: Original image dimensions (height, width) of the first converted JPG
     """
-
-    # Validate slice_dim_type
-    if slice_dim_type not in [0, 1, 2]:
-        raise ValueError("slice_dim_type must be 0, 1, or 2")
-
-    # Convert pseudo_voxel_size to list if it's not already
-    pseudo_voxel_size = list(pseudo_voxel_size)
-
-    # Create output directory
-    Path(niigz_dir).mkdir(parents=True, exist_ok=True)
-
     # Get all JPG files
-    jpg_files = list(Path(jpg_dir).glob("*.jpg"))
+    jpg_files = sorted(Path(jpg_dir).glob("*.jpg"))
     print(f"Found {len(jpg_files)} .jpg files")
-
-    for jpg_file in jpg_files:
-        try:
-            print(f"Converting {jpg_file.name}")
-
-            # Read JPG image
-            img_2d = cv2.imread(str(jpg_file), cv2.IMREAD_GRAYSCALE)
-            img_size_dim0, img_size_dim1 = img_2d.shape
-
-            # Note: this is definitely correct, DO NOT SWAP the order of transformations
-            if flip_dim0:
-                img_2d = cv2.flip(img_2d, 0)  # 0 means flip vertically
-            if flip_dim1:
-                img_2d = cv2.flip(img_2d, 1)  # 1 means flip horizontally
-            if swap_dim01:  # this line should be AFTER flip_dim0 and flip_dim1
-                img_2d = np.swapaxes(img_2d, 0, 1)
-
-            # Create 3D array based on slice_dim_type
-            if slice_dim_type == 0:  # Sagittal (YZ plane)
-                img_3d = np.zeros(
-                    (1, img_2d.shape[0], img_2d.shape[1]), dtype=img_2d.dtype
-                )
-                img_3d[0, :, :] = img_2d
-            elif slice_dim_type == 1:  # Coronal (XZ plane)
-                img_3d = np.zeros(
-                    (img_2d.shape[0], 1, img_2d.shape[1]), dtype=img_2d.dtype
-                )
-                img_3d[:, 0, :] = img_2d
-            else:  # Axial (XY plane)
-                img_3d = np.zeros(
-                    (img_2d.shape[0], img_2d.shape[1], 1), dtype=img_2d.dtype
-                )
-                img_3d[:, :, 0] = img_2d
-
-            # Create affine matrix for RAS+ orientation
-            # Set voxel size to 0.1mm in all dimensions
-            affine = np.diag(pseudo_voxel_size + [1])
-
-            # Create NIfTI image
-            nii_img = nib.Nifti1Image(img_3d, affine)
-
-            # Set header information
-            nii_img.header.set_zooms(pseudo_voxel_size)
-
-            # Save as NIfTI file
-            output_file = Path(niigz_dir) / f"{jpg_file.stem}.nii.gz"
-            nib.save(nii_img, str(output_file))
-            print(f"Saved to {output_file}")
-
-        except Exception as e:
-            print(f"Error converting {jpg_file.name}: {e}")
-
-    return img_size_dim0, img_size_dim1
+    return _convert_2d_images_to_niigz(
+        jpg_files,
+        niigz_dir,
+        slice_dim_type,
+        pseudo_voxel_size,
+        flip_dim0,
+        flip_dim1,
+        swap_dim01,
+        num_workers,
+    )
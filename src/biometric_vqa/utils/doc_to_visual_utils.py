@@ -1,8 +1,110 @@
+from functools import lru_cache
 from PIL import ImageDraw, ImageFont, Image
 import numpy as np
 import cv2
 
 
+SCALES_MM = [1, 2, 5, 10, 15, 20, 25, 30, 40, 50, 60, 70, 80, 90, 100]
+
+
+@lru_cache(maxsize=None)
+def _get_font(size=14):
+    """Font of the scale and orientation labels (looked up once per size)"""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except IOError:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=4096)
+def _get_appropriate_scale(pixel_size, img_size, init_scale=10):
+    scale_pixels_num = int(init_scale / pixel_size)
+    min_pixels = img_size * 0.05
+    max_pixels = img_size * 0.25
+
+    if scale_pixels_num < min_pixels:
+        for scale in SCALES_MM:
+            if scale > init_scale:
+                return _get_appropriate_scale(pixel_size, img_size, scale)
+    elif scale_pixels_num > max_pixels:
+        for scale in reversed(SCALES_MM):
+            if scale < init_scale:
+                return _get_appropriate_scale(pixel_size, img_size, scale)
+
+    return init_scale, scale_pixels_num
+
+
+@lru_cache(maxsize=4096)
+def _scale_bar_geometry(img_width, img_height, pixel_sizes):
+    """Scale bar length in mm and its (start, end) corners in PIL xy coordinates"""
+    # Find which dimension is smaller
+    #   In the 2D array: height = first dimension, width = second dimension
+    #   In pixel_sizes: [height_scale, width_scale]
+    #   In PIL image: img_width = second dimension, img_height = first dimension
+    if img_height < img_width:  # Height is the smaller dimension
+        pixel_size_min = pixel_sizes[0]  # Height pixel size
+        image_dim_min = img_height
+    else:  # Width is the smaller dimension
+        pixel_size_min = pixel_sizes[1]  # Width pixel size
+        image_dim_min = img_width
+
+    # Calculate appropriate scale
+    scale_mm, scale_pixels_min = _get_appropriate_scale(
+        pixel_size_min, image_dim_min, init_scale=10
+    )
+
+    # Calculate scale for the other dimension
+    if img_height < img_width:
+        scale_pixels_height = scale_pixels_min
+        scale_pixels_width = int(scale_mm / pixel_sizes[1])
+    else:
+        scale_pixels_width = scale_pixels_min
+        scale_pixels_height = int(scale_mm / pixel_sizes[0])
+
+    # Position for scale bar (5% from the edge)
+    start_x, start_y = int(img_width * 0.05), int(img_height * 0.05)
+    end_x, end_y = start_x + scale_pixels_width, start_y + scale_pixels_height
+    return scale_mm, (start_x, start_y), (end_x, end_y)
+
+
+def _draw_scale_and_orientation(draw, img_width, img_height, pixel_sizes, slice_dim, orientation, fill):
+    """Draw the scale bar, its length and (optionally) the orientation labels"""
+    scale_mm, (start_x, start_y), (end_x, end_y) = _scale_bar_geometry(
+        img_width, img_height, tuple(pixel_sizes)
+    )
+
+    # Draw scale bar (white lines)
+    line_width = 2
+    # Draw horizontal line
+    draw.line(
+        [(start_x, start_y), (end_x, start_y)],
+        fill=fill,
+        width=line_width,
+    )
+    # Draw vertical line
+    draw.line(
+        [(start_x, start_y), (start_x, end_y)],
+        fill=fill,
+        width=line_width,
+    )
+
+    # Add scale text
+    font = _get_font(14)
+    draw.text((start_x + 5, start_y + 5), f"{scale_mm} mm", fill=fill, font=font)
+
+    # Add orientation labels based on slice_dim
+    if orientation:
+        if slice_dim == 0:
+            draw.text((start_x, end_y + 5), "Anterior", fill=fill, font=font)
+            draw.text((end_x + 5, start_y), "Superior", fill=fill, font=font)
+        elif slice_dim == 1:
+            draw.text((start_x, end_y + 5), "Right", fill=fill, font=font)
+            draw.text((end_x + 5, start_y), "Superior", fill=fill, font=font)
+        else:
+            draw.text((start_x, end_y + 5), "Right", fill=fill, font=font)
+            draw.text((end_x + 5, start_y), "Anterior", fill=fill, font=font)
+
+
 def add_landmarks_and_line_overlay(pil_img, p1_coords, p2_coords):
     """
     Add landmarks (points) and a line connecting them to an image.
@@ -154,82 +256,9 @@ def add_scale_label(pil_img, pixel_sizes, slice_dim):
 
     # Get image dimensions - in PIL, size returns (width, height)
     img_width, img_height = pil_img.size
-
-    # Define a class with the _get_appropriate_scale method
-    class ScaleCalculator:
-        def _get_appropriate_scale(self, pixel_size, img_size, init_scale=10):
-            scales = [1, 2, 5, 10, 15, 20, 25, 30, 40, 50, 60, 70, 80, 90, 100]
-            scale_pixels_num = int(init_scale / pixel_size)
-            min_pixels = img_size * 0.05
-            max_pixels = img_size * 0.25
-
-            if scale_pixels_num < min_pixels:
-                for scale in scales:
-                    if scale > init_scale:
-                        return self._get_appropriate_scale(pixel_size, img_size, scale)
-            elif scale_pixels_num > max_pixels:
-                for scale in reversed(scales):
-                    if scale < init_scale:
-                        return self._get_appropriate_scale(pixel_size, img_size, scale)
-
-            return init_scale, scale_pixels_num
-
-    scale_calculator = ScaleCalculator()
-
-    # Find which dimension is smaller
-    #   In the 2D array: height = first dimension, width = second dimension
-    #   In pixel_sizes: [height_scale, width_scale]
-    #   In PIL image: img_width = second dimension, img_height = first dimension
-    if img_height < img_width:  # Height is the smaller dimension
-        pixel_size_min = pixel_sizes[0]  # Height pixel size
-        image_dim_min = img_height
-    else:  # Width is the smaller dimension
-        pixel_size_min = pixel_sizes[1]  # Width pixel size
-        image_dim_min = img_width
-
-    # Calculate appropriate scale
-    scale_mm, scale_pixels_min = scale_calculator._get_appropriate_scale(
-        pixel_size_min, image_dim_min, init_scale=10
+    _draw_scale_and_orientation(
+        draw, img_width, img_height, pixel_sizes, slice_dim, False, (255, 255, 255)
     )
-
-    # Calculate scale for the other dimension
-    if img_height < img_width:
-        scale_pixels_height = scale_pixels_min
-        scale_pixels_width = int(scale_mm / pixel_sizes[1])
-    else:
-        scale_pixels_width = scale_pixels_min
-        scale_pixels_height = int(scale_mm / pixel_sizes[0])
-
-    # Position for scale bar (5% from the edge)
-    start_x, start_y = int(img_width * 0.05), int(img_height * 0.05)
-    end_x, end_y = start_x + scale_pixels_width, start_y + scale_pixels_height
-
-    # Draw scale bar (white lines)
-    line_width = 2
-    # Draw horizontal line
-    draw.line(
-        [(start_x, start_y), (end_x, start_y)],
-        fill=(255, 255, 255),
-        width=line_width,
-    )
-    # Draw vertical line
-    draw.line(
-        [(start_x, start_y), (start_x, end_y)],
-        fill=(255, 255, 255),
-        width=line_width,
-    )
-
-    # Set text font
-    try:
-        font = ImageFont.truetype("arial.ttf", 14)
-    except IOError:
-        font = ImageFont.load_default()
-
-    # Add scale text
-    draw.text(
-        (start_x + 5, start_y + 5), f"{scale_mm} mm", fill=(255, 255, 255), font=font
-    )
-
     return pil_img
 
 
@@ -239,92 +268,160 @@ def add_scale_and_orientation_label(pil_img, pixel_sizes, slice_dim):
 
     # Get image dimensions - in PIL, size returns (width, height)
     img_width, img_height = pil_img.size
+    _draw_scale_and_orientation(
+        draw, img_width, img_height, pixel_sizes, slice_dim, True, (255, 255, 255)
+    )
+    return pil_img
 
-    # Define a class with the _get_appropriate_scale method
-    class ScaleCalculator:
-        def _get_appropriate_scale(self, pixel_size, img_size, init_scale=10):
-            scales = [1, 2, 5, 10, 15, 20, 25, 30, 40, 50, 60, 70, 80, 90, 100]
-            scale_pixels_num = int(init_scale / pixel_size)
-            min_pixels = img_size * 0.05
-            max_pixels = img_size * 0.25
 
-            if scale_pixels_num < min_pixels:
-                for scale in scales:
-                    if scale > init_scale:
-                        return self._get_appropriate_scale(pixel_size, img_size, scale)
-            elif scale_pixels_num > max_pixels:
-                for scale in reversed(scales):
-                    if scale < init_scale:
-                        return self._get_appropriate_scale(pixel_size, img_size, scale)
+# =========================
+# Batched overlays
+# The functions below work in place on a stack of RGB images (uint8 array of shape (N, H, W, 3)),
+# without PIL round-trips where possible, and return the stack. The results are identical to the
+# single-image functions above.
+# =========================
 
-            return init_scale, scale_pixels_num
 
-    scale_calculator = ScaleCalculator()
+def slices_to_rgb_batch(slices):
+    """Min-max normalize a stack of 2D slices (N, H, W) to 0-255 and convert to RGB (N, H, W, 3)"""
+    slices = np.asarray(slices, dtype=np.float32)
+    vmin = slices.min(axis=(1, 2), keepdims=True)
+    vrange = slices.max(axis=(1, 2), keepdims=True) - vmin
+    scale = np.divide(255.0, vrange, out=np.zeros_like(vrange), where=vrange > 0)
+    gray = ((slices - vmin) * scale).astype(np.uint8)
+    return np.repeat(gray[..., None], 3, axis=-1)
 
-    # Find which dimension is smaller
-    #   In the 2D array: height = first dimension, width = second dimension
-    #   In pixel_sizes: [height_scale, width_scale]
-    #   In PIL image: img_width = second dimension, img_height = first dimension
-    if img_height < img_width:  # Height is the smaller dimension
-        pixel_size_min = pixel_sizes[0]  # Height pixel size
-        image_dim_min = img_height
-    else:  # Width is the smaller dimension
-        pixel_size_min = pixel_sizes[1]  # Width pixel size
-        image_dim_min = img_width
 
-    # Calculate appropriate scale
-    scale_mm, scale_pixels_min = scale_calculator._get_appropriate_scale(
-        pixel_size_min, image_dim_min, init_scale=10
-    )
+def add_mask_overlay_solid_batch(images, masks):
+    """
+    Batched add_mask_overlay_solid: blend green with alpha mask * 64 into every image.
+    Uses the integer arithmetic of PIL's alpha_composite over an opaque image, so the result is identical.
+    """
+    alpha = (np.asarray(masks) * 64).astype(np.uint8).astype(np.uint32)[..., None]
+    green = np.array([0, 255, 0], dtype=np.uint32)
+    # PIL: coef1 = a * 128, coef2 = (255 - a) * 128 for an opaque destination (7 bits of precision)
+    tmp = green * alpha * 128 + images.astype(np.uint32) * ((255 - alpha) * 128) + (0x80 << 7)
+    images[...] = ((((tmp >> 8) + tmp) >> 8) >> 7).astype(np.uint8)
+    return images
+
+
+def add_mask_overlay_contour_batch(images, masks):
+    """Batched add_mask_overlay_contour: draw the green external contours of every mask in place"""
+    masks = np.asarray(masks).astype(np.uint8)
+    for image, mask in zip(images, masks):
+        if not mask.any():
+            continue
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        cv2.drawContours(image, contours, -1, (0, 255, 0), 2)
+    return images
+
+
+def add_bbox_overlay_batch(images, bboxes):
+    """
+    Batched add_bbox_overlay: draw green 2-pixel box outlines (inside the box, like PIL) in place.
+    bboxes: one list of (bbox_min_coords, bbox_max_coords) per image, in [dim0, dim1] coordinates.
+    """
+    green = np.array([0, 255, 0], dtype=np.uint8)
+    height, width = images.shape[1:3]
+    for image, image_bboxes in zip(images, bboxes):
+        for bbox_min_coords, bbox_max_coords in image_bboxes:
+            y_min, x_min = (int(c) for c in bbox_min_coords)
+            y_max, x_max = (int(c) for c in bbox_max_coords)
+            if y_max - y_min < 3 or x_max - x_min < 3:
+                # Boxes thinner than both outlines: PIL has its own rules, draw this one with PIL
+                y0, x0 = max(y_min - 2, 0), max(x_min - 2, 0)
+                patch = Image.fromarray(image[y0 : y_max + 3, x0 : x_max + 3])
+                add_bbox_overlay(patch, (y_min - y0, x_min - x0), (y_max - y0, x_max - x0))
+                image[y0 : y_max + 3, x0 : x_max + 3] = np.asarray(patch)
+                continue
+            y0, y1 = max(y_min, 0), min(y_max + 1, height)
+            x0, x1 = max(x_min, 0), min(x_max + 1, width)
+            image[max(y_min, 0) : max(min(y_min + 2, y1), 0), x0:x1] = green
+            image[max(y_max - 1, y0) : y1, x0:x1] = green
+            image[y0:y1, max(x_min, 0) : max(min(x_min + 2, x1), 0)] = green
+            image[y0:y1, max(x_max - 1, x0) : x1] = green
+    return images
+
+
+def add_landmarks_and_line_overlay_batch(images, landmarks):
+    """
+    Batched add_landmarks_and_line_overlay: draw a green line and two red points per landmark pair in place.
+    landmarks: one list of (p1_coords, p2_coords) per image, in [dim0, dim1] coordinates.
+    Drawn with PIL (same rasterization as the single-image function) on the images that have landmarks.
+    """
+    for image, image_landmarks in zip(images, landmarks):
+        if not image_landmarks:
+            continue
+        pil_img = Image.fromarray(image)
+        for p1_coords, p2_coords in image_landmarks:
+            pil_img = add_landmarks_and_line_overlay(pil_img, p1_coords, p2_coords)
+        image[...] = np.asarray(pil_img)
+    return images
 
-    # Calculate scale for the other dimension
-    if img_height < img_width:
-        scale_pixels_height = scale_pixels_min
-        scale_pixels_width = int(scale_mm / pixel_sizes[1])
-    else:
-        scale_pixels_width = scale_pixels_min
-        scale_pixels_height = int(scale_mm / pixel_sizes[0])
 
-    # Position for scale bar (5% from the edge)
-    start_x, start_y = int(img_width * 0.05), int(img_height * 0.05)
-    end_x, end_y = start_x + scale_pixels_width, start_y + scale_pixels_height
+class _CoverageDraw:
+    """ImageDraw stand-in recording the coverage (0-255) of each drawing call as a separate layer"""
 
-    # Draw scale bar (white lines)
-    line_width = 2
-    # Draw horizontal line
-    draw.line(
-        [(start_x, start_y), (end_x, start_y)],
-        fill=(255, 255, 255),
-        width=line_width,
-    )
-    # Draw vertical line
-    draw.line(
-        [(start_x, start_y), (start_x, end_y)],
-        fill=(255, 255, 255),
-        width=line_width,
-    )
+    def __init__(self, size):
+        self.size = size
+        self.layers = []
 
-    # Set text font
-    try:
-        font = ImageFont.truetype("arial.ttf", 14)
-    except IOError:
-        font = ImageFont.load_default()
+    def _layer(self, method, *args, **kwargs):
+        coverage = Image.new("L", self.size, 0)
+        kwargs["fill"] = 255
+        getattr(ImageDraw.Draw(coverage), method)(*args, **kwargs)
+        self.layers.append(np.asarray(coverage))
 
-    # Add scale text
-    draw.text(
-        (start_x + 5, start_y + 5), f"{scale_mm} mm", fill=(255, 255, 255), font=font
-    )
+    def line(self, *args, **kwargs):
+        self._layer("line", *args, **kwargs)
 
-    # Add orientation labels based on slice_dim
-    label_padding = 10
-    if slice_dim == 0:
-        draw.text((start_x, end_y + 5), "Anterior", fill=(255, 255, 255), font=font)
-        draw.text((end_x + 5, start_y), "Superior", fill=(255, 255, 255), font=font)
-    elif slice_dim == 1:
-        draw.text((start_x, end_y + 5), "Right", fill=(255, 255, 255), font=font)
-        draw.text((end_x + 5, start_y), "Superior", fill=(255, 255, 255), font=font)
-    else:
-        draw.text((start_x, end_y + 5), "Right", fill=(255, 255, 255), font=font)
-        draw.text((end_x + 5, start_y), "Anterior", fill=(255, 255, 255), font=font)
+    def text(self, *args, **kwargs):
+        self._layer("text", *args, **kwargs)
 
-    return pil_img
+
+@lru_cache(maxsize=256)
+def _scale_label_coverage(img_width, img_height, pixel_sizes, slice_dim, orientation):
+    """
+    Coverage layers of the scale bar and labels for one image size, rendered once.
+    Returns the bounding box (y0, y1, x0, x1) of all layers and the layers cropped to it, in drawing order.
+    """
+    draw = _CoverageDraw((img_width, img_height))
+    _draw_scale_and_orientation(
+        draw, img_width, img_height, pixel_sizes, slice_dim, orientation, 255
+    )
+    rows, cols = np.nonzero(np.max(draw.layers, axis=0))
+    if len(rows) == 0:
+        return (0, 0, 0, 0), []
+    box = (rows.min(), rows.max() + 1, cols.min(), cols.max() + 1)
+    layers = [
+        layer[box[0] : box[1], box[2] : box[3]].astype(np.uint32)[..., None]
+        for layer in draw.layers
+        if layer[box[0] : box[1], box[2] : box[3]].any()
+    ]
+    return box, layers
+
+
+def add_scale_label_batch(images, pixel_sizes, slice_dim, orientation=False):
+    """
+    Batched add_scale_label (add_scale_and_orientation_label with orientation=True).
+    The label of each distinct (image size, pixel sizes) is rendered once; its drawing calls are
+    blended in white one after the other with PIL's integer blend, so the result is identical.
+    pixel_sizes: one (height, width) pair for all images, or one pair per image.
+    """
+    height, width = images.shape[1:3]
+    pixel_sizes = np.asarray(pixel_sizes)
+    if pixel_sizes.ndim == 1:
+        pixel_sizes = np.broadcast_to(pixel_sizes, (len(images), 2))
+    for image, sizes in zip(images, pixel_sizes):
+        (y0, y1, x0, x1), layers = _scale_label_coverage(
+            width, height, tuple(sizes.tolist()), int(slice_dim), bool(orientation)
+        )
+        if not layers:
+            continue
+        region = image[y0:y1, x0:x1].astype(np.uint32)
+        for coverage in layers:
+            # PIL: out = in + (ink - in) * a / 255, rounded with ((tmp >> 8) + tmp) >> 8
+            tmp = (255 - region) * coverage + 128
+            region = region + (((tmp >> 8) + tmp) >> 8)
+        image[y0:y1, x0:x1] = region.astype(np.uint8)
+    return images
@@ -0,0 +1,252 @@
+import os
+import time
+import shutil
+import hashlib
+import threading
+import http.client
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+# =========================
+# Usage:
+# Download one file (resumes from <output_path>.part if a previous attempt was interrupted):
+#   download_file(url, "archive.zip")
+# Download several files concurrently, optionally checking SHA-256 checksums:
+#   download_files([(url1, "a.zip"), (url2, "b.tar", "<sha256>")], num_workers=4)
+# Download, extract and delete archives one at a time within a disk budget:
+#   download_and_extract_archives([(url1, "a.zip", extract_fn), ...], disk_budget_gb=200)
+# =========================
+
+BUFFER_SIZE = 8 * 1024 * 1024
+USER_AGENT = "biometric_vqa-downloader"
+
+
+def _sha256_file(file_path, buffer_size=BUFFER_SIZE):
+    """Compute the SHA-256 digest of a file"""
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            data = f.read(buffer_size)
+            if not data:
+                break
+            sha256.update(data)
+    return sha256.hexdigest()
+
+
+def _parse_total_size(response, offset):
+    """Get the full size of the remote file from a (partial) response, or None if unknown"""
+    content_range = response.headers.get("Content-Range")
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1].strip()
+        if total.isdigit():
+            return int(total)
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit():
+        return offset + int(content_length)
+    return None
+
+
+def _fetch(url, part_path, timeout, buffer_size):
+    """
+    Fetch url into part_path, continuing from the bytes already in part_path.
+    Returns True once the file is complete, False if the transfer stopped early.
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"User-Agent": USER_AGENT}
+    if offset > 0:
+        headers["Range"] = f"bytes={offset}-"
+    request = urllib.request.Request(url, headers=headers)
+
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code != 416 or offset == 0:
+            raise
+        # Range not satisfiable: the partial file is already complete, or larger than the remote file
+        total = _parse_total_size(e, 0)
+        if total == offset:
+            return True
+        os.remove(part_path)
+        return False
+
+    with response:
+        if offset > 0 and response.status != 206:
+            # Server ignored the Range header, start over
+            print(f"Server does not support resume, restarting download of {url}")
+            offset = 0
+        total = _parse_total_size(response, offset)
+
+        buffer = bytearray(buffer_size)
+        view = memoryview(buffer)
+        with open(part_path, "ab" if offset > 0 else "wb") as f:
+            while True:
+                n = response.readinto(view)
+                if not n:
+                    break
+                f.write(view[:n])
+                offset += n
+
+    return total is None or offset >= total
+
+
+def download_file(
+    url,
+    output_path,
+    sha256=None,
+    max_retries=5,
+    timeout=60,
+    buffer_size=BUFFER_SIZE,
+):
+    """
+    Download url to output_path with HTTP Range resume.
+    Data is written to <output_path>.part and renamed once complete, so an interrupted download resumes
+    from where it stopped. An existing output_path is kept (and checked if sha256 is given).
+    """
+    output_path = str(output_path)
+    part_path = output_path + ".part"
+
+    if os.path.exists(output_path):
+        if sha256 is None or _sha256_file(output_path, buffer_size) == sha256.lower():
+            print(f"Already downloaded: {output_path}")
+            return output_path
+        print(f"Checksum mismatch for existing {output_path}, downloading again")
+        os.remove(output_path)
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    print(f"Downloading {output_path} from {url}...")
+    attempt = 0
+    while True:
+        try:
+            if _fetch(url, part_path, timeout, buffer_size):
+                break
+            error = "transfer ended before the end of the file"
+        except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+            if isinstance(e, urllib.error.HTTPError) and e.code < 500 and e.code != 429:
+                raise
+            error = e
+        attempt += 1
+        if attempt > max_retries:
+            raise RuntimeError(f"Failed to download {url} after {max_retries} retries: {error}")
+        wait = min(2**attempt, 60)
+        print(f"Download of {url} interrupted ({error}), resuming in {wait}s ({attempt}/{max_retries})")
+        time.sleep(wait)
+
+    if sha256 is not None:
+        digest = _sha256_file(part_path, buffer_size)
+        if digest != sha256.lower():
+            os.remove(part_path)
+            raise ValueError(f"Checksum mismatch for {output_path}: expected {sha256}, got {digest}")
+
+    os.replace(part_path, output_path)
+    print(f"Download complete: {output_path}")
+    return output_path
+
+
+def download_files(downloads, num_workers=4, **kwargs):
+    """
+    Download several files concurrently.
+    downloads: list of (url, output_path) or (url, output_path, sha256) tuples.
+    Extra keyword arguments are passed to download_file. Returns the output paths in input order.
+    """
+    downloads = [tuple(d) + (None,) * (3 - len(d)) for d in downloads]
+    if not downloads:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(num_workers, len(downloads)))) as executor:
+        futures = [
+            executor.submit(download_file, url, output_path, sha256, **kwargs)
+            for url, output_path, sha256 in downloads
+        ]
+        errors = []
+        for (url, _, _), future in zip(downloads, futures):
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(f"{url}: {e}")
+
+    if errors:
+        raise RuntimeError("Failed downloads:\n" + "\n".join(errors))
+    return [output_path for _, output_path, _ in downloads]
+
+
+def get_remote_size(url, timeout=60):
+    """Get the size of a remote file from a HEAD request, or None if the server does not report it"""
+    request = urllib.request.Request(url, method="HEAD", headers={"User-Agent": USER_AGENT})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return _parse_total_size(response, 0)
+    except (urllib.error.URLError, http.client.HTTPException, OSError):
+        return None
+
+
+class _DiskBudget:
+    """Reserve bytes against a budget; a reservation larger than the budget waits until nothing else is running"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.reserved = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size):
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.reserved == 0 or self.reserved + size <= self.budget
+            )
+            self.reserved += size
+
+    def release(self, size):
+        with self.condition:
+            self.reserved -= size
+            self.condition.notify_all()
+
+
+def download_and_extract_archives(
+    archives,
+    disk_budget_gb=None,
+    expansion_factor=1.0,
+    num_workers=2,
+    **kwargs,
+):
+    """
+    Process archives end to end (download -> extract -> delete archive) so that at most a few
+    archives and their extracted data are on disk at the same time.
+    archives: list of (url, archive_path, extract_fn) tuples; extract_fn(archive_path) extracts (and
+        may post-process) one archive. The archive is deleted once extract_fn returns.
+    disk_budget_gb: transient disk space the pipeline may use (default: the free space of the current
+        folder). An archive needs its size * (1 + expansion_factor); archives only start while the
+        in-flight total stays within the budget, and an archive larger than the budget runs alone.
+    Extra keyword arguments are passed to download_file. Returns the extract_fn results in input order.
+    """
+    if disk_budget_gb is None:
+        budget = shutil.disk_usage(os.getcwd()).free
+    else:
+        budget = int(disk_budget_gb * 1024**3)
+    disk_budget = _DiskBudget(budget)
+
+    def process(url, archive_path, extract_fn):
+        archive_size = get_remote_size(url)
+        # Unknown size: reserve the whole budget so the archive runs alone
+        need = budget if archive_size is None else int(archive_size * (1 + expansion_factor))
+        if need > budget:
+            print(f"Warning: {archive_path} needs ~{need / 1024**3:.1f} GB, more than the disk budget")
+        disk_budget.acquire(need)
+        try:
+            download_file(url, archive_path, **kwargs)
+            result = extract_fn(archive_path)
+            os.remove(archive_path)
+            print(f"Removed {archive_path}")
+            return result
+        finally:
+            disk_budget.release(need)
+
+    archives = [tuple(a) for a in archives]
+    if not archives:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(num_workers, len(archives)))) as executor:
+        futures = [executor.submit(process, *archive) for archive in archives]
+        return [future.result() for future in futures]
@@ -0,0 +1,203 @@
+import os
+import sys
+import errno
+import shutil
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from biometric_vqa.utils.large_file_handler import BUFFER_SIZE, _copy_range
+
+
+# =========================
+# Usage:
+# Move (or copy) files with the cheapest available operation:
+#   place_file("tmp/a.nii.gz", "Images/a.nii.gz")                    # rename -> hardlink -> reflink -> copy
+#   place_file("raw/ct.nii.gz", "Images/a.nii.gz", keep_source=True)  # hardlink -> reflink -> copy
+# Plan a reorganisation without touching any file:
+#   place_files([(src, dst), ...], dry_run=True)
+# =========================
+
+# ioctl request number of FICLONE (Linux, btrfs/XFS/bcachefs/OCFS2...)
+FICLONE = 0x40049409
+PLACEMENT_METHODS = ["rename", "hardlink", "reflink", "copy"]
+
+_reflink_support = {}
+_reflink_lock = threading.Lock()
+
+
+def _existing_parent(path):
+    """path itself, or its closest existing parent folder"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def _device_of(path):
+    """st_dev of path, or of its closest existing parent folder"""
+    return os.stat(_existing_parent(path)).st_dev
+
+
+def _reflink(src, dst):
+    """Clone src into dst (copy-on-write, no data copied); raises OSError if unsupported"""
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "reflink is only supported on Linux")
+    import fcntl
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def _copy(src, dst, buffer_size=BUFFER_SIZE):
+    """Copy file data (kernel zero-copy where possible, large buffer otherwise) and metadata"""
+    with open(src, "rb", buffering=0) as fsrc, open(dst, "wb", buffering=0) as fdst:
+        _copy_range(fsrc, fdst, 0, os.fstat(fsrc.fileno()).st_size, buffer_size)
+    shutil.copystat(src, dst)
+
+
+def _probe_reflink(src, dst_dir):
+    """Check (once per pair of devices) whether src can be cloned into dst_dir"""
+    key = (_device_of(src), _device_of(dst_dir))
+    with _reflink_lock:
+        if key in _reflink_support:
+            return _reflink_support[key]
+    probe = os.path.join(_existing_parent(dst_dir), f".reflink_probe_{os.getpid()}_{threading.get_ident()}")
+    try:
+        _reflink(src, probe)
+        supported = True
+    except OSError:
+        supported = False
+    finally:
+        if os.path.exists(probe):
+            os.remove(probe)
+    with _reflink_lock:
+        _reflink_support[key] = supported
+    return supported
+
+
+def plan_placement(src, dst, keep_source=False, allow_hardlink=True):
+    """
+    Predict which method place_file would use for src -> dst, without moving any data.
+    Only a reflink probe (an empty clone that is removed straight away) may touch the destination folder.
+    """
+    same_device = _device_of(src) == _device_of(os.path.dirname(os.path.abspath(dst)))
+    if same_device and not keep_source:
+        return "rename"
+    if same_device and allow_hardlink:
+        return "hardlink"
+    if _probe_reflink(src, os.path.dirname(os.path.abspath(dst))):
+        return "reflink"
+    return "copy"
+
+
+def place_file(src, dst, keep_source=False, allow_hardlink=True, buffer_size=BUFFER_SIZE):
+    """
+    Put src at dst (overwriting dst) with the cheapest operation that works:
+    os.rename (moves only) -> hardlink -> reflink (FICLONE) -> copy.
+    With keep_source=False the source is removed afterwards (a move). Hardlinks share data with the source,
+    so pass allow_hardlink=False when keep_source=True and either file is later modified in place.
+    Returns the method used.
+    """
+    src, dst = str(src), str(dst)
+    dst_dir = os.path.dirname(dst)
+    if dst_dir:
+        os.makedirs(dst_dir, exist_ok=True)
+
+    if not keep_source:
+        try:
+            os.replace(src, dst)
+            return "rename"
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+
+    tmp = f"{dst}.tmp{os.getpid()}_{threading.get_ident()}"
+    method = None
+    if allow_hardlink:
+        try:
+            os.link(src, tmp)
+            method = "hardlink"
+        except OSError:
+            pass
+    if method is None:
+        try:
+            _reflink(src, tmp)
+            shutil.copystat(src, tmp)
+            method = "reflink"
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    if method is None:
+        _copy(src, tmp, buffer_size)
+        method = "copy"
+
+    os.replace(tmp, dst)
+    if not keep_source:
+        os.remove(src)
+    return method
+
+
+def place_files(pairs, keep_source=False, allow_hardlink=True, num_workers=None, dry_run=False):
+    """
+    Place several files in parallel (see place_file).
+    pairs: list of (src, dst) tuples.
+    dry_run: only report which method each file would take.
+    Returns a list of (src, dst, method) tuples and prints a summary per method.
+    """
+    pairs = [(str(src), str(dst)) for src, dst in pairs]
+    if not pairs:
+        return []
+
+    if dry_run:
+        results = [
+            (src, dst, plan_placement(src, dst, keep_source, allow_hardlink)) for src, dst in pairs
+        ]
+        for src, dst, method in results:
+            print(f"[dry run] {method}: {src} -> {dst}")
+    else:
+        num_workers = num_workers or min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            methods = executor.map(
+                lambda pair: place_file(pair[0], pair[1], keep_source, allow_hardlink), pairs
+            )
+            results = [(src, dst, method) for (src, dst), method in zip(pairs, methods)]
+
+    counts = Counter(method for _, _, method in results)
+    summary = ", ".join(f"{counts[m]} {m}" for m in PLACEMENT_METHODS if counts[m])
+    print(f"{'Planned' if dry_run else 'Placed'} {len(results)} files: {summary}")
+    return results
+
+
+def place_tree(source_folder, destination_folder, num_workers=None, dry_run=False):
+    """
+    Move a folder to destination_folder (which must not exist yet).
+    A single rename when both are on the same filesystem; otherwise every file is placed in parallel
+    (reflink or copy) and the source tree is removed.
+    Returns a list of (src, dst, method) tuples.
+    """
+    if _device_of(source_folder) == _device_of(os.path.dirname(os.path.abspath(destination_folder))):
+        if dry_run:
+            print(f"[dry run] rename: {source_folder} -> {destination_folder}")
+            return [(source_folder, destination_folder, "rename")]
+        try:
+            os.rename(source_folder, destination_folder)
+            return [(source_folder, destination_folder, "rename")]
+        except OSError as e:
+            # Same device but another mount (e.g. a bind mount): place the files one by one
+            if e.errno != errno.EXDEV:
+                raise
+
+    pairs = []
+    for root, dirs, files in os.walk(source_folder):
+        rel_root = os.path.relpath(root, source_folder)
+        for d in dirs:
+            if not dry_run:
+                os.makedirs(os.path.join(destination_folder, rel_root, d), exist_ok=True)
+        for f in files:
+            pairs.append((os.path.join(root, f), os.path.normpath(os.path.join(destination_folder, rel_root, f))))
+    if not dry_run:
+        os.makedirs(destination_folder, exist_ok=True)
+    results = place_files(pairs, num_workers=num_workers, dry_run=dry_run)
+    if not dry_run:
+        shutil.rmtree(source_folder)
+    return results
@@ -0,0 +1,94 @@
+from functools import lru_cache
+import numpy as np
+
+
+# =========================
+# Usage:
+# Per-volume intensity statistics (recorded as "intensity_stats" of every case by the planners created
+# with record_intensity_stats=True; off by default because it decodes every image):
+#   stats = compute_intensity_stats(volume, image_modality="CT")
+# Window any slice of that volume to uint8 with a lookup table, no per-slice statistics needed:
+#   slice_uint8 = window_to_uint8(volume[:, :, 42], get_window(stats))                # default window
+#   slice_uint8 = window_to_uint8(volume[:, :, 42], get_window(stats, "bone"))        # CT HU window
+# =========================
+
+PERCENTILES = [0.5, 1, 5, 50, 95, 99, 99.5]
+# CT windows in Hounsfield units: (center, width)
+HU_WINDOWS = {
+    "soft_tissue": (40, 400),
+    "brain": (40, 80),
+    "bone": (400, 1800),
+    "lung": (-600, 1500),
+    "abdomen": (60, 400),
+}
+DEFAULT_HU_WINDOW = "soft_tissue"
+# Modalities whose background is 0 (statistics are computed on the non-zero voxels)
+FOREGROUND_MODALITIES = ["MRI", "PET"]
+# Statistics are computed on a regular subsample of at most this many voxels
+MAX_SAMPLES = 1 << 22
+
+
+def compute_intensity_stats(data, image_modality=""):
+    """
+    Compute the intensity statistics of a volume used for rendering.
+    Returns a JSON-serializable dict with min/max/mean/std, percentiles and windows ([low, high]):
+    "default" is the soft-tissue HU window for CT and the 0.5-99.5 percentile range otherwise, and
+    CT volumes also get every window of HU_WINDOWS.
+    """
+    modality = (image_modality or "").strip().upper()
+    flat = np.asarray(data).reshape(-1, order="A")
+    step = max(1, flat.size // MAX_SAMPLES)
+    values = np.asarray(flat[::step], dtype=np.float64)
+    foreground_only = modality in FOREGROUND_MODALITIES
+    if foreground_only and np.any(values != 0):
+        values = values[values != 0]
+
+    percentiles = np.percentile(values, PERCENTILES)
+    stats = {
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "foreground_only": foreground_only,
+        "percentiles": {str(p): float(v) for p, v in zip(PERCENTILES, percentiles)},
+        "windows": {"default": [float(percentiles[0]), float(percentiles[-1])]},
+    }
+    if modality == "CT":
+        for name, (center, width) in HU_WINDOWS.items():
+            stats["windows"][name] = [center - width / 2, center + width / 2]
+        stats["windows"]["default"] = stats["windows"][DEFAULT_HU_WINDOW]
+    return stats
+
+
+def get_window(stats, name="default"):
+    """Get a (low, high) window from the intensity statistics of a volume"""
+    low, high = stats["windows"][name]
+    return float(low), float(high)
+
+
+@lru_cache(maxsize=64)
+def _window_lut(dtype_str, low, high):
+    """uint8 lookup table over every value of an 8/16-bit integer dtype, and the value of entry 0"""
+    info = np.iinfo(np.dtype(dtype_str))
+    values = np.arange(info.min, info.max + 1, dtype=np.float64)
+    return _window_values(values, low, high), int(info.min)
+
+
+def _window_values(values, low, high):
+    if high <= low:
+        return np.where(values > low, 255, 0).astype(np.uint8)
+    return np.clip((values - low) * (255.0 / (high - low)), 0, 255).astype(np.uint8)
+
+
+def window_to_uint8(data, window):
+    """
+    Map intensities to uint8 with a window (low, high): values <= low -> 0, values >= high -> 255.
+    8/16-bit integer data (CT, most MRI) goes through a cached lookup table; other dtypes are scaled.
+    """
+    data = np.asarray(data)
+    low, high = float(window[0]), float(window[1])
+    if data.dtype.kind in "iu" and data.dtype.itemsize <= 2:
+        lut, offset = _window_lut(data.dtype.newbyteorder("=").str, low, high)
+        index = data.astype(np.int32) - offset if offset else data
+        return lut[index]
+    return _window_values(data.astype(np.float64), low, high)
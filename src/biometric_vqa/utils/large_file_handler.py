@@ -1,6 +1,10 @@
+import os
+import sys
 import math
+import hashlib
 import argparse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 
 # =========================
@@ -9,16 +13,163 @@ from pathlib import Path
 #   python large_file_handler.py split /path/to/large/file.nii.gz --size 40000
 # Join chunks back into the original file:
 #   python large_file_handler.py join /path/to/file.nii.gz.chunks
+# Verify chunks against the checksums in the manifest:
+#   python large_file_handler.py verify /path/to/file.nii.gz.chunks
+# Resume an interrupted split or join:
+#   python large_file_handler.py split /path/to/large/file.nii.gz --size 40000 --resume
+#   python large_file_handler.py join /path/to/file.nii.gz.chunks --resume
 # =========================
 
 
-def split_file(file_path, chunk_size_mb=1000):
+# Size of the buffer used when zero-copy is not available (memory use stays constant)
+BUFFER_SIZE = 8 * 1024 * 1024
+# Maximum number of bytes per zero-copy system call
+_MAX_ZERO_COPY_BYTES = 1024 * 1024 * 1024
+
+
+def _copy_range(src, dst, offset, count, buffer_size=BUFFER_SIZE):
+    """
+    Copy `count` bytes from `src` (starting at `offset`) to the current position of `dst`
+
+    Uses os.copy_file_range, then os.sendfile (zero-copy in the kernel) where supported,
+    and falls back to a streaming copy with a fixed-size buffer.
+
+    Args:
+        src: Source file object opened in unbuffered binary mode
+        dst: Destination file object opened in unbuffered binary mode
+        offset: Offset in the source file to start copying from
+        count: Number of bytes to copy
+        buffer_size: Buffer size for the fallback copy
+
+    Returns:
+        int: Number of bytes copied (less than count only if the source ends early)
+    """
+    src_fd, dst_fd = src.fileno(), dst.fileno()
+    copied = 0
+
+    # Zero-copy with copy_file_range (Linux >= 4.5) or sendfile
+    for zero_copy in ("copy_file_range", "sendfile"):
+        if not hasattr(os, zero_copy):
+            continue
+        try:
+            while copied < count:
+                n = min(count - copied, _MAX_ZERO_COPY_BYTES)
+                if zero_copy == "copy_file_range":
+                    n = os.copy_file_range(src_fd, dst_fd, n, offset + copied)
+                else:
+                    n = os.sendfile(dst_fd, src_fd, offset + copied, n)
+                if n == 0:
+                    return copied
+                copied += n
+            return copied
+        except OSError:
+            # Not supported for these files (e.g. across filesystems on older kernels)
+            continue
+
+    # Fallback: streaming copy with a fixed-size buffer
+    src.seek(offset + copied)
+    buffer = memoryview(bytearray(buffer_size))
+    while copied < count:
+        n = src.readinto(buffer[: min(buffer_size, count - copied)])
+        if not n:
+            break
+        written = 0
+        while written < n:
+            written += dst.write(buffer[written:n])
+        copied += n
+    return copied
+
+
+def _sha256_range(file_path, offset=0, size=None, buffer_size=BUFFER_SIZE):
+    """Calculate the SHA-256 hash of `size` bytes of a file starting at `offset`"""
+    sha256 = hashlib.sha256()
+    buffer = memoryview(bytearray(buffer_size))
+    with open(file_path, "rb", buffering=0) as f:
+        f.seek(offset)
+        remaining = os.fstat(f.fileno()).st_size - offset if size is None else size
+        while remaining > 0:
+            n = f.readinto(buffer[: min(buffer_size, remaining)])
+            if not n:
+                break
+            sha256.update(buffer[:n])
+            remaining -= n
+    return sha256.hexdigest()
+
+
+def _chunk_name(original_filename, i):
+    return f"{original_filename}.part{i:04d}"
+
+
+def _read_manifest(manifest_path):
+    """
+    Parse a manifest file
+
+    Returns:
+        tuple: (manifest, chunks)
+            - manifest (dict): Header fields ("original_file", "total_size", ...)
+            - chunks (dict): {chunk index: (size, sha256)} for chunks with recorded checksums
+    """
+    manifest, chunks = {}, {}
+    with open(manifest_path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            key, value = line.strip().split(": ", 1)
+            if key.startswith("part"):
+                size, sha256 = value.split()
+                chunks[int(key[len("part") :])] = (int(size), sha256)
+            else:
+                manifest[key] = value
+    return manifest, chunks
+
+
+def _write_manifest(manifest_path, manifest, chunks):
+    """Write the manifest header and the per-chunk size and SHA-256 atomically"""
+    tmp_path = Path(f"{manifest_path}.tmp")
+    with open(tmp_path, "w") as f:
+        for key, value in manifest.items():
+            f.write(f"{key}: {value}\n")
+        for i in sorted(chunks):
+            size, sha256 = chunks[i]
+            f.write(f"part{i:04d}: {size} {sha256}\n")
+    os.replace(tmp_path, manifest_path)
+
+
+def _verify_chunks(chunks_dir, original_filename, chunks, indices, num_workers=None):
+    """
+    Verify chunks against their recorded size and SHA-256 in parallel threads
+
+    Returns:
+        dict: {chunk index: error message} for invalid chunks (empty if all are valid)
+    """
+
+    def verify_one(i):
+        chunk_file = chunks_dir / _chunk_name(original_filename, i)
+        if i not in chunks:
+            return "no checksum in manifest"
+        size, sha256 = chunks[i]
+        if not chunk_file.exists():
+            return "missing"
+        if chunk_file.stat().st_size != size:
+            return f"size mismatch ({chunk_file.stat().st_size}/{size} bytes)"
+        if _sha256_range(chunk_file) != sha256:
+            return "checksum mismatch"
+        return None
+
+    with ThreadPoolExecutor(max_workers=num_workers or os.cpu_count()) as executor:
+        results = dict(zip(indices, executor.map(verify_one, indices)))
+    return {i: error for i, error in results.items() if error is not None}
+
+
+def split_file(file_path, chunk_size_mb=1000, resume=False, num_workers=None):
     """
     Split a large file into smaller chunks
 
     Args:
         file_path: Path to the file to split
         chunk_size_mb: Size of each chunk in megabytes (default 1000MB = ~1GB)
+        resume: If True, keep chunks of an interrupted split that are already valid
+        num_workers: Number of threads used for hashing chunks (default: number of CPUs)
     """
     file_path = Path(file_path)
     if not file_path.exists():
@@ -27,7 +178,8 @@ def split_file(file_path, chunk_size_mb=1000):
 
     # Convert MB to bytes
     chunk_size = chunk_size_mb * 1024 * 1024
-    file_size = file_path.stat().st_size
+    file_stat = file_path.stat()
+    file_size = file_stat.st_size
 
     # Calculate number of chunks needed
     num_chunks = math.ceil(file_size / chunk_size)
@@ -39,34 +191,119 @@ def split_file(file_path, chunk_size_mb=1000):
     # Create a directory for the chunks
     chunk_dir = file_path.with_suffix(".chunks")
     chunk_dir.mkdir(exist_ok=True)
+    manifest_path = chunk_dir / "manifest.txt"
+    manifest = {
+        "original_file": file_path.name,
+        "total_size": str(file_size),
+        "chunk_size": str(chunk_size),
+        "num_chunks": str(num_chunks),
+        "source_mtime_ns": str(file_stat.st_mtime_ns),
+    }
+
+    # Keep valid chunks from a previous run of the same split
+    chunks = {}
+    if resume and manifest_path.exists():
+        old_manifest, old_chunks = _read_manifest(manifest_path)
+        if old_manifest == manifest:
+            invalid = _verify_chunks(
+                chunk_dir, file_path.name, old_chunks, sorted(old_chunks), num_workers
+            )
+            chunks = {i: v for i, v in old_chunks.items() if i not in invalid}
+            print(f"Resuming: {len(chunks)}/{num_chunks} chunks are already valid")
+        else:
+            print("Resuming: manifest does not match this split, starting from scratch")
+
+    # Create the manifest file (updated as chunks are completed)
+    _write_manifest(manifest_path, manifest, chunks)
+
+    # Split the file (streaming copy, memory use does not depend on chunk size)
+    # Chunks are hashed in background threads while the next chunk is being copied
+    with ThreadPoolExecutor(max_workers=num_workers or os.cpu_count()) as executor:
+        futures = {}
+        with open(file_path, "rb", buffering=0) as f:
+            for i in range(num_chunks):
+                chunk_file = chunk_dir / _chunk_name(file_path.name, i)
+                if i in chunks:
+                    print(f"  Skipping valid chunk {i+1}/{num_chunks}: {chunk_file.name}")
+                    continue
+                print(f"  Creating chunk {i+1}/{num_chunks}: {chunk_file.name}")
+
+                offset = i * chunk_size
+                expected_size = min(chunk_size, file_size - offset)
+                with open(chunk_file, "wb", buffering=0) as chunk:
+                    copied = _copy_range(f, chunk, offset, expected_size)
+                if copied != expected_size:
+                    print(
+                        f"Error: Chunk {chunk_file.name} is truncated ({copied}/{expected_size} bytes)"
+                    )
+                    return
+                futures[i] = executor.submit(_sha256_range, chunk_file)
+
+                # Record finished checksums so that an interrupted split can resume
+                done = [j for j, future in futures.items() if future.done()]
+                if done:
+                    for j in done:
+                        chunks[j] = (
+                            (chunk_dir / _chunk_name(file_path.name, j)).stat().st_size,
+                            futures.pop(j).result(),
+                        )
+                    _write_manifest(manifest_path, manifest, chunks)
+
+        for j, future in futures.items():
+            chunks[j] = (
+                (chunk_dir / _chunk_name(file_path.name, j)).stat().st_size,
+                future.result(),
+            )
+    _write_manifest(manifest_path, manifest, chunks)
 
-    # Create a manifest file
-    with open(chunk_dir / "manifest.txt", "w") as manifest:
-        manifest.write(f"original_file: {file_path.name}\n")
-        manifest.write(f"total_size: {file_size}\n")
-        manifest.write(f"chunk_size: {chunk_size}\n")
-        manifest.write(f"num_chunks: {num_chunks}\n")
+    print(f"Split complete! Chunks stored in {chunk_dir}")
+    return chunk_dir
 
-    # Split the file
-    with open(file_path, "rb") as f:
-        for i in range(num_chunks):
-            chunk_file = chunk_dir / f"{file_path.name}.part{i:04d}"
-            print(f"  Creating chunk {i+1}/{num_chunks}: {chunk_file.name}")
 
-            with open(chunk_file, "wb") as chunk:
-                chunk_data = f.read(chunk_size)
-                chunk.write(chunk_data)
+def verify_chunks(chunks_dir, num_workers=None):
+    """
+    Verify all chunks against the sizes and SHA-256 checksums in the manifest
 
-    print(f"Split complete! Chunks stored in {chunk_dir}")
-    return chunk_dir
+    Args:
+        chunks_dir: Directory containing the chunks and manifest
+        num_workers: Number of threads used for hashing chunks (default: number of CPUs)
 
+    Returns:
+        dict: {chunk file name: error message} for invalid chunks (empty if all are valid),
+              or None if the manifest cannot be read
+    """
+    chunks_dir = Path(chunks_dir)
+    manifest_path = chunks_dir / "manifest.txt"
+    if not manifest_path.exists():
+        print(f"Error: Manifest file not found in {chunks_dir}")
+        return
+
+    manifest, chunks = _read_manifest(manifest_path)
+    original_filename = manifest["original_file"]
+    num_chunks = int(manifest["num_chunks"])
+
+    print(f"Verifying {num_chunks} chunks in {chunks_dir}")
+    invalid = _verify_chunks(
+        chunks_dir, original_filename, chunks, list(range(num_chunks)), num_workers
+    )
+    invalid = {_chunk_name(original_filename, i): e for i, e in sorted(invalid.items())}
+    for chunk_name, error in invalid.items():
+        print(f"  Invalid chunk {chunk_name}: {error}")
+    if invalid:
+        print(f"Verification failed: {len(invalid)}/{num_chunks} chunks are invalid")
+    else:
+        print("Verification complete! All chunks are valid")
+    return invalid
 
-def join_file(chunks_dir):
+
+def join_file(chunks_dir, resume=False, num_workers=None):
     """
     Join file chunks back into the original file
 
     Args:
         chunks_dir: Directory containing the chunks and manifest
+        resume: If True, keep the valid part of a previously interrupted join
+        num_workers: Number of threads used for hashing chunks (default: number of CPUs)
     """
     chunks_dir = Path(chunks_dir)
     if not chunks_dir.exists() or not chunks_dir.is_dir():
@@ -79,31 +316,64 @@ def join_file(chunks_dir):
         return
 
     # Parse manifest
-    manifest = {}
-    with open(manifest_path, "r") as f:
-        for line in f:
-            key, value = line.strip().split(": ", 1)
-            manifest[key] = value
-
+    manifest, chunks = _read_manifest(manifest_path)
     original_filename = manifest["original_file"]
     num_chunks = int(manifest["num_chunks"])
+    chunk_size = int(manifest["chunk_size"])
 
     # Path for the restored file (in parent directory of chunks)
     output_file = chunks_dir.parent / original_filename
 
+    # Check all chunks before joining (manifests from older versions have no checksums)
+    if chunks:
+        invalid = verify_chunks(chunks_dir, num_workers)
+        if invalid:
+            print("Error: Cannot join invalid chunks!")
+            return
+
+    # Keep the leading chunks of an interrupted join whose content is already correct
+    start_chunk = 0
+    if resume and output_file.exists() and chunks:
+        complete = min(output_file.stat().st_size // chunk_size, num_chunks)
+        with ThreadPoolExecutor(max_workers=num_workers or os.cpu_count()) as executor:
+            valid = list(
+                executor.map(
+                    lambda i: _sha256_range(output_file, i * chunk_size, chunks[i][0])
+                    == chunks[i][1],
+                    range(complete),
+                )
+            )
+        start_chunk = valid.index(False) if False in valid else complete
+        print(f"Resuming: {start_chunk}/{num_chunks} chunks already joined")
+
     print(f"Joining {num_chunks} chunks into {output_file}")
 
-    with open(output_file, "wb") as outfile:
-        for i in range(num_chunks):
-            chunk_file = chunks_dir / f"{original_filename}.part{i:04d}"
+    with open(output_file, "r+b" if start_chunk else "wb", buffering=0) as outfile:
+        outfile.truncate(start_chunk * chunk_size)
+        outfile.seek(start_chunk * chunk_size)
+        for i in range(start_chunk, num_chunks):
+            chunk_file = chunks_dir / _chunk_name(original_filename, i)
             print(f"  Adding chunk {i+1}/{num_chunks}: {chunk_file.name}")
 
             if not chunk_file.exists():
                 print(f"Error: Chunk file {chunk_file} not found!")
                 return
 
-            with open(chunk_file, "rb") as chunk:
-                outfile.write(chunk.read())
+            # Streaming (zero-copy where supported) append of the chunk
+            with open(chunk_file, "rb", buffering=0) as chunk:
+                chunk_bytes = os.fstat(chunk.fileno()).st_size
+                copied = _copy_range(chunk, outfile, 0, chunk_bytes)
+            # Size from the manifest, or the chunk size for all but the last chunk of older manifests
+            if i in chunks:
+                expected_size = chunks[i][0]
+            elif i < num_chunks - 1:
+                expected_size = chunk_size
+            else:
+                expected_size = chunk_bytes
+            if copied != chunk_bytes or copied != expected_size:
+                raise IOError(
+                    f"Chunk {chunk_file.name} is truncated ({copied}/{expected_size} bytes joined)"
+                )
 
     print(f"Join complete! Restored file: {output_file}")
 
@@ -124,17 +394,46 @@ def main():
         default=1000,
         help="Size of each chunk in MB (default: 1000)",
     )
+    split_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Keep valid chunks from an interrupted split",
+    )
 
     # Join command
     join_parser = subparsers.add_parser("join", help="Join chunks back into a file")
     join_parser.add_argument("chunks_dir", help="Directory containing chunks")
+    join_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Keep the valid part of an interrupted join",
+    )
+
+    # Verify command
+    verify_parser = subparsers.add_parser(
+        "verify", help="Verify chunks against the manifest checksums"
+    )
+    verify_parser.add_argument("chunks_dir", help="Directory containing chunks")
+
+    for subparser in (split_parser, join_parser, verify_parser):
+        subparser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of hashing threads (default: number of CPUs)",
+        )
 
     args = parser.parse_args()
 
     if args.command == "split":
-        split_file(args.file, args.size)
+        split_file(args.file, args.size, args.resume, args.workers)
     elif args.command == "join":
-        join_file(args.chunks_dir)
+        join_file(args.chunks_dir, args.resume, args.workers)
+    elif args.command == "verify":
+        invalid = verify_chunks(args.chunks_dir, args.workers)
+        # None: the manifest is missing, nothing could be verified
+        if invalid is None or invalid:
+            sys.exit(1)
     else:
         parser.print_help()
 
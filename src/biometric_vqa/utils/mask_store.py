@@ -0,0 +1,153 @@
+import os
+import gzip
+import json
+import threading
+from functools import lru_cache
+import numpy as np
+import cv2
+
+
+# =========================
+# Usage:
+# Written by the segmentation planner with mask_store=True (one MaskStore/<mask_folder>/<case>.json.gz per case):
+#   BiometricVQA_BenchmarkPlannerSegmentation(..., mask_store=True)
+# Get the 2D binary mask of one (case, slice_dim, slice_idx, label) without decoding the 3D mask:
+#   mask_2d = get_slice_mask(case["mask_store_file"], slice_dim=2, slice_idx=42, label=1)
+# Or the simplified contour polygons (COCO [x1, y1, x2, y2, ...], x = dim1, y = dim0):
+#   polygons = get_slice_entry(case["mask_store_file"], 2, 42, 1)["polygons"]
+# RLE "counts" strings use the COCO compressed format (pycocotools.mask.decode reads them too).
+# =========================
+
+MASK_STORE_DIR = "MaskStore"
+# Maximum distance (in pixels) between a contour and its simplified polygon
+POLYGON_EPSILON = 0.5
+
+
+def _counts_to_string(counts):
+    """COCO compressed RLE string (LEB128-like, 5 bits per character, deltas from counts[i-2])"""
+    chars = []
+    for i, x in enumerate(counts):
+        x = int(x)
+        if i > 2:
+            x -= int(counts[i - 2])
+        more = True
+        while more:
+            c = x & 0x1F
+            x >>= 5
+            more = x != -1 if c & 0x10 else x != 0
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return "".join(chars)
+
+
+def _string_to_counts(s):
+    counts = []
+    p = 0
+    while p < len(s):
+        x, k, more = 0, 0, True
+        while more:
+            c = ord(s[p]) - 48
+            x |= (c & 0x1F) << (5 * k)
+            more = bool(c & 0x20)
+            p += 1
+            k += 1
+            if not more and c & 0x10:
+                x |= -1 << (5 * k)
+        if len(counts) > 2:
+            x += counts[-2]
+        counts.append(x)
+    return counts
+
+
+def encode_rle(mask_2d):
+    """COCO-style RLE of a 2D binary mask: {"size": [height, width], "counts": str} (column-major runs)"""
+    flat = np.asarray(mask_2d, dtype=bool).ravel(order="F")
+    # Run boundaries; runs alternate 0/1 and start with a (possibly empty) run of zeros
+    boundaries = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    edges = np.concatenate(([0], boundaries, [flat.size]))
+    counts = np.diff(edges).tolist()
+    if flat.size and flat[0]:
+        counts = [0] + counts
+    return {"size": list(mask_2d.shape), "counts": _counts_to_string(counts)}
+
+
+def decode_rle(rle):
+    """Decode a COCO-style RLE into a 2D bool array"""
+    height, width = rle["size"]
+    counts = rle["counts"]
+    if isinstance(counts, str):
+        counts = _string_to_counts(counts)
+    values = np.arange(len(counts)) % 2 == 1
+    flat = np.repeat(values, counts)
+    return flat.reshape((height, width), order="F")
+
+
+def encode_polygons(mask_2d, epsilon=POLYGON_EPSILON):
+    """Simplified external contours of a 2D binary mask as COCO polygons ([x1, y1, x2, y2, ...])"""
+    contours, _ = cv2.findContours(
+        np.asarray(mask_2d, dtype=np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+    )
+    return [
+        cv2.approxPolyDP(contour, epsilon, True).reshape(-1).tolist() for contour in contours
+    ]
+
+
+def encode_slice_mask(mask_2d):
+    """Store entry of one (slice, label): RLE, polygons and pixel count"""
+    entry = encode_rle(mask_2d)
+    entry["polygons"] = encode_polygons(mask_2d)
+    entry["pixel_count"] = int(np.count_nonzero(mask_2d))
+    return entry
+
+
+def save_case_masks(store_file, masks):
+    """
+    Save the mask store of one case.
+    masks: {slice_dim: {slice_idx: {label: entry}}} (entries from encode_slice_mask)
+    """
+    os.makedirs(os.path.dirname(store_file) or ".", exist_ok=True)
+    index = {
+        str(int(slice_dim)): {
+            str(int(slice_idx)): {str(int(label)): entry for label, entry in labels.items()}
+            for slice_idx, labels in slices.items()
+        }
+        for slice_dim, slices in masks.items()
+    }
+    tmp_file = f"{store_file}.tmp{os.getpid()}_{threading.get_ident()}"
+    with gzip.open(tmp_file, "wt") as f:
+        json.dump({"masks": index}, f)
+    os.replace(tmp_file, store_file)
+    return store_file
+
+
+@lru_cache(maxsize=256)
+def load_case_masks(store_file):
+    """Load (and keep in memory) the mask store of one case"""
+    with gzip.open(store_file, "rt") as f:
+        return json.load(f)["masks"]
+
+
+def get_slice_entry(store_file, slice_dim, slice_idx, label):
+    """Store entry of (slice_dim, slice_idx, label), or None if the label is absent from that slice"""
+    masks = load_case_masks(str(store_file))
+    return (
+        masks.get(str(int(slice_dim)), {})
+        .get(str(int(slice_idx)), {})
+        .get(str(int(label)))
+    )
+
+
+def get_slice_mask(store_file, slice_dim, slice_idx, label, shape=None):
+    """
+    2D binary mask of a label in a slice, decoded from the store.
+    An absent label gives an all-False mask of shape (required in that case).
+    """
+    entry = get_slice_entry(store_file, slice_dim, slice_idx, label)
+    if entry is None:
+        if shape is None:
+            raise KeyError(
+                f"Label {label} not found in slice {slice_idx} (dim {slice_dim}) of {store_file}"
+            )
+        return np.zeros(shape, dtype=bool)
+    return decode_rle(entry)
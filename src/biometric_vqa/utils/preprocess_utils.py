@@ -1,16 +1,18 @@
 import os
 import glob
-import shutil
+import gzip
 import sys
-import filecmp
 import hashlib
+import threading
 import nibabel as nib
 import numpy as np
 import json
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from biometric_vqa.utils.file_placement import place_files, place_tree
 
 
-def move_folder(source_folder, destination_folder, create_dest=True):
+def move_folder(source_folder, destination_folder, create_dest=True, num_workers=None, dry_run=False):
     """
     Moves a folder from source to destination.
 
@@ -18,6 +20,8 @@ def move_folder(source_folder, destination_folder, create_dest=True):
         source_folder (str): Path to the source folder to move
         destination_folder (str): Path to the destination location
         create_dest (bool): Whether to create the destination parent directory if it doesn't exist
+        num_workers (int): Number of threads used when files have to be copied across filesystems
+        dry_run (bool): Only report how each file would be moved (rename, hardlink, reflink or copy)
 
     Returns:
         bool: True if successful, False otherwise
@@ -29,107 +33,248 @@ def move_folder(source_folder, destination_folder, create_dest=True):
     if not os.path.exists(source_folder):
         raise FileNotFoundError(f"Source folder does not exist: {source_folder}")
     # Create destination directory if it doesn't exist and create_dest is True
-    if create_dest and not os.path.exists(os.path.dirname(destination_folder)):
+    if not dry_run and create_dest and not os.path.exists(os.path.dirname(destination_folder)):
         os.makedirs(os.path.dirname(destination_folder), exist_ok=True)
     try:
         # Check if destination folder exists
         if os.path.exists(destination_folder):
             # If destination exists, move contents
+            file_pairs = []
             for item in os.listdir(source_folder):
                 s = os.path.join(source_folder, item)
                 d = os.path.join(destination_folder, item)
-                shutil.move(s, d)
+                if os.path.isdir(s):
+                    # Same as shutil.move: a folder moved onto an existing folder goes inside it
+                    if os.path.isdir(d):
+                        d = os.path.join(d, item)
+                    place_tree(s, d, num_workers=num_workers, dry_run=dry_run)
+                else:
+                    file_pairs.append((s, d))
+            place_files(file_pairs, num_workers=num_workers, dry_run=dry_run)
         else:
             # If destination doesn't exist, move the entire folder
-            shutil.move(source_folder, destination_folder)
-        print(f"Successfully moved '{source_folder}' to '{destination_folder}'")
+            place_tree(source_folder, destination_folder, num_workers=num_workers, dry_run=dry_run)
+        if not dry_run:
+            print(f"Successfully moved '{source_folder}' to '{destination_folder}'")
         return True
     except Exception as e:
         print(f"Failed to move folder: {e}")
         return False
 
 
-def check_nii_header_for_img_mask(image_path, mask_path):
-    # Inspect the mask files
-    mask_nii = nib.load(mask_path)
-    mask_data = mask_nii.get_fdata()
-    mask_file_info = {
-        "voxel_size": tuple(round(x, 3) for x in mask_nii.header.get_zooms()),
-        "affine": np.round(mask_nii.affine, 3),
-        "orientation": nib.orientations.aff2axcodes(mask_nii.affine),
-        "array_size": mask_data.shape,
-    }
-    # Inspect the image files
-    img_nii = nib.load(image_path)
-    img_data = img_nii.get_fdata()
-    image_file_info = {
-        "voxel_size": tuple(round(x, 3) for x in img_nii.header.get_zooms()),
-        "affine": np.round(img_nii.affine, 3),
-        "orientation": nib.orientations.aff2axcodes(img_nii.affine),
-        "array_size": img_data.shape,
+def _get_nii_header_info(nii_path):
+    """Read the spatial properties of a NIfTI file from its header only (no voxel decode)"""
+    nii = nib.load(nii_path)
+    return {
+        "voxel_size": tuple(round(float(x), 3) for x in nii.header.get_zooms()),
+        "affine": np.round(nii.affine, 3),
+        "orientation": nib.orientations.aff2axcodes(nii.affine),
+        "array_size": tuple(int(x) for x in nii.shape),
     }
-    # Check if mask and image properties match
-    print(
-        f"Checking properties for the image and mask images:\nImage: {image_path}\nMask: {mask_path}"
-    )
+
+
+def _compare_nii_header_info(image_file_info, mask_file_info):
+    """Return a list of (field, image value, mask value) for all mismatching properties"""
+    mismatches = []
     for key in mask_file_info:
         if isinstance(mask_file_info[key], np.ndarray):
             if not np.allclose(
                 mask_file_info[key], image_file_info[key], atol=1e-5, rtol=1e-3
             ):
-                raise ValueError(
-                    f"\n\nMismatch in {key} between image and mask:\n"
-                    f"Image {key}:\n{image_file_info[key]}\n"
-                    f"Mask {key}:\n{mask_file_info[key]}\n"
-                )
+                mismatches.append((key, image_file_info[key], mask_file_info[key]))
         elif mask_file_info[key] != image_file_info[key]:
-            raise ValueError(
-                f"\n\nMismatch in {key} between image and mask:\n"
-                f"Image {key}:\n{image_file_info[key]}\n"
-                f"Mask {key}:\n{mask_file_info[key]}\n"
-            )
+            mismatches.append((key, image_file_info[key], mask_file_info[key]))
+    return mismatches
+
+
+def check_nii_header_for_img_mask(image_path, mask_path):
+    # Inspect the mask and image file headers
+    mask_file_info = _get_nii_header_info(mask_path)
+    image_file_info = _get_nii_header_info(image_path)
+    # Check if mask and image properties match
+    print(
+        f"Checking properties for the image and mask images:\nImage: {image_path}\nMask: {mask_path}"
+    )
+    for key, image_value, mask_value in _compare_nii_header_info(
+        image_file_info, mask_file_info
+    ):
+        raise ValueError(
+            f"\n\nMismatch in {key} between image and mask:\n"
+            f"Image {key}:\n{image_value}\n"
+            f"Mask {key}:\n{mask_value}\n"
+        )
     print(f"Properties (NIfTI file header) match!\n")
 
 
-def check_nii_header_for_img_mask_batch(image_dir, mask_dir):
+def _check_nii_header_pair(pair):
+    """Worker: compare the headers of one image/mask pair and return mismatch rows"""
+    image_path, mask_path = pair
+    if not os.path.exists(mask_path):
+        return [
+            {
+                "image": image_path,
+                "mask": mask_path,
+                "field": "missing_mask",
+                "image_value": None,
+                "mask_value": None,
+            }
+        ]
+    try:
+        mismatches = _compare_nii_header_info(
+            _get_nii_header_info(image_path), _get_nii_header_info(mask_path)
+        )
+    except Exception as e:
+        return [
+            {
+                "image": image_path,
+                "mask": mask_path,
+                "field": "error",
+                "image_value": str(e),
+                "mask_value": None,
+            }
+        ]
+    return [
+        {
+            "image": image_path,
+            "mask": mask_path,
+            "field": key,
+            "image_value": convert_to_serializable(image_value),
+            "mask_value": convert_to_serializable(mask_value),
+        }
+        for key, image_value, mask_value in mismatches
+    ]
+
+
+def check_nii_header_for_img_mask_batch(image_dir, mask_dir, num_workers=None):
     """
-    Check NIfTI headers for all matching image and mask pairs in given directories
+    Check NIfTI headers for all matching image and mask pairs in given directories.
+    Only headers are read, and pairs are checked across a process pool.
 
     Args:
         image_dir (str): Directory containing image files
         mask_dir (str): Directory containing mask files
-    """
-    # Get all nii.gz files in image directory
-    image_files = glob.glob(os.path.join(image_dir, "*.nii.gz"))
-    total_files = len(image_files)
-
-    print(f"Found {total_files} image files. Starting header check...\n")
-
-    for idx, image_path in enumerate(image_files, 1):
-        # Get corresponding mask file name
-        image_name = os.path.basename(image_path)
-        mask_path = os.path.join(mask_dir, image_name)
-
-        print(f"Processing file {idx}/{total_files}")
-
-        # Check if mask exists
-        if not os.path.exists(mask_path):
-            print(f"WARNING: No matching mask found for {image_name}\n")
-            continue
+        num_workers (int, optional): Number of worker processes (default: number of CPUs)
 
-        try:
-            check_nii_header_for_img_mask(image_path, mask_path)
-        except ValueError as e:
-            print(f"ERROR: {str(e)}")
-            continue
-        except Exception as e:
-            print(f"ERROR: Unexpected error processing {image_name}: {str(e)}\n")
-            continue
+    Returns:
+        list[dict]: Mismatch table, one row per mismatching field with keys
+            "image", "mask", "field", "image_value" and "mask_value".
+            "field" is "missing_mask" if the mask does not exist and "error" if a header cannot be read.
+    """
+    # Get all nii.gz files in image directory and the corresponding mask files
+    image_files = sorted(glob.glob(os.path.join(image_dir, "*.nii.gz")))
+    pairs = [
+        (image_path, os.path.join(mask_dir, os.path.basename(image_path)))
+        for image_path in image_files
+    ]
+    print(f"Found {len(pairs)} image files. Starting header check...")
+
+    num_workers = num_workers or os.cpu_count() or 1
+    if num_workers == 1 or len(pairs) <= 1:
+        results = map(_check_nii_header_pair, pairs)
+        mismatch_table = [row for rows in results for row in rows]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            results = executor.map(_check_nii_header_pair, pairs, chunksize=16)
+            mismatch_table = [row for rows in results for row in rows]
 
-    print("\nHeader check completed for all files!")
+    mismatched_pairs = len({row["image"] for row in mismatch_table})
+    print(
+        f"Header check completed for all files: {mismatched_pairs}/{len(pairs)} pairs with mismatches"
+    )
+    return mismatch_table
+
+
+# Suggested location of the persistent file hash cache of compare_nifti_folders (opt-in)
+DEFAULT_HASH_CACHE_FILE = os.path.join(
+    os.path.expanduser("~"), ".cache", "biometric_vqa", "file_hash_cache.json"
+)
+
+
+class _FileHashCache:
+    """Thread-safe SHA-256 cache keyed by (path, size, mtime_ns), persisted as JSON"""
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        self.lock = threading.Lock()
+        self.hashes = {}
+        self.modified = False
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, "r") as f:
+                    self.hashes = json.load(f)
+            except (OSError, ValueError):
+                print(f"Warning: Ignoring unreadable hash cache {cache_file}")
+
+    @staticmethod
+    def _key(file_stat, filepath):
+        return f"{os.path.abspath(filepath)}|{file_stat.st_size}|{file_stat.st_mtime_ns}"
+
+    def get_hash(self, filepath, chunk_size=8 * 1024 * 1024):
+        """Get the SHA-256 hash of a file, computing it with large reads if not cached"""
+        key = self._key(os.stat(filepath), filepath)
+        with self.lock:
+            if key in self.hashes:
+                return self.hashes[key]
+        sha256 = hashlib.sha256()
+        with open(filepath, "rb", buffering=0) as f:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                sha256.update(data)
+        with self.lock:
+            self.hashes[key] = sha256.hexdigest()
+            self.modified = True
+        return self.hashes[key]
+
+    def save(self):
+        if not self.cache_file or not self.modified:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.hashes, f)
+        os.replace(tmp_file, self.cache_file)
+
+
+def nifti_voxels_are_identical(file1, file2, block_slices=16):
+    """
+    Compare the decoded voxel data of two NIfTI files block by block, returning on the first difference.
 
+    Args:
+        file1 (str): Path to first file
+        file2 (str): Path to second file
+        block_slices (int): Number of slices (along the last axis) decoded per block
 
-def compare_nifti_folders(folder1, folder2, check_content=False, recursive=False):
+    Returns:
+        bool: True if shape, affine and voxel values are identical, False otherwise
+    """
+    img1 = nib.load(str(file1), keep_file_open=True)
+    img2 = nib.load(str(file2), keep_file_open=True)
+    if img1.shape != img2.shape or not np.allclose(img1.affine, img2.affine):
+        return False
+    if len(img1.shape) == 0:
+        return np.array_equal(np.asanyarray(img1.dataobj), np.asanyarray(img2.dataobj))
+    # Read slabs along the last (slowest-varying on disk) axis in order
+    n_slices = img1.shape[-1]
+    for start in range(0, n_slices, block_slices):
+        stop = min(start + block_slices, n_slices)
+        block1 = np.asanyarray(img1.dataobj[..., start:stop])
+        block2 = np.asanyarray(img2.dataobj[..., start:stop])
+        if not np.array_equal(block1, block2):
+            return False
+    return True
+
+
+def compare_nifti_folders(
+    folder1,
+    folder2,
+    check_content=False,
+    recursive=False,
+    compare_voxels=False,
+    num_workers=None,
+    hash_cache_file=None,
+):
     """
     Compare .nii.gz files in two folders, printing messages for files in folder1
     that don't exist in folder2.
@@ -139,40 +284,15 @@ def compare_nifti_folders(folder1, folder2, check_content=False, recursive=False
         folder2 (str): Path to the second folder
         check_content (bool): If True, compare file contents, not just names
         recursive (bool): If True, search subdirectories recursively
+        compare_voxels (bool): If True (with check_content), compare decoded voxel data instead of file bytes,
+            so files that only differ in compression are considered identical
+        num_workers (int, optional): Number of threads for content comparison (default: number of CPUs)
+        hash_cache_file (str, optional): JSON file persisting the file hashes across runs, keyed by
+            (path, size, mtime_ns), e.g. DEFAULT_HASH_CACHE_FILE. None (default) keeps the hashes in memory only
 
     Returns:
         list: List of missing files (relative paths)
     """
-
-    def files_are_identical(file1, file2):
-        """
-        Check if two files have identical content using hash comparison.
-
-        Args:
-            file1 (Path): Path to first file
-            file2 (Path): Path to second file
-
-        Returns:
-            bool: True if files have identical content, False otherwise
-        """
-        # For small files, use direct comparison
-        if file1.stat().st_size < 100 * 1024 * 1024:  # Less than 100MB
-            return filecmp.cmp(file1, file2, shallow=False)
-
-        # For larger files, compare using hashing
-        return get_file_hash(file1) == get_file_hash(file2)
-
-    def get_file_hash(filepath, chunk_size=8192):
-        """Calculate SHA-256 hash of a file in chunks to handle large files."""
-        sha256 = hashlib.sha256()
-        with open(filepath, "rb") as f:
-            while True:
-                data = f.read(chunk_size)
-                if not data:
-                    break
-                sha256.update(data)
-        return sha256.hexdigest()
-
     folder1_path = Path(folder1)
     folder2_path = Path(folder2)
 
@@ -184,9 +304,10 @@ def compare_nifti_folders(folder1, folder2, check_content=False, recursive=False
 
     # Get all .nii.gz files in folder1
     pattern = "**/*.nii.gz" if recursive else "*.nii.gz"
-    files1 = list(folder1_path.glob(pattern))
+    files1 = sorted(folder1_path.glob(pattern))
 
     missing_files = []
+    pairs_to_compare = []
 
     print(f"Comparing {len(files1)} .nii.gz files from {folder1} with {folder2}...")
 
@@ -198,9 +319,29 @@ def compare_nifti_folders(folder1, folder2, check_content=False, recursive=False
         if not file2.exists():
             print(f"Missing file: {rel_path}")
             missing_files.append(str(rel_path))
-        elif check_content and not files_are_identical(file1, file2):
-            print(f"Different content: {rel_path}")
-            missing_files.append(str(rel_path))
+        elif check_content:
+            pairs_to_compare.append((rel_path, file1, file2))
+
+    if pairs_to_compare:
+        hash_cache = _FileHashCache(hash_cache_file)
+
+        def files_are_identical(pair):
+            _, file1, file2 = pair
+            if compare_voxels:
+                return nifti_voxels_are_identical(file1, file2)
+            if file1.stat().st_size != file2.stat().st_size:
+                return False
+            return hash_cache.get_hash(file1) == hash_cache.get_hash(file2)
+
+        try:
+            with ThreadPoolExecutor(max_workers=num_workers or os.cpu_count()) as executor:
+                results = executor.map(files_are_identical, pairs_to_compare)
+                for (rel_path, _, _), identical in zip(pairs_to_compare, results):
+                    if not identical:
+                        print(f"Different content: {rel_path}")
+                        missing_files.append(str(rel_path))
+        finally:
+            hash_cache.save()
 
     if not missing_files:
         print("All files from folder1 exist in folder2")
@@ -253,42 +394,184 @@ def print_unique_values_batch(directory):
         print_unique_values(str(nii_file))
 
 
-def check_noninteger_labels(folder_path, log_out_dir):
-    # List to store filenames with non-integer values
-    non_integer_files = []
+# Largest label range counted with a bincount (one int64 bin per value); wider ranges use np.unique
+MAX_BINCOUNT_RANGE = 1 << 24
+
+
+def get_label_voxel_counts(data):
+    """
+    Count voxels per label with an integer bincount on the native-dtype data
+
+    Args:
+        data (numpy.ndarray): Mask data (any numeric dtype, not converted to float64)
+
+    Returns:
+        tuple: (label_counts, noninteger_values)
+            - label_counts (dict): {label (int): voxel count (int)} for all labels present, including 0
+            - noninteger_values (list): Unique non-integer (including NaN/inf) values (empty for integer data)
+    """
+    data = np.asarray(data).ravel()
+    noninteger_values = []
+    if not np.issubdtype(data.dtype, np.integer):
+        # Separate non-integer and non-finite values and count the integer ones only
+        rounded = np.rint(data)
+        noninteger = (data != rounded) | ~np.isfinite(data)
+        if np.any(noninteger):
+            noninteger_values = np.unique(data[noninteger]).tolist()
+            rounded = rounded[~noninteger]
+        if rounded.size and (
+            rounded.min() < np.iinfo(np.int64).min or rounded.max() > np.iinfo(np.int64).max
+        ):
+            values, counts = np.unique(rounded, return_counts=True)
+            return {int(v): int(c) for v, c in zip(values, counts)}, noninteger_values
+        data = rounded.astype(np.int64)
+    if data.size == 0:
+        return {}, noninteger_values
+    offset, high = int(data.min()), int(data.max())
+    if high - offset > MAX_BINCOUNT_RANGE:
+        # Sparse labels over a huge range: a bincount would allocate one bin per value
+        values, counts = np.unique(data, return_counts=True)
+        return {int(v): int(c) for v, c in zip(values, counts)}, noninteger_values
+    # bincount requires non-negative integers, so shift by the minimum if needed
+    if offset < 0:
+        counts = np.bincount((data.astype(np.int64) - offset))
+    else:
+        offset = 0
+        counts = np.bincount(data)
+    labels = np.flatnonzero(counts)
+    label_counts = {int(label + offset): int(counts[label]) for label in labels}
+    return label_counts, noninteger_values
+
+
+def _inspect_mask_labels(file_path):
+    """Worker: compute the label histogram of one mask file"""
+    try:
+        img = nib.load(file_path)
+        data = np.asanyarray(img.dataobj)
+        label_counts, noninteger_values = get_label_voxel_counts(data)
+        return {
+            "file": file_path,
+            "dtype": str(data.dtype),
+            "label_counts": label_counts,
+            "noninteger_values": noninteger_values,
+            "error": None,
+        }
+    except Exception as e:
+        return {
+            "file": file_path,
+            "dtype": None,
+            "label_counts": {},
+            "noninteger_values": [],
+            "error": str(e),
+        }
+
 
-    # Get total number of files for progress tracking
-    total_files = sum(
-        1
-        for _, _, files in os.walk(folder_path)
+def inspect_mask_labels_batch(file_paths, num_workers=None):
+    """
+    Compute label histograms for a list of mask files across a process pool
+
+    Args:
+        file_paths (list): Paths to .nii.gz mask files
+        num_workers (int, optional): Number of worker processes (default: number of CPUs)
+
+    Returns:
+        list[dict]: One record per file (same order as file_paths) with keys
+            "file", "dtype", "label_counts", "noninteger_values" and "error"
+    """
+    file_paths = [str(f) for f in file_paths]
+    num_workers = num_workers or os.cpu_count() or 1
+    if num_workers == 1 or len(file_paths) <= 1:
+        return [_inspect_mask_labels(f) for f in file_paths]
+    records = []
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for i, record in enumerate(
+            executor.map(_inspect_mask_labels, file_paths, chunksize=4), 1
+        ):
+            print(f" - [{i}/{len(file_paths)}] Checked: {os.path.basename(record['file'])}")
+            records.append(record)
+    return records
+
+
+def validate_segmentation_labels_batch(
+    file_paths, valid_labels, report_path=None, num_workers=None
+):
+    """
+    Validate the labels of all mask files against a set of valid labels and build a consolidated report
+
+    Args:
+        file_paths (list): Paths to .nii.gz mask files
+        valid_labels (array-like): Allowed non-zero labels
+        report_path (str, optional): If given, save the report as JSON to this path
+        num_workers (int, optional): Number of worker processes (default: number of CPUs)
+
+    Returns:
+        dict: Report with keys
+            - "valid_labels": list of allowed labels
+            - "files_number": number of files checked
+            - "invalid_files": list of {"file", "invalid_labels", "noninteger_values", "error"}
+            - "label_voxel_counts": {file: {label: voxel count}} for reuse by the planners
+    """
+    valid_labels = sorted(int(label) for label in valid_labels)
+    valid_set = set(valid_labels) | {0}
+    records = inspect_mask_labels_batch(file_paths, num_workers)
+    invalid_files = []
+    label_voxel_counts = {}
+    for record in records:
+        label_voxel_counts[record["file"]] = record["label_counts"]
+        invalid_labels = sorted(set(record["label_counts"]) - valid_set)
+        if invalid_labels or record["noninteger_values"] or record["error"]:
+            invalid_files.append(
+                {
+                    "file": record["file"],
+                    "invalid_labels": invalid_labels,
+                    "noninteger_values": record["noninteger_values"],
+                    "error": record["error"],
+                }
+            )
+    report = {
+        "valid_labels": valid_labels,
+        "files_number": len(records),
+        "invalid_files": invalid_files,
+        "label_voxel_counts": label_voxel_counts,
+    }
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Label validation report saved to {report_path}")
+    return report
+
+
+def check_noninteger_labels(folder_path, log_out_dir, num_workers=None):
+    # Collect all mask files
+    mask_files = sorted(
+        os.path.join(root, file)
+        for root, _, files in os.walk(folder_path)
         for file in files
         if file.endswith(".nii.gz")
     )
-    processed = 0
+    total_files = len(mask_files)
 
-    # Walk through the directory
+    # Compute label histograms in parallel
     print(f"Checking {total_files} files for non-integer labels...")
-    for root, dirs, files in os.walk(folder_path):
-        for file in files:
-            if file.endswith(".nii.gz"):
-                processed += 1
-                file_path = os.path.join(root, file)
-                print(f" - Checking {processed}/{total_files}: {file}")
-
-                try:
-                    img = nib.load(file_path)
-                    data = img.get_fdata()
-                    unique_vals = np.unique(data)
-                    is_all_integer = np.all(np.equal(np.mod(unique_vals, 1), 0))
-                    if not is_all_integer:
-                        non_integer_files.append(
-                            {
-                                "filename": file,
-                                "unique_values": unique_vals.tolist(),  # Convert to list for JSON serialization
-                            }
-                        )
-                except Exception as e:
-                    print(f"\n\nError checking {file}: {str(e)}\n\n")
+    records = inspect_mask_labels_batch(mask_files, num_workers)
+
+    # List to store filenames with non-integer values
+    non_integer_files = []
+    for record in records:
+        if record["error"]:
+            print(f"\n\nError checking {record['file']}: {record['error']}\n\n")
+        elif record["noninteger_values"]:
+            non_integer_files.append(
+                {
+                    "filename": os.path.basename(record["file"]),
+                    "unique_values": np.unique(
+                        [float(v) for v in record["label_counts"]]
+                        + record["noninteger_values"]
+                    ).tolist(),
+                    "noninteger_values": record["noninteger_values"],
+                    "label_counts": record["label_counts"],
+                }
+            )
 
     # Print results and save to file if non-integer files found
     if non_integer_files:
@@ -306,26 +589,105 @@ def check_noninteger_labels(folder_path, log_out_dir):
         print("\nAll mask files contain integer values only!\n")
 
 
-def split_4d_nifti(input_dir, out_dir):
+def is_empty_volume(file_path, block_size=4 * 1024 * 1024):
+    """
+    Check whether a NIfTI volume contains only zeros, without decoding it in full
+
+    The voxel payload is streamed (through gzip for .nii.gz) in blocks of about block_size bytes,
+    and the check stops at the first block with a non-zero (scaled) voxel.
+
+    Args:
+        file_path (str): Path to a .nii or .nii.gz file
+        block_size (int): Approximate number of bytes decoded per block
+
+    Returns:
+        bool: True if every voxel is zero
+    """
+    img = nib.load(file_path)
+    dataobj = img.dataobj
+    if not hasattr(dataobj, "offset"):
+        return not np.any(np.asanyarray(dataobj))
+
+    dtype = img.get_data_dtype()
+    slope, inter = float(dataobj.slope), float(dataobj.inter)
+    n_bytes = int(np.prod(img.shape)) * dtype.itemsize
+    block_size = max(dtype.itemsize, block_size - block_size % dtype.itemsize)
+
+    opener = gzip.open if str(file_path).endswith(".gz") else open
+    with opener(file_path, "rb") as f:
+        f.seek(dataobj.offset)
+        while n_bytes > 0:
+            block = f.read(min(block_size, n_bytes))
+            if not block:
+                break
+            n_bytes -= len(block)
+            values = np.frombuffer(block, dtype=dtype)
+            if slope != 1.0 or inter != 0.0:
+                values = values * slope + inter
+            if np.any(values):
+                return False
+    return True
+
+
+def _check_empty_volume(file_path):
+    return file_path, is_empty_volume(file_path)
+
+
+def find_empty_volumes(file_paths, num_workers=None):
+    """
+    Find the all-zero volumes in a list of NIfTI files across a process pool
+
+    Args:
+        file_paths (list): Paths to .nii/.nii.gz files
+        num_workers (int, optional): Number of worker processes (default: number of CPUs)
+
+    Returns:
+        list: Paths of the empty volumes (in the order of file_paths)
+    """
+    file_paths = [str(f) for f in file_paths]
+    num_workers = num_workers or os.cpu_count() or 1
+    if num_workers == 1 or len(file_paths) <= 1:
+        results = [_check_empty_volume(f) for f in file_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            results = list(executor.map(_check_empty_volume, file_paths, chunksize=4))
+    return [file_path for file_path, empty in results if empty]
+
+
+def _save_volume_from_4d(file_path, volume_idx, output_path):
+    """Worker: read one 3D volume of a 4D NIfTI file in its stored dtype and save it"""
+    img = nib.load(file_path)
+    # Only the requested volume is decoded; unscaled data keeps its stored dtype
+    volume = np.asanyarray(img.dataobj[..., volume_idx])
+    header = img.header.copy()
+    new_img = nib.Nifti1Image(volume, img.affine, header)
+    # Keep the on-disk dtype (nibabel recomputes slope/intercept for scaled data)
+    new_img.header.set_data_dtype(img.get_data_dtype())
+    nib.save(new_img, output_path)
+    return output_path
+
+
+def split_4d_nifti(input_dir, out_dir, num_workers=None):
     """
     Split 4D NIfTI files in the input directory into separate 3D files.
     Automatically detects the length of the 4th dimension.
+    Volumes are read one at a time in their stored dtype (with the original header) and written in parallel.
     """
     # Get all .nii.gz files in the Images directory
-    nifti_files = glob.glob(os.path.join(input_dir, "*.nii.gz"))
+    nifti_files = sorted(glob.glob(os.path.join(input_dir, "*.nii.gz")))
 
+    jobs = []
     for file_path in nifti_files:
-        # Load the NIfTI file
+        # Load the NIfTI header only
         img = nib.load(file_path)
-        data = img.get_fdata()
 
         # Check if it's a 4D image
-        if len(data.shape) != 4:
+        if len(img.shape) != 4:
             print(f"Skipping {file_path} - not a 4D image")
             continue
 
         # Get the length of the 4th dimension
-        time_points = data.shape[3]
+        time_points = img.shape[3]
 
         # Create output directories if they don't exist
         for i in range(1, time_points + 1):
@@ -334,20 +696,36 @@ def split_4d_nifti(input_dir, out_dir):
         # Get the base filename without extension
         base_name = os.path.basename(file_path).replace(".nii.gz", "")
 
-        # Split and save each volume
+        # Queue each volume
         for i in range(time_points):
-            volume = data[:, :, :, i]
-            new_img = nib.Nifti1Image(volume, img.affine)
             output_path = os.path.join(f"{out_dir}/Images-{i+1}", f"{base_name}.nii.gz")
-            nib.save(new_img, output_path)
-            if i == time_points - 1:
-                print(f"Saved {output_path} (volume {i+1}/{time_points})\n")
-            else:
-                print(f"Saved {output_path} (volume {i+1}/{time_points})")
+            jobs.append((file_path, i, output_path))
+
+    # Split and save each volume
+    num_workers = num_workers or os.cpu_count() or 1
+    if num_workers == 1:
+        results = (_save_volume_from_4d(*job) for job in jobs)
+    else:
+        executor = ProcessPoolExecutor(max_workers=num_workers)
+        results = executor.map(_save_volume_from_4d, *zip(*jobs)) if jobs else []
+    try:
+        for idx, output_path in enumerate(results, 1):
+            print(f"Saved {output_path} (volume {idx}/{len(jobs)})")
+    finally:
+        if num_workers > 1:
+            executor.shutdown()
 
 
-def process_dataset_mm(data_dirs, seg_pattern, modalities, base_suffix, replace=False):
-    """Generic function to process multi-modality datasets with different patterns"""
+def process_dataset_mm(
+    data_dirs, seg_pattern, modalities, base_suffix, replace=False, num_workers=None, dry_run=False
+):
+    """
+    Generic function to process multi-modality datasets with different patterns
+    Files are placed with the cheapest available operation (rename, hardlink, reflink, then copy), in parallel.
+    Existing files in the output folders are always overwritten; replace is kept for compatibility.
+    With dry_run=True, only the planned operation for each file is reported.
+    """
+    pairs = []
     for data_dir in data_dirs:
         for seg_file in glob.glob(f"{data_dir}/**/{seg_pattern}", recursive=True):
             # Extract base ID
@@ -355,13 +733,7 @@ def process_dataset_mm(data_dirs, seg_pattern, modalities, base_suffix, replace=
             dir_name = os.path.dirname(seg_file)
 
             # Move segmentation file
-            mv_cmd = (
-                shutil.move
-                if not replace
-                else lambda src, dst: shutil.move(src, dst, copy_function=shutil.copy2)
-            )
-            os.makedirs("Masks", exist_ok=True)
-            mv_cmd(seg_file, f"Masks/{os.path.basename(seg_file)}")
+            pairs.append((seg_file, f"Masks/{os.path.basename(seg_file)}"))
 
             # Move modality files
             for modality in modalities:
@@ -371,11 +743,12 @@ def process_dataset_mm(data_dirs, seg_pattern, modalities, base_suffix, replace=
                     img_file = f"{dir_name}/{base_id}-{modality}.nii.gz"
 
                 if os.path.exists(img_file):
-                    os.makedirs(f"Images-{modality}", exist_ok=True)
-                    mv_cmd(img_file, f"Images-{modality}/{os.path.basename(img_file)}")
+                    pairs.append((img_file, f"Images-{modality}/{os.path.basename(img_file)}"))
                 else:
                     print(f"Warning: Missing {modality} file for {base_id}")
 
+    place_files(pairs, num_workers=num_workers, dry_run=dry_run)
+
 
 def process_dataset(
     data_dirs,
@@ -386,6 +759,8 @@ def process_dataset(
     replace=False,
     masks_fname="Masks",
     images_fname="Images",
+    num_workers=None,
+    dry_run=False,
 ):
     """
     Generic function to process datasets with optional arguments: output directory, file replacement
@@ -395,7 +770,13 @@ def process_dataset(
     3. Move the segmentation file to the <out_dir>/Masks folder (if provided)
     4. Find the corresponding image file by appending the <img_suffix> to the base ID
     5. Move the image file to the <out_dir>/Images folder (if provided)
+    Files are placed with the cheapest available operation (rename, hardlink, reflink, then copy), in parallel.
+    Existing files in the output folders are always overwritten; replace is kept for compatibility.
+    With dry_run=True, only the planned operation for each file is reported.
     """
+    masks_dir = f"{out_dir}/{masks_fname}" if out_dir else masks_fname
+    images_dir = f"{out_dir}/{images_fname}" if out_dir else images_fname
+    pairs = []
     for data_dir in data_dirs:
         for seg_file in glob.glob(f"{data_dir}/**/{seg_pattern}", recursive=True):
             # Extract base ID
@@ -403,24 +784,17 @@ def process_dataset(
             dir_name = os.path.dirname(seg_file)
 
             # Move segmentation file
-            mv_cmd = (
-                shutil.move
-                if not replace
-                else lambda src, dst: shutil.move(src, dst, copy_function=shutil.copy2)
-            )
-            masks_dir = f"{out_dir}/{masks_fname}" if out_dir else masks_fname
-            os.makedirs(masks_dir, exist_ok=True)
-            mv_cmd(seg_file, f"{masks_dir}/{os.path.basename(seg_file)}")
+            pairs.append((seg_file, f"{masks_dir}/{os.path.basename(seg_file)}"))
 
             # Move image files
             img_file = f"{dir_name}/{base_id}{img_suffix}"
             if os.path.exists(img_file):
-                images_dir = f"{out_dir}/{images_fname}" if out_dir else images_fname
-                os.makedirs(images_dir, exist_ok=True)
-                mv_cmd(img_file, f"{images_dir}/{os.path.basename(img_file)}")
+                pairs.append((img_file, f"{images_dir}/{os.path.basename(img_file)}"))
             else:
                 print(f"Warning: Missing image file for {base_id}")
 
+    place_files(pairs, num_workers=num_workers, dry_run=dry_run)
+
 
 def match_and_clean_files(images_dir, masks_dir):
     print(
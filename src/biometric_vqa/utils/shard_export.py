@@ -0,0 +1,397 @@
+import os
+import io
+import gzip
+import json
+import time
+import tarfile
+import argparse
+import threading
+from functools import lru_cache
+import nibabel as nib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from biometric_vqa.utils.benchmark_planner import (
+    BiometricVQA_BenchmarkPlannerSegmentation,
+    BiometricVQA_BenchmarkPlannerDetection,
+    BiometricVQA_BenchmarkPlannerBiometry,
+    BiometricVQA_BenchmarkPlannerBiometry_fromSeg,
+)
+from biometric_vqa.utils.preprocess_utils import convert_to_serializable
+from biometric_vqa.utils.slice_renderer import SliceRenderer
+from biometric_vqa.utils.chunked_store import chunked_loader
+
+
+# =========================
+# Usage:
+# Render every slice referenced by a benchmark plan into tar shards (<dataset_dir>/Shards/<plan name>/):
+#   python shard_export.py export /path/to/dataset/benchmark_plan_segmentation_v1.0.json.gz --workers 8
+# Each sample is two tar members sharing a key (WebDataset layout): <key>.png (the slice with its
+# overlays) and <key>.json (the flattened plan row: task, split, case, slice and answer fields).
+# Stream the shards in order with plain tarfile (or webdataset.WebDataset(shard_files)):
+#   shard_dir = "/path/to/dataset/Shards/benchmark_plan_segmentation_v1.0"
+#   for sample in iter_shard_samples(shard_dir):
+#       sample["key"], sample["png"], sample["json"]
+# index.json lists the shards in order with their number of samples, size and first/last keys.
+# =========================
+
+SHARDS_DIR = "Shards"
+SHARD_INDEX = "index.json"
+SHARD_PATTERN = "shard-{:06d}.tar"
+SAMPLES_PER_SHARD = 1000
+# Default number of shard writer processes (each holds its own decoded volume cache)
+MAX_WORKERS = 8
+SLICE_LANDMARKS_KEYS = ["slice_landmarks_x", "slice_landmarks_y", "slice_landmarks_z"]
+
+
+def load_benchmark_plan(plan_file):
+    """Load a benchmark plan (.json.gz or .json)"""
+    if str(plan_file).endswith(".gz"):
+        with gzip.open(plan_file, "rt") as f:
+            return json.load(f)
+    with open(plan_file, "r") as f:
+        return json.load(f)
+
+
+def _planner_class(task):
+    """Planner class whose flatten_slice_profiles_2d matches the cases of a task"""
+    task_type = task.get("task_type")
+    if task_type == "segmentation":
+        return BiometricVQA_BenchmarkPlannerSegmentation
+    if task_type == "detection":
+        return BiometricVQA_BenchmarkPlannerDetection
+    if task_type == "biometry":
+        cases = task.get("train_cases", []) + task.get("test_cases", [])
+        # Biometry from segmentation masks (e.g. Tumor-Lesion-Size) keeps the mask file of each case
+        if any("mask_file" in case for case in cases):
+            return BiometricVQA_BenchmarkPlannerBiometry_fromSeg
+        return BiometricVQA_BenchmarkPlannerBiometry
+    raise ValueError(f"\nError: Unsupported task_type {task_type}\n")
+
+
+@lru_cache(maxsize=256)
+def _load_landmarks(landmark_file):
+    if landmark_file.endswith(".gz"):
+        with gzip.open(landmark_file, "rt") as f:
+            return json.load(f)
+    with open(landmark_file, "r") as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=1024)
+def _voxel_sizes(image_file):
+    """Voxel sizes from the NIfTI header (the data is not read)"""
+    return tuple(float(z) for z in nib.load(image_file).header.get_zooms()[:3])
+
+
+def _landmark_pairs(task, row, landmark_file):
+    """
+    [p1, p2] pairs (slice coordinates) of the lines of a biometric measurement: one pair for a
+    distance, two for an angle. Landmarks are found as in the biometry planner (first slice entry
+    holding every point of the measurement).
+    """
+    profile = row["biometric_profile"]
+    element = task[profile["metric_map_name"]][profile["metric_key"]]
+    if profile["metric_type"] == "distance":
+        point_pairs = [element["element_keys"]]
+    elif profile["metric_type"] == "angle":
+        line_map = task[element["element_map_name"]]
+        point_pairs = [line_map[line_key]["element_keys"] for line_key in element["element_keys"]]
+    else:
+        return []
+    slice_dim = int(row["slice_dim"])
+    for slice_data in _load_landmarks(landmark_file)[SLICE_LANDMARKS_KEYS[slice_dim]]:
+        points = slice_data["landmarks"]
+        if all(key in points for pair in point_pairs for key in pair):
+            return [
+                [
+                    [c for i, c in enumerate(points[key]) if i != slice_dim]
+                    for key in pair
+                ]
+                for pair in point_pairs
+            ]
+    return []
+
+
+def _ellipse_axis_pairs(row, landmark_file):
+    """
+    [p1, p2] pairs (slice coordinates) of the major (P1-P2, L-1-2) and minor (P3-P4, L-3-4) axes of
+    every ellipse fitted on the slice (biometry from segmentation masks, e.g. Tumor-Lesion-Size).
+    """
+    slice_dim = int(row["slice_dim"])
+    for slice_data in _load_landmarks(landmark_file)[SLICE_LANDMARKS_KEYS[slice_dim]]:
+        if int(slice_data["slice_idx"]) != int(row["slice_idx"]):
+            continue
+        return [
+            [
+                [c for i, c in enumerate(ellipse[key]) if i != slice_dim]
+                for key in pair
+            ]
+            for ellipse in slice_data["landmarks"]
+            for pair in (("P1", "P2"), ("P3", "P4"))
+        ]
+    return []
+
+
+def _render_row(task, case, row, dataset_dir, planner_class):
+    """Row for SliceRenderer (absolute paths, window, scale bar and the overlays of the task)"""
+    slice_dim = int(row["slice_dim"])
+    image_file = os.path.join(dataset_dir, row["image_file"])
+    voxel_sizes = case.get("image_file_info", {}).get("voxel_size") or _voxel_sizes(image_file)
+    render_row = {
+        "image_file": image_file,
+        "slice_dim": slice_dim,
+        "slice_idx": int(row["slice_idx"]),
+        "intensity_stats": case.get("intensity_stats"),
+        "pixel_sizes": [v for i, v in enumerate(voxel_sizes) if i != slice_dim],
+    }
+    if planner_class is BiometricVQA_BenchmarkPlannerSegmentation:
+        render_row["label"] = row["label"]
+        render_row["mask_file"] = os.path.join(dataset_dir, row["mask_file"])
+        if case.get("mask_store_file") is not None:
+            render_row["mask_store_file"] = os.path.join(dataset_dir, case["mask_store_file"])
+    elif planner_class is BiometricVQA_BenchmarkPlannerDetection:
+        render_row["bounding_boxes"] = row["bounding_boxes"]
+    elif planner_class is BiometricVQA_BenchmarkPlannerBiometry:
+        render_row["landmarks"] = _landmark_pairs(
+            task, row, os.path.join(dataset_dir, row["landmark_file"])
+        )
+    elif planner_class is BiometricVQA_BenchmarkPlannerBiometry_fromSeg:
+        render_row["landmarks"] = _ellipse_axis_pairs(
+            row, os.path.join(dataset_dir, row["landmark_file"])
+        )
+    return render_row
+
+
+def collect_plan_samples(plan, dataset_dir, splits=("train", "test"), slice_dims=(0, 1, 2)):
+    """
+    Flatten a benchmark plan into samples {"key", "json", "render"}, case by case so that the
+    samples of a volume are consecutive (and end up in the same shard).
+    "json" is the flattened plan row with the task/split/case it comes from; "render" is its SliceRenderer row.
+    """
+    dataset_name = plan.get("dataset_info", {}).get("dataset")
+    samples = []
+    for task in plan["tasks"]:
+        planner_class = _planner_class(task)
+        labels_map = task.get("labels_map", {})
+        for split in splits:
+            n = 0
+            for case in task.get(f"{split}_cases", []):
+                for slice_dim in slice_dims:
+                    for row in planner_class.flatten_slice_profiles_2d([case], slice_dim):
+                        meta = {
+                            "dataset": dataset_name,
+                            "task_ID": task.get("task_ID"),
+                            "task_type": task.get("task_type"),
+                            "image_modality": task.get("image_modality"),
+                            "split": split,
+                            "case_ID": case.get("case_ID"),
+                            **row,
+                        }
+                        if row.get("label") is not None and labels_map:
+                            meta["label_name"] = labels_map.get(str(int(row["label"])))
+                        samples.append(
+                            {
+                                "key": f"{task.get('task_ID')}_{split}_{n:07d}",
+                                "json": meta,
+                                "render": _render_row(task, case, row, dataset_dir, planner_class),
+                            }
+                        )
+                        n += 1
+    return samples
+
+
+def _add_member(tar, name, data, mtime):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = mtime
+    tar.addfile(info, io.BytesIO(data))
+
+
+def write_shard(shard_file, samples, cache_gb=4, store_root=None, dataset_dir=None):
+    """
+    Render the samples of one shard and write them as <key>.png / <key>.json tar members.
+    With store_root (a chunked_store export of dataset_dir), volumes are read from the store.
+    Runs in a worker process, so the renderer uses a single encoding thread.
+    Returns the shard entry of the index.
+    """
+    loader = chunked_loader(store_root, dataset_dir) if store_root else None
+    renderer = SliceRenderer(cache_gb=cache_gb, loader=loader, num_workers=1)
+    pngs = renderer.render_batch([sample["render"] for sample in samples], output="png")
+    mtime = int(time.time())
+    tmp_file = f"{shard_file}.tmp{os.getpid()}_{threading.get_ident()}"
+    with tarfile.open(tmp_file, "w") as tar:
+        for sample, png in zip(samples, pngs):
+            _add_member(tar, f"{sample['key']}.png", png, mtime)
+            _add_member(
+                tar,
+                f"{sample['key']}.json",
+                json.dumps(sample["json"], default=convert_to_serializable).encode("utf-8"),
+                mtime,
+            )
+    os.replace(tmp_file, shard_file)
+    return {
+        "file": os.path.basename(shard_file),
+        "num_samples": len(samples),
+        "size_bytes": os.path.getsize(shard_file),
+        "first_key": samples[0]["key"],
+        "last_key": samples[-1]["key"],
+    }
+
+
+def export_shards(plan_file, out_dir=None, dataset_dir=None, samples_per_shard=SAMPLES_PER_SHARD, splits=("train", "test"), slice_dims=(0, 1, 2), cache_gb=4, num_workers=None, store_root=None):
+    """
+    Export the slices of a benchmark plan to tar shards, one shard per worker task, and write the
+    shard index (<out_dir>/index.json). Paths in the plan are relative to dataset_dir (default:
+    the folder of the plan). With store_root (e.g. <dataset_dir>/Volumes.zarr from chunked_store),
+    only the chunks of the rendered slices are read.
+    num_workers: shard writer processes (default: min(MAX_WORKERS, number of CPUs)); cache_gb is the
+    decoded volume cache of all workers together, split evenly between them.
+    Returns the index.
+    """
+    dataset_dir = dataset_dir or os.path.dirname(os.path.abspath(plan_file))
+    plan_name = os.path.basename(plan_file).replace(".json.gz", "").replace(".json", "")
+    out_dir = out_dir or os.path.join(dataset_dir, SHARDS_DIR, plan_name)
+    os.makedirs(out_dir, exist_ok=True)
+
+    print(f"Collecting samples of {plan_file}...")
+    samples = collect_plan_samples(load_benchmark_plan(plan_file), dataset_dir, splits, slice_dims)
+    shard_samples = [
+        samples[i : i + samples_per_shard] for i in range(0, len(samples), samples_per_shard)
+    ]
+    print(f"Writing {len(samples)} samples to {len(shard_samples)} shards in {out_dir}...")
+
+    shards = [None] * len(shard_samples)
+    num_workers = num_workers or min(MAX_WORKERS, os.cpu_count() or 1)
+    num_workers = max(1, min(num_workers, len(shard_samples)))
+    worker_cache_gb = cache_gb / num_workers
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {
+            executor.submit(
+                write_shard,
+                os.path.join(out_dir, SHARD_PATTERN.format(i)),
+                chunk,
+                worker_cache_gb,
+                store_root,
+                dataset_dir,
+            ): i
+            for i, chunk in enumerate(shard_samples)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            shards[i] = future.result()
+            print(f"Wrote {shards[i]['file']} ({shards[i]['num_samples']} samples)")
+
+    index = {
+        "plan_file": os.path.basename(plan_file),
+        "splits": list(splits),
+        "slice_dims": list(slice_dims),
+        "samples_per_shard": samples_per_shard,
+        "num_samples": len(samples),
+        "shards": shards,
+    }
+    with open(os.path.join(out_dir, SHARD_INDEX), "w") as f:
+        json.dump(index, f, indent=4)
+    return index
+
+
+def load_shard_index(shard_dir):
+    with open(os.path.join(shard_dir, SHARD_INDEX), "r") as f:
+        return json.load(f)
+
+
+def iter_shard_samples(shard_dir):
+    """Stream the samples of every shard in order: {"key", "png": bytes, "json": dict}"""
+    for shard in load_shard_index(shard_dir)["shards"]:
+        sample = None
+        with tarfile.open(os.path.join(shard_dir, shard["file"]), "r|") as tar:
+            for member in tar:
+                key, ext = member.name.split(".", 1)
+                data = tar.extractfile(member).read()
+                if sample is not None and sample["key"] != key:
+                    yield sample
+                    sample = None
+                if sample is None:
+                    sample = {"key": key}
+                sample[ext] = json.loads(data) if ext == "json" else data
+        if sample is not None:
+            yield sample
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export the slices of benchmark plans to tar shards"
+    )
+
+    subparsers = parser.add_subparsers(dest="command", help="Command to run")
+
+    # Export command
+    export_parser = subparsers.add_parser(
+        "export", help="Render the slices of a benchmark plan to tar shards"
+    )
+    export_parser.add_argument("plan_file", help="Benchmark plan (.json.gz or .json)")
+    export_parser.add_argument(
+        "--out",
+        default=None,
+        help=f"Output folder (default: <dataset_dir>/{SHARDS_DIR}/<plan name>)",
+    )
+    export_parser.add_argument(
+        "--dataset_dir",
+        default=None,
+        help="Dataset folder the plan paths are relative to (default: folder of the plan)",
+    )
+    export_parser.add_argument(
+        "--samples_per_shard",
+        type=int,
+        default=SAMPLES_PER_SHARD,
+        help=f"Number of samples per shard (default: {SAMPLES_PER_SHARD})",
+    )
+    export_parser.add_argument(
+        "--splits",
+        nargs="+",
+        default=["train", "test"],
+        help="Splits to export (default: train test)",
+    )
+    export_parser.add_argument(
+        "--slice_dims",
+        nargs="+",
+        type=int,
+        default=[0, 1, 2],
+        help="Slice dimensions to export (default: 0 1 2)",
+    )
+    export_parser.add_argument(
+        "--cache_gb",
+        type=float,
+        default=4,
+        help="Decoded volume cache of all workers together in GB, split evenly (default: 4)",
+    )
+    export_parser.add_argument(
+        "--store",
+        default=None,
+        help="Chunked volume store of the dataset to read the volumes from (see chunked_store.py)",
+    )
+    export_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help=f"Number of worker processes (default: min({MAX_WORKERS}, number of CPUs))",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_shards(
+            args.plan_file,
+            args.out,
+            args.dataset_dir,
+            args.samples_per_shard,
+            args.splits,
+            args.slice_dims,
+            args.cache_gb,
+            args.workers,
+            args.store,
+        )
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
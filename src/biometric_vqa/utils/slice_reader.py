@@ -0,0 +1,138 @@
+import os
+import gzip
+import threading
+import numpy as np
+import nibabel as nib
+from concurrent.futures import ProcessPoolExecutor
+
+
+# =========================
+# Usage:
+# Read one slice of a volume without decoding the whole file:
+#   slice_2d = read_slice("Images/case_001.nii.gz", slice_idx=42, slice_dim=2)
+# Build the seek-point index (<file>.nii.gz.gzidx) of a whole dataset once:
+#   build_gzip_indexes(glob.glob("Images/*.nii.gz"), num_workers=8)
+# The first read_slice of a .nii.gz (build_index=True) writes its .gzidx sidecar next to the file, in the
+# dataset folders (about 32 KB per seek point, one seek point per INDEX_SPACING uncompressed bytes);
+# an index older than its .nii.gz is rebuilt. Pass build_index=False to leave the folders untouched.
+# Seek points use the indexed_gzip package (a dependency of biometric_vqa); if it cannot be imported,
+# .nii.gz slices are read by decompressing the file only up to the end of the requested slice.
+# =========================
+
+INDEX_SUFFIX = ".gzidx"
+# Uncompressed bytes between two seek points (each seek decompresses at most this much)
+INDEX_SPACING = 1024 * 1024
+
+
+def _index_path(file_path):
+    return str(file_path) + INDEX_SUFFIX
+
+
+def _index_is_current(file_path, index_path):
+    """The sidecar index exists and is newer than the compressed file"""
+    return os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(file_path)
+
+
+def build_gzip_index(file_path, index_path=None, spacing=INDEX_SPACING):
+    """
+    Build the zran-style seek-point index of a .gz file and save it next to the file.
+    Requires indexed_gzip. Returns the index path.
+    """
+    import indexed_gzip
+
+    index_path = index_path or _index_path(file_path)
+    tmp_path = f"{index_path}.tmp{os.getpid()}_{threading.get_ident()}"
+    with indexed_gzip.IndexedGzipFile(str(file_path), spacing=spacing) as f:
+        f.build_full_index()
+        f.export_index(tmp_path)
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def _build_index_if_needed(file_path, spacing):
+    if not _index_is_current(file_path, _index_path(file_path)):
+        build_gzip_index(file_path, spacing=spacing)
+    return file_path
+
+
+def build_gzip_indexes(file_paths, spacing=INDEX_SPACING, num_workers=None):
+    """Build the seek-point indexes of several .gz files in parallel (up-to-date indexes are skipped)"""
+    file_paths = [str(f) for f in file_paths if str(f).endswith(".gz")]
+    if not file_paths:
+        return
+    num_workers = num_workers or min(len(file_paths), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for file_path in executor.map(
+            _build_index_if_needed, file_paths, [spacing] * len(file_paths)
+        ):
+            print(f"Indexed {file_path}")
+
+
+def _open_payload(file_path, build_index=True):
+    """Seekable file object over the uncompressed bytes of a .nii or .nii.gz file"""
+    file_path = str(file_path)
+    if not file_path.endswith(".gz"):
+        return open(file_path, "rb")
+    try:
+        import indexed_gzip
+    except ImportError:
+        # Forward seeks decompress up to the target, reading stops right after the slice
+        return gzip.open(file_path, "rb")
+    index_path = _index_path(file_path)
+    if not _index_is_current(file_path, index_path):
+        if not build_index:
+            return gzip.open(file_path, "rb")
+        build_gzip_index(file_path, index_path)
+    f = indexed_gzip.IndexedGzipFile(file_path)
+    f.import_index(index_path)
+    return f
+
+
+def _read_array(f, count, dtype):
+    """Read count values of dtype from the current position of f"""
+    buffer = f.read(count * dtype.itemsize)
+    if len(buffer) != count * dtype.itemsize:
+        raise EOFError(f"Unexpected end of data while reading {count} values")
+    return np.frombuffer(buffer, dtype=dtype)
+
+
+def read_slice(file_path, slice_idx, slice_dim=2, build_index=True):
+    """
+    Read a single 2D slice of a 3D NIfTI volume, decompressing as little of the file as possible.
+    Axial slices (slice_dim=2) are one contiguous byte range; coronal slices (slice_dim=1) are one
+    row per axial slice; sagittal slices (slice_dim=0) need every axial slice, read one at a time.
+    With indexed_gzip the seek-point index is built on first use (build_index=True) and reused.
+    Returns the slice in the stored dtype (float64 if the volume has scaling), like
+    get_fdata()[..., slice_idx] along slice_dim.
+    """
+    img = nib.load(str(file_path))
+    shape = img.shape + (1,) * (3 - len(img.shape))
+    if len(shape) > 3 and int(np.prod(shape[3:])) != 1:
+        raise ValueError(f"Expected a 3D volume, got shape {img.shape} for {file_path}")
+    nx, ny, nz = shape[:3]
+    if not 0 <= slice_idx < shape[slice_dim]:
+        raise IndexError(
+            f"Slice {slice_idx} out of range for dimension {slice_dim} of shape {img.shape}"
+        )
+    dtype = img.get_data_dtype()
+    offset = img.dataobj.offset
+
+    with _open_payload(file_path, build_index) as f:
+        if slice_dim == 2:
+            f.seek(offset + slice_idx * nx * ny * dtype.itemsize)
+            data = _read_array(f, nx * ny, dtype).reshape((nx, ny), order="F").copy()
+        elif slice_dim == 1:
+            data = np.empty((nx, nz), dtype=dtype)
+            for z in range(nz):
+                f.seek(offset + (z * ny + slice_idx) * nx * dtype.itemsize)
+                data[:, z] = _read_array(f, nx, dtype)
+        else:
+            data = np.empty((ny, nz), dtype=dtype)
+            f.seek(offset)
+            for z in range(nz):
+                data[:, z] = _read_array(f, nx * ny, dtype).reshape((nx, ny), order="F")[slice_idx, :]
+
+    slope, inter = img.dataobj.slope, img.dataobj.inter
+    if slope != 1.0 or inter != 0.0:
+        data = data * np.float64(slope) + np.float64(inter)
+    return data
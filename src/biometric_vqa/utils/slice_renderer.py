@@ -0,0 +1,241 @@
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from biometric_vqa.utils.doc_to_visual_utils import (
+    add_bbox_overlay,
+    add_bbox_overlay_batch,
+    add_landmarks_and_line_overlay,
+    add_landmarks_and_line_overlay_batch,
+    add_mask_overlay_contour,
+    add_mask_overlay_contour_batch,
+    add_mask_overlay_solid,
+    add_mask_overlay_solid_batch,
+    add_scale_label,
+    add_scale_label_batch,
+    slices_to_rgb_batch,
+)
+from biometric_vqa.utils.intensity_utils import get_window, window_to_uint8
+from biometric_vqa.utils.mask_store import get_slice_mask
+from biometric_vqa.utils.volume_cache import _decode_volume
+
+
+# =========================
+# Usage:
+# Render the flattened rows of a benchmark plan (each volume is decoded once, whatever the row order):
+#   renderer = SliceRenderer(cache_gb=4)
+#   pngs = renderer.render_batch(rows)                     # PNG bytes, in the order of rows
+#   arrays = renderer.render_batch(rows, output="array")   # RGB uint8 arrays
+# A row is a dict with "image_file", "slice_dim" and "slice_idx", and optionally:
+#   "mask_file" or "mask_store_file" + "label" (+ "overlay": "contour" or "solid"),
+#   "bounding_boxes" (from the detection plan),
+#   "landmarks" (list of [p1, p2] pairs in slice coordinates), "pixel_sizes" (adds a scale bar),
+#   "window" ([low, high]) or "intensity_stats" (of the case in the plan, + "window_name": e.g. "bone");
+#   without a window, each slice is min-max normalized
+# =========================
+
+
+def _take_slice(volume, slice_dim, slice_idx):
+    index = [slice(None)] * 3
+    index[int(slice_dim)] = int(slice_idx)
+    return np.asarray(volume[tuple(index)])
+
+
+def _to_uint8(slice_2d):
+    """Min-max normalize a slice to 0-255"""
+    slice_2d = slice_2d.astype(np.float32)
+    vmin, vmax = float(slice_2d.min()), float(slice_2d.max())
+    if vmax <= vmin:
+        return np.zeros(slice_2d.shape, dtype=np.uint8)
+    return ((slice_2d - vmin) * (255.0 / (vmax - vmin))).astype(np.uint8)
+
+
+def _row_window(row):
+    """Intensity window of a row, or None for min-max normalization"""
+    if row.get("window") is not None:
+        return row["window"]
+    if row.get("intensity_stats") is not None:
+        return get_window(row["intensity_stats"], row.get("window_name", "default"))
+    return None
+
+
+def _has_mask(row):
+    return row.get("label") is not None and (
+        row.get("mask_store_file") is not None or row.get("mask_file") is not None
+    )
+
+
+def _slice_to_uint8(slice_2d, window):
+    return _to_uint8(slice_2d) if window is None else window_to_uint8(slice_2d, window)
+
+
+class SliceRenderer:
+    """
+    Render 2D slices with overlays for BiometricVQA samples.
+    Decoded volumes are kept in an LRU cache bounded by cache_gb; rows are grouped by volume so
+    each volume is loaded once per batch, and the volumes of the next group are loaded in the
+    background while the current group is rendered.
+    loader(file_path) returns a volume; any array-like with 3D indexing works (e.g.
+    volume_cache.load_volume, or chunked_store.chunked_loader(store_root, dataset_dir) to read
+    only the chunks of the rendered slices).
+    """
+
+    def __init__(self, cache_gb=4, loader=None, num_workers=None):
+        self.cache_bytes = int(cache_gb * 1024**3)
+        self.loader = loader or _decode_volume
+        self.num_workers = num_workers
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_volume(self, file_path):
+        """Get a decoded volume from the cache, loading (and evicting older volumes) if needed"""
+        file_path = str(file_path)
+        with self._lock:
+            if file_path in self._cache:
+                self._cache.move_to_end(file_path)
+                return self._cache[file_path]
+        volume = self.loader(file_path)
+        size = int(getattr(volume, "nbytes", 0))
+        with self._lock:
+            if file_path not in self._cache:
+                self._cache[file_path] = volume
+                self._cached_bytes += size
+            # Keep at least the volume just loaded, even if it is larger than the budget
+            while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= int(getattr(evicted, "nbytes", 0))
+            return self._cache.get(file_path, volume)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._cached_bytes = 0
+
+    def _row_mask(self, row, shape):
+        """2D binary mask of the row's label, from the mask store if available, else from the mask volume"""
+        if row.get("mask_store_file") is not None:
+            return get_slice_mask(
+                row["mask_store_file"], row["slice_dim"], row["slice_idx"], row["label"], shape
+            )
+        mask_2d = _take_slice(self.get_volume(row["mask_file"]), row["slice_dim"], row["slice_idx"])
+        return mask_2d == row["label"]
+
+    def render(self, row):
+        """Render one row as an RGB PIL image"""
+        slice_dim, slice_idx = row["slice_dim"], row["slice_idx"]
+        image_2d = _take_slice(self.get_volume(row["image_file"]), slice_dim, slice_idx)
+        pil_img = Image.fromarray(_slice_to_uint8(image_2d, _row_window(row))).convert("RGB")
+
+        if _has_mask(row):
+            mask_2d_binary = self._row_mask(row, image_2d.shape)
+            if row.get("overlay", "contour") == "solid":
+                pil_img = add_mask_overlay_solid(pil_img, mask_2d_binary)
+            else:
+                pil_img = add_mask_overlay_contour(pil_img, mask_2d_binary)
+        for bbox in row.get("bounding_boxes") or []:
+            pil_img = add_bbox_overlay(pil_img, bbox["min_coords"], bbox["max_coords"])
+        for p1_coords, p2_coords in row.get("landmarks") or []:
+            pil_img = add_landmarks_and_line_overlay(pil_img, p1_coords, p2_coords)
+        if row.get("pixel_sizes") is not None:
+            pil_img = add_scale_label(pil_img, row["pixel_sizes"], slice_dim)
+        return pil_img
+
+    def render_stack(self, rows):
+        """
+        Render rows that share image_file, mask_file and slice_dim as one RGB uint8 stack (N, H, W, 3),
+        compositing every overlay with batched array operations.
+        """
+        slice_dim = rows[0]["slice_dim"]
+        image_volume = self.get_volume(rows[0]["image_file"])
+        slices = [_take_slice(image_volume, slice_dim, row["slice_idx"]) for row in rows]
+        windows = [_row_window(row) for row in rows]
+        if all(window is None for window in windows):
+            images = slices_to_rgb_batch(slices)
+        else:
+            gray = np.stack([_slice_to_uint8(s, w) for s, w in zip(slices, windows)])
+            images = np.repeat(gray[..., None], 3, axis=-1)
+
+        mask_rows = [k for k, row in enumerate(rows) if _has_mask(row)]
+        if mask_rows:
+            for solid, overlay_batch in (
+                (True, add_mask_overlay_solid_batch),
+                (False, add_mask_overlay_contour_batch),
+            ):
+                ks = [k for k in mask_rows if (rows[k].get("overlay", "contour") == "solid") == solid]
+                if ks:
+                    masks = np.stack([self._row_mask(rows[k], slices[k].shape) for k in ks])
+                    images[ks] = overlay_batch(images[ks], masks)
+        add_bbox_overlay_batch(
+            images,
+            [
+                [(bbox["min_coords"], bbox["max_coords"]) for bbox in row.get("bounding_boxes") or []]
+                for row in rows
+            ],
+        )
+        add_landmarks_and_line_overlay_batch(images, [row.get("landmarks") or [] for row in rows])
+        ks = [k for k, row in enumerate(rows) if row.get("pixel_sizes") is not None]
+        if ks:
+            images[ks] = add_scale_label_batch(
+                images[ks], [rows[k]["pixel_sizes"] for k in ks], slice_dim
+            )
+        return images
+
+    @staticmethod
+    def _encode(image, output):
+        if output == "array":
+            return image
+        pil_img = Image.fromarray(image)
+        if output == "pil":
+            return pil_img
+        buffer = io.BytesIO()
+        pil_img.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def _load_group(self, file_paths):
+        for file_path in file_paths:
+            self.get_volume(file_path)
+
+    def render_batch(self, rows, output="png"):
+        """
+        Render many rows, grouped by (image_file, mask_file) so that each volume is decoded once
+        (rows with a mask_store_file never decode the mask volume).
+        output: "png" (PNG bytes), "array" (RGB uint8 array) or "pil" (PIL image).
+        Returns the results in the order of rows.
+        """
+        if output not in ("png", "array", "pil"):
+            raise ValueError(f"output should be one of 'png', 'array' or 'pil', got {output}")
+        groups = OrderedDict()
+        for i, row in enumerate(rows):
+            mask_file = row.get("mask_file") if row.get("mask_store_file") is None else None
+            key = (str(row["image_file"]), mask_file)
+            groups.setdefault(key, []).append(i)
+        group_files = [
+            [image_file] + ([str(mask_file)] if mask_file is not None else [])
+            for image_file, mask_file in groups
+        ]
+
+        results = [None] * len(rows)
+        with ThreadPoolExecutor(max_workers=1) as prefetcher, ThreadPoolExecutor(
+            max_workers=self.num_workers
+        ) as executor:
+            pending = prefetcher.submit(self._load_group, group_files[0]) if group_files else None
+            for g, indices in enumerate(groups.values()):
+                pending.result()
+                # Load the next volume(s) while this group is rendered
+                if g + 1 < len(group_files):
+                    pending = prefetcher.submit(self._load_group, group_files[g + 1])
+                # Overlays are composited per slice orientation in one batch, PNG encoding runs in threads
+                by_dim = OrderedDict()
+                for i in indices:
+                    by_dim.setdefault(int(rows[i]["slice_dim"]), []).append(i)
+                for dim_indices in by_dim.values():
+                    images = self.render_stack([rows[i] for i in dim_indices])
+                    for i, result in zip(
+                        dim_indices,
+                        executor.map(lambda image: self._encode(image, output), images),
+                    ):
+                        results[i] = result
+        return results
@@ -2,7 +2,7 @@ import json
 import os
 import glob
 import matplotlib.pyplot as plt
-import nibabel as nib
+from biometric_vqa.utils.volume_cache import load_volume
 
 
 def plot_slice_with_landmarks(nii_path: str, json_path: str, fig_path: str = None):
@@ -14,8 +14,7 @@ def plot_slice_with_landmarks(nii_path: str, json_path: str, fig_path: str = Non
         fig_path (str, optional): Path to save the plot. If None, displays plot
     """
     # Load NIfTI image and extract first slice
-    nii_img = nib.load(nii_path)
-    slice_data = nii_img.get_fdata()[0, :, :]
+    slice_data = load_volume(nii_path)[0, :, :]
 
     # Load landmark coordinates from JSON
     with open(json_path, "r") as f:
@@ -0,0 +1,129 @@
+import os
+import hashlib
+import threading
+import numpy as np
+import nibabel as nib
+from concurrent.futures import ProcessPoolExecutor
+
+
+# =========================
+# Usage:
+# The cache is opt-in: without a cache folder, load_volume simply decodes the NIfTI file.
+# Load a decoded volume (the .nii.gz is only decompressed the first time it is requested):
+#   data = load_volume("Masks/case_001.nii.gz", cache_dir="/scratch/volume_cache")
+#   slice_2d = data[:, :, 42]    # read-only np.memmap in the stored dtype, only this slice is read
+# Warm the cache for a whole folder before several stages read it:
+#   cache_volumes(glob.glob("Masks/*.nii.gz"), cache_dir="/scratch/volume_cache", num_workers=8)
+# The planners take the folder as volume_cache_dir=...; it can also be set for every caller with:
+#   BIOMETRIC_VQA_VOLUME_CACHE_DIR (default: unset, no cache)
+#   BIOMETRIC_VQA_VOLUME_CACHE_GB (default: 50, 0 disables the cache)
+# Cost: each cached volume is a full uncompressed copy (typically 5-20x the .nii.gz size, e.g. ~100 MB
+# for a 512x512x200 int16 CT), written on first use; the folder is kept under the size limit by
+# evicting the least recently used volumes. Use a fast local disk with enough free space.
+# =========================
+
+VOLUME_CACHE_DIR = os.environ.get("BIOMETRIC_VQA_VOLUME_CACHE_DIR") or None
+VOLUME_CACHE_GB = float(os.environ.get("BIOMETRIC_VQA_VOLUME_CACHE_GB", 50))
+
+
+def _cache_path(file_path, cache_dir):
+    """Cache file of a volume, keyed by its absolute path, size and modification time"""
+    stat = os.stat(file_path)
+    key = f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".npy")
+
+
+def _decode_volume(file_path):
+    """Decode a NIfTI volume in its stored dtype (float only if the data is scaled)"""
+    return np.asanyarray(nib.load(str(file_path)).dataobj)
+
+
+def evict_volume_cache(cache_dir=None, max_size_gb=None):
+    """
+    Remove the least recently used cached volumes until the cache fits in max_size_gb.
+    Returns the number of bytes freed.
+    """
+    cache_dir = cache_dir or VOLUME_CACHE_DIR
+    if cache_dir is None or not os.path.isdir(cache_dir):
+        return 0
+    max_size = int((VOLUME_CACHE_GB if max_size_gb is None else max_size_gb) * 1024**3)
+    entries = []
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    # Cache hits refresh the mtime, so the oldest mtime is the least recently used entry
+    for _, size, path in sorted(entries):
+        if total - freed <= max_size:
+            break
+        try:
+            os.remove(path)
+            freed += size
+        except FileNotFoundError:
+            pass
+    return freed
+
+
+def load_volume(file_path, cache_dir=None, max_size_gb=None):
+    """
+    Load the data of a NIfTI volume, through the on-disk cache of decoded volumes if a cache folder
+    is given (cache_dir, else BIOMETRIC_VQA_VOLUME_CACHE_DIR); without one, the file is just decoded.
+    The first cached call decodes the file and stores it as a native-dtype .npy; later calls (from any stage
+    or process) memory-map that .npy instead of decompressing again. A changed source file (size or
+    mtime) gets a new cache entry; old entries are evicted least recently used first.
+    Returns the array (a read-only np.memmap when cached).
+    """
+    cache_dir = cache_dir or VOLUME_CACHE_DIR
+    max_size_gb = VOLUME_CACHE_GB if max_size_gb is None else max_size_gb
+    if cache_dir is None or max_size_gb <= 0:
+        return _decode_volume(file_path)
+
+    cache_path = _cache_path(file_path, cache_dir)
+    try:
+        data = np.load(cache_path, mmap_mode="r")
+        os.utime(cache_path)
+        return data
+    except (FileNotFoundError, ValueError):
+        pass
+
+    data = _decode_volume(file_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.tmp{os.getpid()}_{threading.get_ident()}.npy"
+    np.save(tmp_path, data)
+    os.replace(tmp_path, cache_path)
+    evict_volume_cache(cache_dir, max_size_gb)
+    try:
+        return np.load(cache_path, mmap_mode="r")
+    except FileNotFoundError:
+        # Evicted straight away (volume larger than the cache)
+        return data
+
+
+def _cache_volume(file_path, cache_dir, max_size_gb):
+    load_volume(file_path, cache_dir, max_size_gb)
+    return file_path
+
+
+def cache_volumes(file_paths, cache_dir=None, max_size_gb=None, num_workers=None):
+    """Decode and cache several volumes in parallel (volumes already cached are skipped)"""
+    file_paths = [str(f) for f in file_paths]
+    if not file_paths:
+        return
+    if (cache_dir or VOLUME_CACHE_DIR) is None:
+        raise ValueError("No cache folder: pass cache_dir or set BIOMETRIC_VQA_VOLUME_CACHE_DIR")
+    num_workers = num_workers or min(len(file_paths), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for file_path in executor.map(
+            _cache_volume,
+            file_paths,
+            [cache_dir] * len(file_paths),
+            [max_size_gb] * len(file_paths),
+        ):
+            print(f"Cached {file_path}")